@@ -0,0 +1,148 @@
+"""
+NoLove Game - Статические файлы из памяти
+
+При старте разрешенные файлы читаются в память и сжимаются заранее
+(gzip и, если установлен пакет brotli, br). На запрос отдается готовое
+тело под Accept-Encoding, ETag по хешу содержимого и 304 на If-None-Match.
+Отдаются только файлы из FILES, путь - только ключ этого списка.
+
+Страницы самодостаточны (стили и скрипты внутри, клиент Socket.IO - с CDN),
+поэтому версионированных адресов нет: браузер кэширует файлы с проверкой
+ETag (no-cache), и повторная загрузка стоит один ответ 304.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Файлы, которые можно отдавать (пути от корня проекта)
+FILES = ('nolove.html', 'index.html', 'public/index.html')
+# Что имеет смысл сжимать
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                      'application/manifest+json')
+MIN_COMPRESS_SIZE = 256
+
+REVALIDATE = 'no-cache'
+
+
+class Asset:
+    __slots__ = ('path', 'content_type', 'version', 'bodies')
+
+    def __init__(self, path, data):
+        self.path = path
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type == 'application/javascript':
+            content_type += '; charset=utf-8'
+        self.content_type = content_type
+        self.version = hashlib.sha256(data).hexdigest()[:16]
+        # кодировка -> тело; None - без сжатия
+        self.bodies = {None: data}
+        if len(data) >= MIN_COMPRESS_SIZE and content_type.startswith(COMPRESSIBLE_TYPES):
+            self._add('gzip', gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                self._add('br', brotli.compress(data, quality=11))
+
+    def _add(self, encoding, body):
+        # Сжатое тело храним, только если оно меньше исходного
+        if len(body) < len(self.bodies[None]):
+            self.bodies[encoding] = body
+
+    def etag(self, encoding):
+        return f'"{self.version}-{encoding}"' if encoding else f'"{self.version}"'
+
+
+def parse_accept_encoding(header):
+    """Кодировки из Accept-Encoding, кроме явно запрещенных (q=0)"""
+    accepted = set()
+    for part in (header or '').split(','):
+        name, *params = [item.strip() for item in part.split(';')]
+        quality = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            accepted.add(name.lower())
+    return accepted
+
+
+class AssetStore:
+    def __init__(self, root='.', files=FILES):
+        self.root = root
+        self.assets = {}
+        for path in files:
+            self._load(path)
+
+    def _load(self, path):
+        try:
+            with open(os.path.join(self.root, path), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        self.assets[path] = Asset(path, data)
+
+    def __contains__(self, path):
+        return path in self.assets
+
+    def serve(self, path, accept_encoding=None, if_none_match=None):
+        """Ответ на запрос файла: (статус, заголовки, тело)"""
+        asset = self.assets.get(path)
+        if asset is None:
+            return 404, [('Content-Type', 'text/plain; charset=utf-8')], b'Not Found'
+
+        accepted = parse_accept_encoding(accept_encoding)
+        encoding = None
+        for candidate in ('br', 'gzip'):
+            if candidate in asset.bodies and candidate in accepted:
+                encoding = candidate
+                break
+
+        headers = [
+            ('ETag', asset.etag(encoding)),
+            ('Cache-Control', REVALIDATE),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        if if_none_match and self._matches(if_none_match, asset):
+            return 304, headers, b''
+
+        headers.append(('Content-Type', asset.content_type))
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        return 200, headers, asset.bodies[encoding]
+
+    @staticmethod
+    def _matches(if_none_match, asset):
+        if if_none_match.strip() == '*':
+            return True
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            # Любое представление той же версии: тело то же
+            if tag.strip('"').split('-')[0] == asset.version:
+                return True
+        return False
+
+    def flask_response(self, path):
+        """serve() для текущего запроса Flask"""
+        from flask import Response, request
+
+        status, headers, body = self.serve(
+            path,
+            accept_encoding=request.headers.get('Accept-Encoding'),
+            if_none_match=request.headers.get('If-None-Match')
+        )
+        return Response(body, status=status, headers=headers)
+
+    def stats(self):
+        return {
+            path: {encoding or 'identity': len(body) for encoding, body in asset.bodies.items()}
+            for path, asset in self.assets.items()
+        }
@@ -0,0 +1,133 @@
+"""
+NoLove Game - Автоставки
+
+Программа автоставок задается один раз (start_auto_bet), дальше ставки
+по ней делает сам движок: всем программам стола разом, как только
+открывается прием ставок после краха. Клиенту не нужно каждый раунд
+слать place_bet и set_auto_cashout, и ставка попадает в раунд, даже
+если клиент отвечает медленно.
+
+Стратегии:
+  fixed      - каждый раунд одна и та же ставка;
+  martingale - после проигрыша ставка умножается на factor, после
+               выигрыша возвращается к начальной.
+Программа останавливается после rounds раундов, при прибыли takeProfit,
+при убытке stopLoss или когда очередная ставка не проходит (не хватает
+баланса, выше предела стола).
+"""
+import math
+
+FIXED = 'fixed'
+MARTINGALE = 'martingale'
+STRATEGIES = (FIXED, MARTINGALE)
+
+DEFAULT_FACTOR = 2.0
+# Больший множитель мартингейла переполняет ставку раньше, чем кончится баланс
+MAX_FACTOR = 10.0
+MIN_CASHOUT = 1.01
+
+# Причины остановки (поле reason в auto_bet_stopped)
+STOP_USER = 'user'
+STOP_ROUNDS = 'rounds'
+STOP_PROFIT = 'take_profit'
+STOP_LOSS = 'stop_loss'
+STOP_BALANCE = 'balance'
+STOP_LIMIT = 'limit'
+STOP_LEAVE = 'leave'
+
+
+class AutoBet:
+    """Программа автоставок игрока и ее итоги"""
+    __slots__ = (
+        'strategy', 'base_bet', 'factor', 'cashout', 'max_rounds',
+        'take_profit', 'stop_loss', 'next_bet', 'rounds', 'profit', 'placed'
+    )
+
+    def __init__(self, bet, strategy=FIXED, factor=DEFAULT_FACTOR, cashout=None,
+                 rounds=0, take_profit=0, stop_loss=0):
+        self.strategy = strategy
+        self.base_bet = bet
+        self.factor = factor
+        # Порог авто-вывода для ставок программы (None - выводит сам игрок)
+        self.cashout = cashout
+        # Ограничения: 0 - без ограничения
+        self.max_rounds = rounds
+        self.take_profit = take_profit
+        self.stop_loss = stop_loss
+
+        self.next_bet = bet
+        self.rounds = 0
+        self.profit = 0
+        # Ставка текущего раунда сделана программой
+        self.placed = False
+
+    def settle(self, profit):
+        """Итог раунда со ставкой программы; возвращает причину остановки или None"""
+        self.placed = False
+        self.rounds += 1
+        self.profit += profit
+        if self.strategy == MARTINGALE:
+            self.next_bet = self.base_bet if profit > 0 else math.ceil(self.next_bet * self.factor)
+
+        if self.max_rounds and self.rounds >= self.max_rounds:
+            return STOP_ROUNDS
+        if self.take_profit and self.profit >= self.take_profit:
+            return STOP_PROFIT
+        if self.stop_loss and -self.profit >= self.stop_loss:
+            return STOP_LOSS
+        return None
+
+    def info(self):
+        """Состояние программы для клиента"""
+        return {
+            'strategy': self.strategy,
+            'bet': self.base_bet,
+            'nextBet': self.next_bet,
+            'cashout': self.cashout,
+            'rounds': self.rounds,
+            'maxRounds': self.max_rounds,
+            'profit': self.profit
+        }
+
+
+def _number(data, key, cast, default, minimum, maximum=None):
+    value = data.get(key)
+    if value is None or value == '':
+        return default
+    try:
+        # JSON от клиента может нести Infinity и NaN: int() на них падает
+        # с OverflowError, а float() их пропускает
+        value = cast(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f'Некорректное значение {key}')
+    if not math.isfinite(value):
+        raise ValueError(f'Некорректное значение {key}')
+    if value < minimum:
+        raise ValueError(f'Значение {key} должно быть не меньше {minimum}')
+    if maximum is not None and value > maximum:
+        raise ValueError(f'Значение {key} должно быть не больше {maximum}')
+    return value
+
+
+def parse(data):
+    """AutoBet из запроса клиента; ValueError - с текстом для клиента"""
+    if not isinstance(data, dict):
+        raise ValueError('Некорректные настройки автоставки')
+
+    strategy = data.get('strategy') or FIXED
+    if strategy not in STRATEGIES:
+        raise ValueError('Неизвестная стратегия автоставки')
+
+    bet = _number(data, 'bet', int, None, 1)
+    if bet is None:
+        raise ValueError('Не задана ставка')
+
+    return AutoBet(
+        bet=bet,
+        strategy=strategy,
+        factor=_number(data, 'factor', float, DEFAULT_FACTOR, 1.0, MAX_FACTOR),
+        cashout=_number(data, 'cashout', float, None, MIN_CASHOUT),
+        rounds=_number(data, 'rounds', int, 0, 0),
+        take_profit=_number(data, 'takeProfit', int, 0, 0),
+        stop_loss=_number(data, 'stopLoss', int, 0, 0)
+    )
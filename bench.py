@@ -0,0 +1,383 @@
+"""
+NoLove Game - Нагрузочный тест игрового цикла
+
+Запускает сервер отдельным процессом и подключает к нему N безголовых
+клиентов Socket.IO (asyncio, один процесс). Клиенты регистрируются,
+ставят, часть ставит авто-вывод, остальные выводят вручную, иногда
+пишут в чат. Результат - JSON с метриками:
+
+  connect              - скорость подключения (соединений в секунду)
+  multiplier_update_ms - задержка доставки multiplier_update (p50/p99)
+  tick_jitter_ms       - отклонение интервала между тиками от номинала
+  bet_ack_ms           - ответ на place_bet
+  cash_out_ack_ms      - от cash_out до cash_out_confirmed
+  memory               - рост RSS сервера на одно соединение
+
+Задержка считается по serverTime в multiplier_update (NOLOVE_SERVER_TIME=1),
+поэтому сервер и клиенты должны работать на одной машине.
+
+Зависимости: pip install -r requirements-dev.txt
+Для тысяч клиентов поднимите лимит файлов: ulimit -n 65536
+
+    python bench.py --clients 2000 --duration 60
+    python bench.py --server threading --compare bench_results/<commit>.json
+    python bench.py --server eventlet,asyncio      # режимы рядом в одной таблице
+    python bench.py --wire compact                 # клиенты с компактной кодировкой (wire.py)
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import socketio
+
+# Как запустить сервер в каждом режиме; {port} подставляется
+SERVER_MODES = {
+    'eventlet': (
+        "import eventlet; eventlet.monkey_patch(); "
+        "from nolove_server_8000 import app, socketio; "
+        "socketio.run(app, host='127.0.0.1', port={port})"
+    ),
+    # Flask-SocketIO в режиме потоков запускает тот же app.run(threaded=True),
+    # но новые версии отказываются без allow_unsafe_werkzeug, а старые его не знают
+    'threading': (
+        "from server import app, socketio; "
+        "app.run(host='127.0.0.1', port={port}, threaded=True)"
+    ),
+    'asyncio': (
+        "import uvicorn; from server_asgi import app; "
+        "uvicorn.run(app, host='127.0.0.1', port={port}, log_level='warning')"
+    ),
+}
+
+# Строки сравнения: раздел отчета и ключ
+KEY_METRICS = [
+    ('connect', 'per_second'),
+    ('multiplier_update_ms', 'p50'), ('multiplier_update_ms', 'p99'),
+    ('tick_jitter_ms', 'p99'),
+    ('bet_ack_ms', 'p50'), ('bet_ack_ms', 'p99'),
+    ('cash_out_ack_ms', 'p50'), ('cash_out_ack_ms', 'p99'),
+    ('memory', 'per_connection_kb'),
+]
+
+BET = 10
+AUTO_CASHOUT_SHARE = 0.5
+CHAT_CHANCE = 0.05
+RESULTS_DIR = 'bench_results'
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    samples = sorted(samples)
+
+    def at(q):
+        return round(samples[min(len(samples) - 1, int(q * len(samples)))], 3)
+
+    return {'count': len(samples), 'p50': at(0.50), 'p99': at(0.99), 'max': round(samples[-1], 3)}
+
+
+def rss_kb(pid):
+    """VmRSS процесса из /proc (только Linux)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+class Results:
+    def __init__(self):
+        self.update_latency = []
+        self.bet_ack = []
+        self.cash_out_ack = []
+        self.server_ticks = []
+        self.errors = 0
+        self.cash_outs = 0
+        self.chat_messages = 0
+
+
+class BenchClient:
+    """Один безголовый игрок"""
+
+    def __init__(self, index, url, results, record_ticks=False, compact=False):
+        self.index = index
+        self.url = url
+        self.results = results
+        self.record_ticks = record_ticks
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.auto = random.random() < AUTO_CASHOUT_SHARE
+        self.target = 0.0
+        self.cash_out_sent = None
+
+        if compact:
+            self.url += '?wire=compact'
+            self.sio.on('m', self.on_compact_multiplier)
+        else:
+            self.sio.on('multiplier_update', self.on_multiplier_update)
+        self.sio.on('cash_out_confirmed', self.on_cash_out_confirmed)
+        self.sio.on('game_crash', self.on_game_crash)
+
+    async def connect(self):
+        await self.sio.connect(self.url, transports=['websocket'])
+        result = await self.sio.call('register_player', {'username': f'bench{self.index}'})
+        if result and 'error' in result:
+            self.results.errors += 1
+        await self.place_bet()
+
+    async def place_bet(self):
+        self.cash_out_sent = None
+        self.target = random.uniform(1.1, 3.0)
+        sent = time.perf_counter()
+        try:
+            result = await self.sio.call('place_bet', {'bet': BET}, timeout=10)
+        except socketio.exceptions.TimeoutError:
+            self.results.errors += 1
+            return
+        self.results.bet_ack.append((time.perf_counter() - sent) * 1000)
+        if result and 'error' in result:
+            return
+        if self.auto:
+            await self.sio.emit('set_auto_cashout', {'multiplier': round(self.target, 2)})
+
+    async def on_multiplier_update(self, data):
+        await self.on_multiplier(data['multiplier'], data.get('serverTime'))
+
+    async def on_compact_multiplier(self, data):
+        if isinstance(data, list):
+            await self.on_multiplier(data[0] / 100, data[1])
+        else:
+            await self.on_multiplier(data / 100, None)
+
+    async def on_multiplier(self, multiplier, server_time):
+        received = time.time() * 1000
+        if server_time is not None:
+            self.results.update_latency.append(received - server_time)
+            if self.record_ticks:
+                self.results.server_ticks.append(server_time)
+        if not self.auto and self.cash_out_sent is None and multiplier >= self.target:
+            self.cash_out_sent = time.perf_counter()
+            await self.sio.emit('cash_out')
+
+    async def on_cash_out_confirmed(self, data):
+        self.results.cash_outs += 1
+        if self.cash_out_sent is not None:
+            self.results.cash_out_ack.append((time.perf_counter() - self.cash_out_sent) * 1000)
+
+    async def on_game_crash(self, data):
+        if random.random() < CHAT_CHANCE:
+            self.results.chat_messages += 1
+            await self.sio.emit('chat_message', {'message': f'gg {data.get("crashPoint")}'})
+        # Ставки принимаются в паузе после краха; разносим их во времени
+        await asyncio.sleep(random.uniform(0.1, 1.0))
+        if self.sio.connected:
+            await self.place_bet()
+
+    async def close(self):
+        if self.sio.connected:
+            await self.sio.disconnect()
+
+
+def tick_jitter(server_ticks, tick_rate):
+    """Отклонение интервалов между тиками от 1/tick_rate, мс"""
+    nominal = 1000.0 / tick_rate
+    ticks = sorted(set(server_ticks))
+    deviations = []
+    for previous, current in zip(ticks, ticks[1:]):
+        interval = current - previous
+        # Пауза между раундами - не тик
+        if interval < nominal * 5:
+            deviations.append(abs(interval - nominal))
+    return percentiles(deviations)
+
+
+async def run_clients(args, results, pid):
+    url = args.url or f'http://127.0.0.1:{args.port}'
+    clients = [BenchClient(i, url, results, record_ticks=(i == 0), compact=args.wire == 'compact')
+               for i in range(args.clients)]
+    rss_before = rss_kb(pid) if pid else None
+
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+
+    async def connect(client):
+        async with semaphore:
+            try:
+                await client.connect()
+                return True
+            except Exception:
+                results.errors += 1
+                return False
+
+    started = time.perf_counter()
+    connected = sum(await asyncio.gather(*(connect(c) for c in clients)))
+    connect_seconds = time.perf_counter() - started
+    print(f'Подключено {connected}/{args.clients} за {connect_seconds:.2f} с')
+
+    await asyncio.sleep(args.duration)
+    rss_after = rss_kb(pid) if pid else None
+
+    await asyncio.gather(*(c.close() for c in clients), return_exceptions=True)
+
+    memory = None
+    if rss_before is not None and rss_after is not None:
+        memory = {
+            'rss_before_kb': rss_before,
+            'rss_after_kb': rss_after,
+            'per_connection_kb': round((rss_after - rss_before) / max(connected, 1), 2)
+        }
+    return {
+        'connect': {
+            'clients': args.clients,
+            'connected': connected,
+            'seconds': round(connect_seconds, 3),
+            'per_second': round(connected / connect_seconds, 1) if connect_seconds else None
+        },
+        'memory': memory
+    }
+
+
+def start_server(args, mode, data_dir):
+    env = dict(os.environ)
+    env.update({
+        'NOLOVE_SERVER_TIME': '1',
+        'NOLOVE_DATA_DIR': data_dir,
+        'NOLOVE_TICK_RATE': str(args.tick_rate),
+    })
+    command = [sys.executable, '-c', SERVER_MODES[mode].format(port=args.port)]
+    process = subprocess.Popen(
+        command, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    # Ждем, пока сервер начнет принимать соединения
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'Сервер завершился с кодом {process.returncode}')
+        try:
+            with socket.create_connection(('127.0.0.1', args.port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit('Сервер не запустился за 30 с')
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(current, previous):
+    """Печатает изменение основных метрик относительно прошлого прогона"""
+    print(f'\nСравнение с {previous.get("commit")}:')
+    for section, key in KEY_METRICS:
+        old = (previous.get(section) or {}).get(key)
+        new = (current.get(section) or {}).get(key)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        print(f'  {section}.{key}: {old} -> {new} ({change:+.1f}%)')
+
+
+def side_by_side(reports):
+    """Таблица основных метрик для нескольких режимов сервера"""
+    modes = [r['config']['server'] for r in reports]
+    width = max(12, *(len(m) for m in modes))
+    print('\n' + ' ' * 32 + ''.join(m.rjust(width + 2) for m in modes))
+    for section, key in KEY_METRICS:
+        values = [(r.get(section) or {}).get(key) for r in reports]
+        cells = ''.join(('-' if v is None else str(v)).rjust(width + 2) for v in values)
+        print(f'{section}.{key}'.ljust(32) + cells)
+
+
+def run_mode(args, mode, commit):
+    results = Results()
+    process = None
+    with tempfile.TemporaryDirectory(prefix='nolove-bench-') as data_dir:
+        if mode != 'external':
+            process = start_server(args, mode, data_dir)
+        try:
+            summary = asyncio.run(run_clients(args, results, process.pid if process else None))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {
+            'server': mode,
+            'clients': args.clients,
+            'duration': args.duration,
+            'tick_rate': args.tick_rate,
+            'wire': args.wire,
+        },
+        **summary,
+        'multiplier_update_ms': percentiles(results.update_latency),
+        'tick_jitter_ms': tick_jitter(results.server_ticks, args.tick_rate),
+        'bet_ack_ms': percentiles(results.bet_ack),
+        'cash_out_ack_ms': percentiles(results.cash_out_ack),
+        'cash_outs': results.cash_outs,
+        'chat_messages': results.chat_messages,
+        'errors': results.errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест NoLove Game')
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=30.0, help='секунд игры после подключения')
+    parser.add_argument('--server', default='eventlet',
+                        help=f'режим или несколько через запятую: {", ".join(sorted(SERVER_MODES))}')
+    parser.add_argument('--url', help='уже запущенный сервер (без замера памяти)')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--tick-rate', type=float, default=10.0)
+    parser.add_argument('--connect-concurrency', type=int, default=100)
+    parser.add_argument('--wire', choices=('json', 'compact'), default='json', help='кодировка частых событий')
+    parser.add_argument('--output', help=f'файл результатов (по умолчанию {RESULTS_DIR}/<коммит>-<режим>.json)')
+    parser.add_argument('--compare', help='прошлый файл результатов')
+    args = parser.parse_args()
+
+    modes = ['external'] if args.url else args.server.split(',')
+    for mode in modes:
+        if mode != 'external' and mode not in SERVER_MODES:
+            parser.error(f'неизвестный режим {mode}')
+    if args.output and len(modes) > 1:
+        parser.error('--output - только для одного режима')
+
+    commit = git_commit()
+    reports = []
+    for mode in modes:
+        print(f'Режим {mode}')
+        report = run_mode(args, mode, commit)
+        reports.append(report)
+
+        output = args.output or os.path.join(RESULTS_DIR, f'{commit}-{mode}.json')
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f'\nРезультаты: {output}')
+
+    if len(reports) > 1:
+        side_by_side(reports)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(reports[-1], json.load(f))
+
+
+if __name__ == '__main__':
+    main()
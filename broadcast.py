@@ -0,0 +1,75 @@
+"""
+NoLove Game - Пакетная рассылка событий игроков
+"""
+import wire
+
+# Событие-пачка для новых клиентов
+BATCH_EVENT = 'players_batch'
+
+
+class BroadcastBatcher:
+    """Копит player_bet / player_cashed_out и рассылает их раз в тик движка
+
+    В режиме legacy события уходят по одному (для старых клиентов),
+    но все равно только в момент сброса. Клиентам с компактной
+    кодировкой (wire.py) пачка уходит всегда, событием wire.PLAYERS.
+    """
+
+    def __init__(self, emit, legacy=False):
+        self.emit = emit
+        self.legacy = legacy
+        self._bets = []
+        self._cash_outs = []
+        self.compact = wire.CompactBatch()
+
+        # Счетчики: каждый сэкономленный emit - это кадр на каждый сокет
+        self.events_queued = 0
+        self.emits_sent = 0
+        self.emits_saved = 0
+
+    def __len__(self):
+        return len(self._bets) + len(self._cash_outs)
+
+    def player_bet(self, player):
+        self._bets.append(player.public_info())
+        self.compact.player_bet(player.handle, player.username, player.bet)
+        self.events_queued += 1
+
+    def player_cashed_out(self, player, winnings):
+        self._cash_outs.append({
+            'id': player.id,
+            'username': player.username,
+            'bet': player.bet,
+            'multiplier': player.cash_out_multiplier,
+            'winnings': winnings
+        })
+        self.compact.player_cashed_out(player.handle, player.cash_out_multiplier, winnings)
+        self.events_queued += 1
+
+    def flush(self):
+        pending = len(self)
+        if not pending:
+            return
+
+        bets, cash_outs = self._bets, self._cash_outs
+        self._bets, self._cash_outs = [], []
+        self.emit(wire.PLAYERS, self.compact.take())
+
+        if self.legacy:
+            for data in bets:
+                self.emit('player_bet', data)
+            for data in cash_outs:
+                self.emit('player_cashed_out', data)
+            self.emits_sent += pending
+            return
+
+        self.emit(BATCH_EVENT, {'bets': bets, 'cashOuts': cash_outs})
+        self.emits_sent += 1
+        self.emits_saved += pending - 1
+
+    def stats(self):
+        return {
+            'events_queued': self.events_queued,
+            'emits_sent': self.emits_sent,
+            'emits_saved': self.emits_saved
+        }
@@ -0,0 +1,161 @@
+"""
+NoLove Game - Чат
+
+Сообщения проверяются сразу (длина, лимит частоты на отправителя), а
+рассылаются пачкой раз в flush_interval: одно событие chat_batch на всех
+вместо события на каждое сообщение, поэтому спам не отнимает время у
+тиков игры. Последние сообщения хранятся в кольцевом буфере и
+отправляются новым клиентам (chat_history).
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+MAX_MESSAGE_LENGTH = 200
+HISTORY_SIZE = 50
+FLUSH_INTERVAL = 0.25
+# Лимит отправителя: до RATE_BURST сообщений подряд, затем RATE_PER_SECOND в секунду
+RATE_PER_SECOND = 1.0
+RATE_BURST = 5
+# Как часто удалять корзины, которые уже снова полны
+SWEEP_INTERVAL = 10.0
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst, now):
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, rate, burst, now):
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class ChatRoom:
+    """Прием, ограничение и пакетная рассылка сообщений чата
+
+    name_of(sid) -> имя игрока или None: писать могут только
+    зарегистрированные игроки. Лимит привязан к имени, а не к сокету:
+    переподключение его не сбрасывает. Корзина, которая простояла
+    burst / rate секунд, снова полна - такие удаляются при рассылке.
+    """
+
+    def __init__(self, emit, name_of, legacy=False, max_length=MAX_MESSAGE_LENGTH,
+                 history_size=HISTORY_SIZE, flush_interval=FLUSH_INTERVAL,
+                 rate=RATE_PER_SECOND, burst=RATE_BURST):
+        self.emit = emit
+        self.name_of = name_of
+        # Поштучные chat_message для старых клиентов
+        self.legacy = legacy
+        self.max_length = max_length
+        self.flush_interval = flush_interval
+        self.rate = rate
+        self.burst = burst
+
+        # Имя -> TokenBucket
+        self.buckets = {}
+        self._last_sweep = time.monotonic()
+        self.history = deque(maxlen=history_size)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._started = False
+
+        self.messages_accepted = 0
+        self.messages_rejected = 0
+        self.batches_sent = 0
+
+    def start(self, socketio):
+        """Запускает цикл рассылки в фоне (только один раз)"""
+        if self._claim_start():
+            socketio.start_background_task(self.run_forever, socketio.sleep)
+
+    def start_async(self, after_flush):
+        """То же для asyncio; after_flush() - корутина, которая рассылает пачку"""
+        if self._claim_start():
+            asyncio.ensure_future(self.run_async(after_flush))
+
+    def _claim_start(self):
+        with self._lock:
+            if self._started:
+                return False
+            self._started = True
+            return True
+
+    def run_forever(self, sleep):
+        while True:
+            sleep(self.flush_interval)
+            self.flush()
+
+    async def run_async(self, after_flush):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+            await after_flush()
+
+    def post(self, sid, message, username=None):
+        """Принимает сообщение в очередь рассылки; ответ - для callback клиента
+
+        username - имя отправителя, если его знает вызывающий (шлюз кластера).
+        """
+        username = username or self.name_of(sid)
+        if not username:
+            return {'error': 'Сначала войдите в игру'}
+        if not isinstance(message, str) or not message.strip():
+            return {'error': 'Пустое сообщение'}
+        message = message.strip()
+        if len(message) > self.max_length:
+            self.messages_rejected += 1
+            return {'error': f'Сообщение длиннее {self.max_length} символов'}
+
+        now = time.monotonic()
+        with self._lock:
+            bucket = self.buckets.get(username)
+            if bucket is None:
+                bucket = self.buckets[username] = TokenBucket(self.burst, now)
+            if not bucket.take(self.rate, self.burst, now):
+                self.messages_rejected += 1
+                return {'error': 'Слишком много сообщений, подождите'}
+            self._pending.append({'username': username, 'message': message})
+            self.messages_accepted += 1
+        return {'success': True}
+
+    def flush(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            # В историю - в момент рассылки, чтобы новый клиент не получил сообщение дважды
+            self.history.extend(batch)
+        if self.legacy:
+            for entry in batch:
+                self.emit('chat_message', entry)
+        else:
+            self.emit('chat_batch', {'messages': batch})
+        self.batches_sent += 1
+
+    def _expire(self, now):
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        idle = self.burst / self.rate
+        for username in [name for name, bucket in self.buckets.items() if now - bucket.updated >= idle]:
+            del self.buckets[username]
+
+    def recent(self):
+        """Последние сообщения, от старых к новым"""
+        with self._lock:
+            return {'messages': list(self.history)}
+
+
+def from_env(emit, name_of):
+    """Чат с настройками из окружения (NOLOVE_LEGACY_BROADCASTS=1 - поштучные события)"""
+    return ChatRoom(emit, name_of, legacy=os.environ.get('NOLOVE_LEGACY_BROADCASTS') == '1')
@@ -0,0 +1,524 @@
+"""
+NoLove Game - Процессы движка и процессы-шлюзы
+
+Процесс движка (python cluster.py <сокет> <номер>) ведет закрепленные за
+ним столы (rooms.py) и слушает Unix-сокет; столы разных процессов
+считаются на разных ядрах. Шлюзы - обычные воркеры gunicorn с
+nolove_server_8000: они держат сокеты клиентов, пересылают команды
+движку стола и сами рассылают события своим клиентам, поэтому число
+соединений растет с числом ядер.
+
+Кадр шины: 4 байта длины (big-endian) + JSON.
+  шлюз -> движок: {'req': n, 'op': имя, 'room': стол, 'args': [...]}
+  движок -> шлюз: {'req': n, 'result': ...} или
+                  {'event': имя, 'data': ..., 'to': sid} / {..., 'room': стол}
+
+Порядок команд: кадры одного шлюза обрабатываются по очереди, а клиент
+всегда подключен к одному шлюзу, поэтому ставки и выводы каждого игрока
+приходят в движок в том порядке, в котором он их отправил. Время
+получения вывода шлюз отмечает сам (монотонные часы общие для машины).
+"""
+import itertools
+import json
+import os
+import queue
+import socket
+import struct
+import sys
+import threading
+import time
+
+import logs
+import metrics
+import rooms
+
+FRAME_HEADER = struct.Struct('>I')
+DEFAULT_SOCKET_PATH = '/tmp/nolove-engine.sock'
+REQUEST_TIMEOUT = 5.0
+RECONNECT_DELAY = 0.5
+
+log = logs.get('cluster')
+
+# Команды движка (через очередь) и запросы чтения, доступные шлюзам
+COMMAND_OPS = {
+    'register', 'place_bet', 'cash_out', 'set_auto_cashout', 'leave', 'deposit',
+    'start_auto_bet', 'stop_auto_bet', 'resume'
+}
+QUERY_OPS = {'get_history', 'get_leaderboard', 'fairness_info', 'verify_round', 'player_name', 'room_info'}
+
+
+def encode_frame(message):
+    body = json.dumps(message, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+def read_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError('Соединение шины закрыто')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_frame(sock):
+    (size,) = FRAME_HEADER.unpack(read_exactly(sock, FRAME_HEADER.size))
+    return json.loads(read_exactly(sock, size))
+
+
+# Сторона движка
+
+class GatewayConnection:
+    """Подключенный шлюз: входящие команды и очередь исходящих кадров"""
+
+    def __init__(self, sock, server):
+        self.sock = sock
+        self.server = server
+        # sid -> стол игроков, зарегистрированных через этот шлюз
+        self.sids = {}
+        self.outbox = queue.Queue()
+        self.closed = False
+
+    def start(self):
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    def send(self, message):
+        if not self.closed:
+            self.outbox.put(encode_frame(message))
+
+    def _write_loop(self):
+        # Медленный шлюз не тормозит движок: кадры копятся в его очереди
+        while not self.closed:
+            frame = self.outbox.get()
+            if frame is None:
+                break
+            try:
+                self.sock.sendall(frame)
+            except OSError:
+                break
+
+    def _read_loop(self):
+        try:
+            while True:
+                self.server.handle(self, read_frame(self.sock))
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            self.server.drop(self)
+
+
+class EngineBusServer:
+    """Unix-сокет процесса движка: принимает шлюзы, выполняет команды столов, раздает события"""
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH):
+        self.path = path
+        self.engines = {}
+        # Чат есть только в процессе 0
+        self.chat = None
+        self.connections = set()
+        self.owners = {}
+        self.lock = threading.Lock()
+
+    def emit(self, event, data, to=None, room=None):
+        """Функция emit для движков столов и чата"""
+        message = {'event': event, 'data': data}
+        if to is not None:
+            conn = self.owners.get(to)
+            if conn is not None:
+                message['to'] = to
+                conn.send(message)
+            return
+        if room is not None:
+            message['room'] = room
+        with self.lock:
+            connections = list(self.connections)
+        for conn in connections:
+            conn.send(message)
+
+    def player_name(self, sid):
+        for engine in self.engines.values():
+            username = engine.player_name(sid)
+            if username:
+                return username
+        return None
+
+    def serve_forever(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen()
+        log.info('engine_listening', path=self.path, rooms=list(self.engines))
+        while True:
+            sock, _ = listener.accept()
+            conn = GatewayConnection(sock, self)
+            with self.lock:
+                self.connections.add(conn)
+            conn.start()
+
+    def handle(self, conn, message):
+        op, args = message['op'], message.get('args', [])
+        req = message.get('req')
+
+        def reply(result):
+            if req is not None:
+                conn.send({'req': req, 'result': result})
+
+        if op == 'metrics':
+            # Прямо из потока чтения: гистограммы и датчики под своими блокировками
+            reply(metrics.REGISTRY.export())
+            return
+
+        if op in ('chat_post', 'chat_recent'):
+            if self.chat is None:
+                reply({'error': 'Чат ведет процесс движка 0'})
+            elif op == 'chat_post':
+                reply(self.chat.post(*args))
+            else:
+                reply(self.chat.recent())
+            return
+
+        room = message.get('room')
+        engine = self.engines.get(room)
+        if engine is None:
+            reply({'error': f'Стол {room} не в этом процессе'})
+            return
+
+        if op in COMMAND_OPS:
+            callback = reply if req is not None else None
+            if op in ('register', 'resume'):
+                callback = self._on_register(conn, args[0], room, callback)
+            elif op == 'leave':
+                callback = self._on_leave(conn, args[0], reply)
+            # Команда выполнится на ближайшем тике, ответ уйдет оттуда же;
+            # поток чтения шлюза не ждет
+            engine.submit(op, *args, callback=callback)
+        elif op == 'disconnect':
+            sid = args[0]
+            conn.sids.pop(sid, None)
+            self.owners.pop(sid, None)
+            reply(engine.player_name(sid))
+            engine.submit('disconnect', sid)
+        elif op == 'init_state':
+            reply(self._init_state(engine, *args))
+        elif op in QUERY_OPS:
+            reply(getattr(engine, op)(*args))
+        else:
+            reply({'error': f'Неизвестная команда {op}'})
+
+    def _on_register(self, conn, sid, room, reply):
+        # События для этого sid идут через этот шлюз уже во время команды:
+        # движок шлет player_registered до ответа. При отказе - как было
+        previous = conn.sids.get(sid), self.owners.get(sid)
+        conn.sids[sid] = room
+        self.owners[sid] = conn
+
+        def callback(result):
+            if isinstance(result, dict) and 'error' in result:
+                room_before, owner_before = previous
+                if conn.sids.get(sid) == room:
+                    if room_before is None:
+                        del conn.sids[sid]
+                    else:
+                        conn.sids[sid] = room_before
+                if self.owners.get(sid) is conn:
+                    if owner_before is None:
+                        del self.owners[sid]
+                    else:
+                        self.owners[sid] = owner_before
+            if reply is not None:
+                reply(result)
+        return callback
+
+    def _on_leave(self, conn, sid, reply):
+        def callback(result):
+            if isinstance(result, dict) and 'error' in result:
+                # Игрок остался за столом
+                reply(result)
+                return
+            # Адресные события ушедшего игрока уже разосланы на этом тике
+            conn.sids.pop(sid, None)
+            if self.owners.get(sid) is conn:
+                del self.owners[sid]
+            reply(result)
+        return callback
+
+    @staticmethod
+    def _init_state(engine, known_version):
+        """Снимок только если у шлюза устаревшая версия"""
+        version = engine.snapshot.version
+        if version == known_version:
+            return {'version': version}
+        payload = engine.init_state()
+        if isinstance(payload, bytes):
+            return {'version': version, 'json': payload.decode('utf-8')}
+        return {'version': version, 'data': payload}
+
+    def drop(self, conn):
+        """Шлюз отключился: его игроки считаются отключившимися"""
+        conn.closed = True
+        conn.outbox.put(None)
+        with self.lock:
+            self.connections.discard(conn)
+        for sid, room in list(conn.sids.items()):
+            self.owners.pop(sid, None)
+            self.engines[room].submit('disconnect', sid)
+        conn.sock.close()
+        log.warning('gateway_disconnected', players=len(conn.sids))
+
+
+def run_engine_process(path=None, worker=0):
+    import chat
+
+    logs.configure()
+    path = path or rooms.socket_path(os.environ.get('NOLOVE_ENGINE_SOCKET', DEFAULT_SOCKET_PATH), worker)
+    server = EngineBusServer(path)
+    server.engines = rooms.build_engines(rooms.load_configs(), server.emit, worker)
+    metrics.register_engines(server.engines.values())
+    for engine in server.engines.values():
+        threading.Thread(target=engine.run_forever, args=(time.sleep,), daemon=True).start()
+    if worker == 0:
+        # Чат общий для всех шлюзов и столов, поэтому живет в процессе движка
+        server.chat = chat.from_env(server.emit, server.player_name)
+        threading.Thread(target=server.chat.run_forever, args=(time.sleep,), daemon=True).start()
+    server.serve_forever()
+
+
+# Сторона шлюза
+
+class RemotePlayer:
+    __slots__ = ('username',)
+
+    def __init__(self, username):
+        self.username = username
+
+
+class BusClient:
+    """Соединение шлюза с одним процессом движка; общее для всех его столов"""
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH, timeout=REQUEST_TIMEOUT, emit=None):
+        self.path = path
+        self.timeout = timeout
+        self.socketio = None
+        # emit для рассылки клиентам; None - socketio.emit
+        self.emit = emit
+        self._emit = None
+        self.sock = None
+        # стол -> RemoteEngine
+        self.rooms = {}
+        self._requests = itertools.count(1)
+        self._pending = {}
+        self._send_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._connected = threading.Event()
+
+    def start(self, socketio):
+        with self._start_lock:
+            if self.socketio is not None:
+                return
+            self.socketio = socketio
+            self._emit = metrics.instrument_emit(self.emit or socketio.emit)
+        socketio.start_background_task(self._read_loop)
+        self._connected.wait(self.timeout)
+
+    def _connect(self):
+        while True:
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.path)
+                return sock
+            except OSError:
+                sock.close()
+                self.socketio.sleep(RECONNECT_DELAY)
+
+    def _read_loop(self):
+        while True:
+            self.sock = self._connect()
+            self._connected.set()
+            try:
+                while True:
+                    self._dispatch(read_frame(self.sock))
+            except (ConnectionError, OSError, ValueError):
+                log.warning('engine_connection_lost', path=self.path)
+            self._connected.clear()
+            for engine in self.rooms.values():
+                engine.reset_snapshot()
+            # Ожидающие ответа запросы завершаем ошибкой
+            for waiter in list(self._pending.values()):
+                waiter['result'] = {'error': 'Сервер игры недоступен'}
+                waiter['event'].set()
+            self.sock.close()
+
+    def _dispatch(self, message):
+        if 'req' in message:
+            waiter = self._pending.get(message['req'])
+            if waiter is not None:
+                waiter['result'] = message['result']
+                waiter['event'].set()
+            return
+        # Рассылка клиентам этого шлюза: игроку, столу или всем (чат)
+        if message.get('to') is not None:
+            self._emit(message['event'], message['data'], to=message['to'])
+        elif message.get('room') is not None:
+            self._emit(message['event'], message['data'], room=message['room'])
+        else:
+            self._emit(message['event'], message['data'])
+
+    def _send(self, message):
+        if not self._connected.wait(self.timeout):
+            raise ConnectionError('Сервер игры недоступен')
+        frame = encode_frame(message)
+        with self._send_lock:
+            self.sock.sendall(frame)
+
+    def request(self, op, *args, room=None):
+        req = next(self._requests)
+        waiter = {'event': threading.Event(), 'result': None}
+        self._pending[req] = waiter
+        try:
+            self._send({'req': req, 'op': op, 'room': room, 'args': list(args)})
+            if not waiter['event'].wait(self.timeout):
+                return {'error': 'Сервер игры не ответил'}
+            return waiter['result']
+        except (ConnectionError, OSError):
+            return {'error': 'Сервер игры недоступен'}
+        finally:
+            self._pending.pop(req, None)
+
+    def metrics(self):
+        """metrics.REGISTRY.export() процесса движка; None - если он недоступен"""
+        result = self.request('metrics')
+        return None if 'error' in result else result
+
+    def notify(self, op, *args, room=None):
+        try:
+            self._send({'op': op, 'room': room, 'args': list(args)})
+        except (ConnectionError, OSError):
+            pass
+
+
+class RemoteEngine:
+    """Заместитель GameEngine стола в процессе-шлюзе: те же методы через шину"""
+
+    def __init__(self, client, room):
+        self.client = client
+        self.room = room
+        client.rooms[room] = self
+
+        # Снимок init_state кэшируется в шлюзе по версии движка
+        self._snapshot_version = None
+        self._snapshot = None
+
+    def start(self, socketio):
+        self.client.start(socketio)
+
+    def reset_snapshot(self):
+        self._snapshot_version = None
+
+    def _request(self, op, *args):
+        return self.client.request(op, *args, room=self.room)
+
+    def _notify(self, op, *args):
+        self.client.notify(op, *args, room=self.room)
+
+    # Интерфейс GameEngine
+
+    def init_state(self):
+        result = self._request('init_state', self._snapshot_version)
+        if 'error' in result:
+            return {}
+        if result['version'] != self._snapshot_version or self._snapshot is None:
+            if 'json' in result:
+                self._snapshot = result['json'].encode('utf-8')
+            else:
+                self._snapshot = result['data']
+            self._snapshot_version = result['version']
+        return self._snapshot
+
+    def register(self, sid, username, balance=None):
+        return self._request('register', sid, username, balance)
+
+    def place_bet(self, sid, bet):
+        return self._request('place_bet', sid, bet)
+
+    def cash_out(self, sid, received_at=None):
+        # Время получения отмечаем здесь, а не в момент разбора кадра движком
+        self._notify('cash_out', sid, received_at or time.monotonic())
+
+    def set_auto_cashout(self, sid, multiplier):
+        self._notify('set_auto_cashout', sid, multiplier)
+
+    def start_auto_bet(self, sid, settings):
+        return self._request('start_auto_bet', sid, settings)
+
+    def stop_auto_bet(self, sid):
+        return self._request('stop_auto_bet', sid)
+
+    def resume(self, sid, token, version=None, compact=False):
+        return self._request('resume', sid, token, version, compact)
+
+    def leave(self, sid, switching=False):
+        return self._request('leave', sid, switching)
+
+    def deposit(self, username, balance):
+        self._notify('deposit', username, balance)
+
+    def get_history(self, cursor=None, limit=10):
+        return self._request('get_history', cursor, limit)
+
+    def get_leaderboard(self, username=None):
+        return self._request('get_leaderboard', username)
+
+    def fairness_info(self):
+        return self._request('fairness_info')
+
+    def verify_round(self, round_id):
+        return self._request('verify_round', round_id)
+
+    def player_name(self, sid):
+        result = self._request('player_name', sid)
+        return result if isinstance(result, str) else None
+
+    def room_info(self):
+        return self._request('room_info')
+
+    def disconnect(self, sid):
+        username = self._request('disconnect', sid)
+        return RemotePlayer(username) if isinstance(username, str) else None
+
+
+def connect_rooms(configs, base_path=DEFAULT_SOCKET_PATH, emit=None):
+    """Заместители движков всех столов: одно соединение на процесс движка"""
+    clients = {worker: BusClient(rooms.socket_path(base_path, worker), emit=emit)
+               for worker in rooms.worker_ids(configs)}
+    return {room['id']: RemoteEngine(clients[room['worker']], room['id']) for room in configs}
+
+
+class RemoteChat:
+    """Заместитель chat.ChatRoom в шлюзе: чат ведет процесс движка 0
+
+    Имя отправителя берет шлюз (name_of): игрок может сидеть за столом
+    другого процесса.
+    """
+
+    def __init__(self, client, name_of):
+        self.client = client
+        self.name_of = name_of
+
+    def start(self, socketio):
+        self.client.start(socketio)
+
+    def post(self, sid, message):
+        return self.client.request('chat_post', sid, message, self.name_of(sid))
+
+    def recent(self):
+        result = self.client.request('chat_recent')
+        return result if 'messages' in result else {'messages': []}
+
+
+if __name__ == '__main__':
+    run_engine_process(sys.argv[1] if len(sys.argv) > 1 else None,
+                       int(sys.argv[2]) if len(sys.argv) > 2 else 0)
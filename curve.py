@@ -0,0 +1,75 @@
+"""
+NoLove Game - Кривая множителя и точка краха
+
+Функции не зависят от сервера и работают как с числами, так и с
+массивами NumPy (их использует симулятор, simulate.py).
+"""
+import math
+
+# Режимы протокола
+STREAM = 'stream'            # множитель рассылается каждый тик (исходный режим)
+EXTRAPOLATE = 'extrapolate'  # клиент сам рисует кривую по параметрам
+
+# Исходная игра: случайный шаг 0.01-0.06 за каждые 100 мс
+BASE_TICK_INTERVAL = 0.1
+WALK_MIN_STEP = 0.01
+WALK_STEP_RANGE = 0.05
+
+# Детерминированная кривая по умолчанию: средняя скорость исходной игры
+DEFAULT_CURVE = {'type': 'linear', 'rate': 0.35}
+
+# Точка краха: от 1 до 15, распределение исходной игры
+CRASH_MAX = 15
+CRASH_EXPONENT = 0.65
+
+
+def _math(x):
+    # Числа - модуль math, массивы - numpy (импортируется, только если нужен)
+    if isinstance(x, (int, float)):
+        return math
+    import numpy
+    return numpy
+
+
+def crash_point_from_uniform(r):
+    """Точка краха из равномерного r в [0, 1)"""
+    return 1 + r ** CRASH_EXPONENT * (CRASH_MAX - 1)
+
+
+def crash_point_house_edge(r, edge_percent):
+    """Точка краха с преимуществом казино: P(краш >= x) = (1 - edge) / x, вниз до сотых"""
+    point = _math(r).floor((1 - edge_percent / 100) / (1 - r) * 100) / 100
+    return max(1.0, point) if isinstance(point, float) else point.clip(min=1.0)
+
+
+def walk_step(r, tick_interval=BASE_TICK_INTERVAL):
+    """Шаг случайного блуждания за тик из равномерного r в [0, 1)"""
+    return (r * WALK_STEP_RANGE + WALK_MIN_STEP) * (tick_interval / BASE_TICK_INTERVAL)
+
+
+def multiplier_at(curve, elapsed):
+    """Множитель через elapsed секунд после старта"""
+    if curve['type'] == 'linear':
+        return 1 + curve['rate'] * elapsed
+    if curve['type'] == 'exponential':
+        return math.e ** (curve['rate'] * elapsed)
+    raise ValueError(f"Неизвестная кривая: {curve['type']}")
+
+
+def time_to_reach(curve, multiplier):
+    """Сколько секунд кривая идет до multiplier (обратная к multiplier_at)"""
+    if curve['type'] == 'linear':
+        return (multiplier - 1) / curve['rate']
+    if curve['type'] == 'exponential':
+        return _math(multiplier).log(multiplier) / curve['rate']
+    raise ValueError(f"Неизвестная кривая: {curve['type']}")
+
+
+def floor_hundredths(multiplier):
+    """Округление вниз до сотых: выплата никогда не опережает кривую"""
+    return _math(multiplier).floor(multiplier * 100 + 1e-9) / 100
+
+
+def cash_out_winnings(bet, multiplier):
+    """Выплата по выводу: ставка на множитель вниз до целого"""
+    return _math(multiplier).floor(bet * multiplier)
@@ -0,0 +1,1035 @@
+"""
+NoLove Game - Игровой движок
+
+Один долгоживущий цикл с машиной состояний:
+idle -> countdown -> running -> crashed -> cooldown -> (countdown | idle).
+Все изменения игрового состояния выполняются под блокировкой движка,
+поэтому обработчики сокетов и тики не пересекаются.
+"""
+import asyncio
+import heapq
+import math
+import os
+import random
+import secrets
+import threading
+import time
+from collections import deque
+
+import autobet
+import fairness
+import leaderboard as leaderboard_module
+import ledger as ledger_module
+import logs
+import metrics
+import round_log as round_log_module
+import wire
+from broadcast import BroadcastBatcher
+from curve import (
+    STREAM, EXTRAPOLATE, DEFAULT_CURVE,
+    crash_point_from_uniform, walk_step, multiplier_at, time_to_reach, floor_hundredths, cash_out_winnings
+)
+from history import GameHistory
+from players import PlayerRegistry, username_error
+from snapshot import SnapshotCache
+
+log = logs.get('engine')
+
+# Фазы раунда
+IDLE = 'idle'
+COUNTDOWN = 'countdown'
+RUNNING = 'running'
+CRASHED = 'crashed'
+COOLDOWN = 'cooldown'
+
+DEFAULT_TICK_RATE = 10  # тиков в секунду
+COUNTDOWN_SECONDS = 5
+COOLDOWN_SECONDS = 3
+INITIAL_BALANCE = 1000
+
+RECENT_GAMES_SIZE = 10
+# Интервал контрольных сообщений multiplier_sync в режиме экстраполяции
+SYNC_INTERVAL = 1.0
+COMMAND_TIMEOUT = 5.0
+
+# Журнал событий состояния для возобновления сессии (resume)
+JOURNAL_SIZE = 1024
+JOURNAL_EVENTS = {
+    'countdown_start', 'game_start', 'game_crash', 'leaderboard_update',
+    'players_batch', 'player_bet', 'player_cashed_out', wire.PLAYERS
+}
+
+TICK_SECONDS = metrics.REGISTRY.histogram(
+    'nolove_tick_duration_seconds', 'Время одного тика движка (с рассылкой)')
+AUTO_CASHOUT_SECONDS = metrics.REGISTRY.histogram(
+    'nolove_auto_cashout_settlement_seconds', 'Время расчета сработавших авто-выводов за тик')
+COMMAND_BATCH = metrics.REGISTRY.histogram(
+    'nolove_command_batch_size', 'Команд игроков, выполненных за тик',
+    (1, 5, 10, 50, 100, 500, 1000, 5000, 10000))
+
+
+class AutoCashoutIndex:
+    """Пороги авто-вывода текущего раунда в min-куче"""
+
+    def __init__(self):
+        self._heap = []
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def rebuild(self, players):
+        """Строит кучу заново при закрытии ставок"""
+        self._heap = [
+            (p.auto_cashout_multiplier, i, p)
+            for i, p in enumerate(players) if p.auto_cashout_multiplier is not None
+        ]
+        heapq.heapify(self._heap)
+        self._seq = len(self._heap)
+
+    def push(self, player):
+        self._seq += 1
+        heapq.heappush(self._heap, (player.auto_cashout_multiplier, self._seq, player))
+
+    def pop_crossed(self, multiplier, registry):
+        """Достает игроков, чей порог пройден; стоимость O(сработавших * log n)"""
+        triggered = []
+        heap = self._heap
+        while heap and heap[0][0] <= multiplier:
+            threshold, _, player = heapq.heappop(heap)
+            # Запись устарела: игрок ушел, уже вывел или сменил порог
+            if (registry.is_in_round(player) and not player.did_cash_out
+                    and player.auto_cashout_multiplier == threshold):
+                triggered.append(player)
+        return triggered
+
+    def clear(self):
+        self._heap = []
+        self._seq = 0
+
+
+class GameEngine:
+    def __init__(self, state, emit, tick_rate=DEFAULT_TICK_RATE,
+                 countdown_seconds=COUNTDOWN_SECONDS, cooldown_seconds=COOLDOWN_SECONDS,
+                 legacy_broadcasts=False, curve_mode=STREAM, curve=DEFAULT_CURVE,
+                 sync_interval=SYNC_INTERVAL, crash_source=None, round_log=None, ledger=None,
+                 server_time=False, min_bet=1, max_bet=None, active_names=None, leaderboard=None,
+                 room_id=None):
+        self.state = state
+        self.players = state['players']
+        self.history = state['game_history']
+        if not state['recent_games']:
+            state['recent_games'] = [f"{r['multiplier']:.2f}" for r in self.history.recent(RECENT_GAMES_SIZE)]
+        self._send = emit
+        self.broadcasts = BroadcastBatcher(self.emit, legacy=legacy_broadcasts)
+        self.tick_interval = 1.0 / tick_rate
+        self.countdown_seconds = countdown_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.curve_mode = curve_mode
+        self.curve = curve
+        self.sync_interval = sync_interval
+        # Источник точек краха (честная игра); без него - random
+        self.crash_source = crash_source
+        # Журнал раундов на диске (round_log.RoundLog); запись в фоне
+        self.round_log = round_log
+        # Журнал балансов (ledger.Ledger): балансы переживают отключение и перезапуск
+        self.ledger = ledger
+        # Время отправки в multiplier_update - для замера задержки (bench.py)
+        self.server_time = server_time
+        # Пределы ставок стола (max_bet=None - без верхнего предела)
+        self.min_bet = min_bet
+        self.max_bet = max_bet
+        # Занятые имена; у столов одного процесса множество общее
+        self.active_names = active_names if active_names is not None else set()
+        # Таблица лидеров стола (leaderboard.Leaderboard)
+        self.leaderboard = leaderboard
+        self.room_id = room_id
+
+        # Сессии: токен -> игрок. Переподключившийся клиент возвращается
+        # к своему игроку (resume) и получает события из журнала после
+        # последней известной ему версии, а не весь init_state
+        self.sessions = {}
+        self.version = 0
+        self.journal = deque(maxlen=JOURNAL_SIZE)
+
+        self.phase = IDLE
+        # Нумерация раундов продолжается после перезапуска: с журнала
+        # и с использованной части цепочки хешей
+        self.round_id = max(
+            crash_source.last_round if crash_source else 0,
+            round_log.last_round_id if round_log else 0
+        )
+        self.last_finished_round = self.round_id
+        self.phase_deadline = 0.0
+        self.crash_point = 0.0
+        self.multiplier = 1.0
+        # Время раунда по монотонным часам (для режима экстраполяции)
+        self.started_at = 0.0
+        self.crash_time = 0.0
+        self.next_sync = 0.0
+        self.auto_cashouts = AutoCashoutIndex()
+        # Программы автоставок: sid -> autobet.AutoBet
+        self.auto_bets = {}
+        self.lock = threading.RLock()
+        self.snapshot = SnapshotCache(self._build_init_state, self.lock)
+        self._round_requested = False
+        self._started = False
+        self._running = False
+
+        # Очередь команд игроков: deque безопасна для добавления из любых потоков
+        self.commands = deque()
+        self.commands_processed = 0
+        self.commands_cancelled = 0
+        # Событие для ожидания ответа в _call - из режима сервера (под eventlet
+        # без monkey_patch threading.Event заморозил бы цикл)
+        self._new_event = threading.Event
+
+        # Статистика цикла
+        self.ticks = 0
+        self.skipped_ticks = 0
+        self.max_jitter = 0.0
+
+    # Цикл движка
+
+    def start(self, socketio):
+        """Запускает цикл движка в фоне (только один раз)"""
+        if self._claim_start():
+            self._new_event = socketio.server.eio.create_event
+            socketio.start_background_task(self.run_forever, socketio.sleep)
+
+    def start_async(self, after_tick):
+        """То же для asyncio: цикл - задача в текущем event loop"""
+        if self._claim_start():
+            asyncio.ensure_future(self.run_async(after_tick))
+
+    def _claim_start(self):
+        with self.lock:
+            if self._started:
+                return False
+            self._started = True
+            return True
+
+    def run_forever(self, sleep):
+        """Тикает по монотонным часам с компенсацией дрейфа"""
+        self._running = True
+        next_tick = time.monotonic()
+        while True:
+            self._timed_tick(next_tick)
+            next_tick, delay = self._schedule(next_tick)
+            sleep(delay)
+
+    async def run_async(self, after_tick):
+        """Цикл для asyncio; after_tick() - корутина, которая рассылает события тика"""
+        self._running = True
+        next_tick = time.monotonic()
+        while True:
+            self._timed_tick(next_tick)
+            await after_tick()
+            next_tick, delay = self._schedule(next_tick)
+            await asyncio.sleep(delay)
+
+    def _timed_tick(self, scheduled):
+        now = time.monotonic()
+        self.max_jitter = max(self.max_jitter, now - scheduled)
+        with self.lock:
+            self.tick(now)
+        TICK_SECONDS.observe(time.monotonic() - now)
+        self.ticks += 1
+
+    def _schedule(self, next_tick):
+        """Время следующего тика и пауза до него"""
+        # Следующий тик считаем от расписания, а не от момента пробуждения,
+        # поэтому задержки не накапливаются
+        next_tick += self.tick_interval
+        now = time.monotonic()
+        if now - next_tick > self.tick_interval:
+            # Сильно отстали: пропускаем тики вместо пачки догоняющих
+            missed = int((now - next_tick) / self.tick_interval)
+            self.skipped_ticks += missed
+            next_tick += missed * self.tick_interval
+        return next_tick, max(0.0, next_tick - now)
+
+    def tick(self, now):
+        # Команды клиентов - на границе тика, до хода раунда
+        self._drain_commands()
+        self._tick_phase(now)
+        # События игроков за тик уходят одной пачкой
+        self.broadcasts.flush()
+        # Изменения балансов за тик - одна пачка в журнал
+        if self.ledger is not None:
+            self.ledger.commit()
+
+    def _tick_phase(self, now):
+        if self.phase == IDLE:
+            if self._round_requested:
+                self._start_countdown(now)
+        elif self.phase == COUNTDOWN:
+            time_left = math.ceil(self.phase_deadline - now)
+            if time_left <= 0:
+                self._start_game(now)
+            elif time_left != self.state['time_to_start']:
+                self.state['time_to_start'] = time_left
+                self._emit_phase('countdown_update', {'timeLeft': time_left})
+        elif self.phase == RUNNING:
+            self._advance(now)
+        elif self.phase == CRASHED:
+            self.phase = COOLDOWN
+            self.phase_deadline = now + self.cooldown_seconds
+        elif self.phase == COOLDOWN:
+            if now >= self.phase_deadline:
+                # Если есть готовые игроки, запускаем новый отсчет
+                if self._round_requested or self.players.any_ready():
+                    self._start_countdown(now)
+                else:
+                    self.phase = IDLE
+
+    # Переходы между фазами
+
+    def _start_countdown(self, now):
+        self._round_requested = False
+        self.phase = COUNTDOWN
+        self.phase_deadline = now + self.countdown_seconds
+        self.state['countdown_active'] = True
+        self.state['time_to_start'] = self.countdown_seconds
+        self.snapshot.bump()
+
+        self._emit_phase('countdown_start', {'timeLeft': self.state['time_to_start']})
+
+    def _start_game(self, now):
+        self.phase = RUNNING
+        self.round_id += 1
+        self.state['countdown_active'] = False
+        self.state['is_active'] = True
+        self.multiplier = 1.0
+        self.state['current_multiplier'] = 1.00
+        self.snapshot.bump()
+
+        # Определяем точку краха
+        self.crash_point = self._next_crash_point()
+
+        log.info('round_started', room=self.room_id, round=self.round_id, crash_point=round(self.crash_point, 2))
+
+        # Ставки закрыты: строим индекс порогов авто-вывода на раунд
+        round_players = self.players.round_players()
+        self.auto_cashouts.rebuild(round_players)
+
+        active_players = [p.public_info() for p in round_players]
+        payload = {'activePlayers': active_players}
+
+        if self.curve_mode == EXTRAPOLATE:
+            # Клиенту достаточно момента старта и параметров кривой
+            self.started_at = now
+            self.crash_time = now + time_to_reach(self.curve, self.crash_point)
+            self.next_sync = now + self.sync_interval
+            server_time = int(time.time() * 1000)
+            payload.update({
+                'startedAt': server_time,
+                'serverTime': server_time,
+                'curve': self.curve
+            })
+
+        self._emit_phase('game_start', payload)
+
+    def _next_crash_point(self):
+        if self.crash_source is not None:
+            crash_point = self.crash_source.crash_point(self.round_id)
+            if crash_point is not None:
+                return crash_point
+            # Точка краха случайная: раунд не проверить по цепочке
+            log.warning('hash_chain_exhausted', room=self.room_id, round=self.round_id)
+        return crash_point_from_uniform(random.random())
+
+    def _advance(self, now):
+        if self.curve_mode == EXTRAPOLATE:
+            self._advance_curve(now)
+        else:
+            self._advance_walk(now)
+
+    def _advance_curve(self, now):
+        # Все выводы с порогом ниже точки краха успевают сработать
+        if now >= self.crash_time:
+            self._settle_auto_cashouts(self.crash_point)
+            self._crash(now)
+            return
+
+        elapsed = now - self.started_at
+        self.multiplier = multiplier_at(self.curve, elapsed)
+        self.state['current_multiplier'] = floor_hundredths(self.multiplier)
+
+        # Кривая проходит порог ровно в нем, поэтому выплата - по порогу
+        self._settle_auto_cashouts(self.multiplier)
+
+        # Редкие контрольные сообщения вместо multiplier_update каждый тик
+        if now >= self.next_sync:
+            self.next_sync = now + self.sync_interval
+            self.emit('multiplier_sync', {
+                'multiplier': self.state['current_multiplier'],
+                'elapsed': round(elapsed, 3)
+            })
+
+    def _advance_walk(self, now):
+        # Прирост масштабируется под частоту тиков, чтобы скорость
+        # роста не зависела от настройки
+        self.multiplier += walk_step(random.random(), self.tick_interval)
+
+        # Крах проверяем до авто-вывода: множитель выше точки краха
+        # не должен выплачиваться
+        if self.multiplier >= self.crash_point:
+            self._crash(now)
+            return
+
+        self.state['current_multiplier'] = round(self.multiplier, 2)
+        update = {'multiplier': self.state['current_multiplier']}
+        if self.server_time:
+            update['serverTime'] = round(time.time() * 1000, 3)
+        self.emit('multiplier_update', update)
+        self.emit(wire.MULTIPLIER, wire.multiplier(update['multiplier'], update.get('serverTime')))
+
+        # Авто-вывод: только игроки, чей порог пройден на этом тике
+        current = self.state['current_multiplier']
+        self._settle_auto_cashouts(current, payout=current)
+
+    def _settle_auto_cashouts(self, multiplier, payout=None):
+        """Выплаты игрокам, чей порог не выше multiplier; payout=None - по порогу"""
+        started = time.perf_counter()
+        triggered = self.auto_cashouts.pop_crossed(multiplier, self.players)
+        for player in triggered:
+            self._settle_cash_out(player, payout if payout is not None else player.auto_cashout_multiplier)
+        if triggered:
+            AUTO_CASHOUT_SECONDS.observe(time.perf_counter() - started)
+
+    def _crash(self, now):
+        crash_point = self.crash_point
+        self.phase = CRASHED
+        self.state['is_active'] = False
+        self.last_finished_round = self.round_id
+        round_players = self.players.round_players()
+
+        # Сохраняем результат игры
+        game_result = {
+            'id': self.round_id,
+            'multiplier': crash_point,
+            'timestamp': time.time(),
+            'players': [
+                {
+                    'username': p.username,
+                    'bet': p.bet,
+                    'didCashOut': p.did_cash_out,
+                    'cashOutMultiplier': p.cash_out_multiplier,
+                    'profit': cash_out_winnings(p.bet, p.cash_out_multiplier) - p.bet if p.did_cash_out else -p.bet
+                }
+                for p in round_players
+            ]
+        }
+        if self.crash_source is not None and self.round_id <= self.crash_source.last_round:
+            # Раскрываем зерно: по нему игроки проверяют раунд
+            game_result['seed'] = self.crash_source.seed_hex(self.round_id)
+
+        # Добавляем в историю
+        self.state['recent_games'].insert(0, f"{crash_point:.2f}")
+        if len(self.state['recent_games']) > RECENT_GAMES_SIZE:
+            self.state['recent_games'].pop()
+
+        self.history.add(game_result)
+        if self.round_log is not None:
+            self.round_log.append(game_result)
+        leaders = self.leaderboard.add_round(game_result) if self.leaderboard is not None else None
+        if (self.leaderboard is not None and self.round_log is not None
+                and self.round_id % leaderboard_module.SNAPSHOT_ROUNDS == 0):
+            # Снимок ограничивает проигрывание журнала при старте
+            self.round_log.save_leaderboard(self.leaderboard.export(self.round_id))
+
+        # Оповещаем о крахе
+        self._emit_phase('game_crash', {
+            'crashPoint': f"{crash_point:.2f}",
+            'gameResult': game_result
+        })
+        if leaders:
+            # Только топы, которые изменились
+            self.emit('leaderboard_update', leaders)
+
+        # Итоги раунда для программ автоставок
+        if self.auto_bets:
+            for player, result in zip(round_players, game_result['players']):
+                program = self.auto_bets.get(player.id)
+                if program is not None and program.placed:
+                    reason = program.settle(result['profit'])
+                    if reason is not None:
+                        self._stop_auto_bet(player.id, reason)
+
+        # Сбрасываем состояние игроков
+        self.players.reset_round()
+        self.auto_cashouts.clear()
+        self.snapshot.bump()
+
+        # Прием ставок открыт: ставки по программам - сразу, всем разом
+        self._apply_auto_bets()
+
+    def emit(self, event, data=None, to=None):
+        """Отправка события; события состояния получают версию v и попадают в журнал"""
+        if to is not None:
+            return self._send(event, data, to=to)
+        if event in JOURNAL_EVENTS:
+            self.version += 1
+            if isinstance(data, dict):
+                data['v'] = self.version
+            else:
+                # Компактная пачка игроков: [ставки, выводы, v]
+                data.append(self.version)
+            self.journal.append((self.version, event, data))
+            self.snapshot.bump()
+        return self._send(event, data)
+
+    def _events_since(self, version, compact):
+        """События журнала после version в кодировке клиента; None - нужен init_state"""
+        if not isinstance(version, int) or isinstance(version, bool) or version > self.version:
+            return None
+        if self.journal and version < self.journal[0][0] - 1:
+            return None
+        skip = wire.VERBOSE_EVENTS if compact else wire.COMPACT_EVENTS
+        return [[event, data] for v, event, data in self.journal if v > version and event not in skip]
+
+    def _emit_phase(self, event, data):
+        """Событие фазы раунда: накопленные события игроков уходят раньше него"""
+        self.broadcasts.flush()
+        self.emit(event, data)
+
+    def _settle_cash_out(self, player, multiplier):
+        player.did_cash_out = True
+        player.cash_out_multiplier = multiplier
+        winnings = cash_out_winnings(player.bet, multiplier)
+        player.balance += winnings
+        self._record_balance(player, winnings, ledger_module.CASH_OUT)
+        self.snapshot.bump()
+
+        self.emit('cash_out_confirmed', {
+            'multiplier': player.cash_out_multiplier,
+            'winnings': winnings,
+            'balance': player.balance
+        }, to=player.id)
+
+        self.broadcasts.player_cashed_out(player, winnings)
+        return winnings
+
+    def _record_balance(self, player, delta, reason):
+        if self.ledger is not None:
+            self.ledger.record(player.username, delta, player.balance, reason)
+
+    # Команды игроков
+
+    def _build_init_state(self):
+        """Текущее состояние игры для нового клиента"""
+        with self.lock:
+            data = {
+                'isActive': self.state['is_active'],
+                'currentMultiplier': self.state['current_multiplier'],
+                'countdownActive': self.state['countdown_active'],
+                'timeToStart': self.state['time_to_start'],
+                'recentGames': list(self.state['recent_games']),
+                'players': [
+                    {
+                        'id': p.id,
+                        'handle': p.handle,
+                        'username': p.username,
+                        'bet': p.bet,
+                        'didCashOut': p.did_cash_out
+                    } for p in self.players.round_players()
+                ],
+                # Только сводки; детали раундов - по запросу get_history
+                'gameHistory': self.history.recent(),
+                # Версия для resume: события после нее клиент получит из журнала
+                'version': self.version
+            }
+            if self.curve_mode == EXTRAPOLATE:
+                # Идущий раунд клиент начнет рисовать с ближайшего multiplier_sync
+                data['curve'] = self.curve
+            return data
+
+    # Команды игроков
+    #
+    # Все изменения состояния от клиентов проходят через одну очередь и
+    # выполняются пачкой в начале тика, в потоке движка. Поэтому вывод не
+    # попадает между крахом и сбросом раунда и не срабатывает дважды вместе
+    # с авто-выводом, а обработчики не ждут блокировку движка.
+
+    def submit(self, name, *args, callback=None, claim=None):
+        """Ставит команду в очередь; callback(result) вызывается из тика
+
+        claim - threading.Lock: тик выполнит команду, только если захватит
+        его первым (иначе команду уже отменил ждавший ответа, см. _call).
+        """
+        self.commands.append((name, args, callback, claim))
+
+    def register(self, sid, username, balance=None):
+        """balance - баланс, перенесенный с другого стола"""
+        return self._call('register', sid, username, balance)
+
+    def place_bet(self, sid, bet):
+        return self._call('place_bet', sid, bet)
+
+    def cash_out(self, sid, received_at=None):
+        """Вывод по времени сервера в момент получения запроса"""
+        if received_at is None:
+            received_at = time.monotonic()
+        self._enqueue('cash_out', sid, received_at)
+
+    def set_auto_cashout(self, sid, multiplier):
+        self._enqueue('set_auto_cashout', sid, multiplier)
+
+    def disconnect(self, sid):
+        """Удаляет игрока на ближайшем тике; возвращает его для журнала"""
+        player = self.players.get(sid)
+        self._enqueue('disconnect', sid)
+        return player
+
+    def leave(self, sid, switching=False):
+        """Игрок уходит со стола: {'balance': ...}, None или {'error': ...}
+
+        switching - переход за другой стол: пока игрок в раунде, отказ.
+        """
+        return self._call('leave', sid, switching)
+
+    def deposit(self, username, balance):
+        """Баланс игрока, ушедшего со стола другого воркера, - в журнал этого"""
+        self._enqueue('deposit', username, balance)
+
+    def start_auto_bet(self, sid, settings):
+        """Программа автоставок (autobet.py): ставки делает движок каждый раунд"""
+        return self._call('start_auto_bet', sid, settings)
+
+    def stop_auto_bet(self, sid):
+        return self._call('stop_auto_bet', sid)
+
+    def resume(self, sid, token, version=None, compact=False):
+        """Возвращает игрока сессии token новому сокету sid"""
+        return self._call('resume', sid, token, version, compact)
+
+    def _call(self, name, *args):
+        """Команда с ответом: ждет ближайшего тика"""
+        if not self._running:
+            # Без цикла (офлайн-расчеты) - сразу
+            with self.lock:
+                return self.COMMANDS[name](self, *args)
+
+        done = self._new_event()
+        claim = threading.Lock()
+        box = []
+
+        def callback(result):
+            box.append(result)
+            done.set()
+
+        self.submit(name, *args, callback=callback, claim=claim)
+        if done.wait(COMMAND_TIMEOUT):
+            return box[0]
+        if claim.acquire(False):
+            # Тик до команды не дошел: отменяем, чтобы она не выполнилась
+            # после ответа об ошибке
+            return {'error': 'Сервер не ответил'}
+        # Команда уже выполняется - ответ будет в этом же тике
+        if done.wait(COMMAND_TIMEOUT):
+            return box[0]
+        return {'error': 'Сервер не ответил'}
+
+    def _enqueue(self, name, *args):
+        if not self._running:
+            with self.lock:
+                self.COMMANDS[name](self, *args)
+        else:
+            self.submit(name, *args)
+
+    def _drain_commands(self):
+        # Только команды, пришедшие до начала тика: поток новых не задержит тик
+        count = len(self.commands)
+        for _ in range(count):
+            name, args, callback, claim = self.commands.popleft()
+            if claim is not None and not claim.acquire(False):
+                self.commands_cancelled += 1
+                continue
+            try:
+                result = self.COMMANDS[name](self, *args)
+            except Exception as e:
+                log.error('command_failed', room=self.room_id, command=name, error=repr(e))
+                result = {'error': 'Внутренняя ошибка сервера'}
+            if callback is not None:
+                callback(result)
+        if count:
+            COMMAND_BATCH.observe(count)
+            self.commands_processed += count
+
+    def _register(self, sid, username, balance=None):
+        # Имя уходит в журналы: проверяем до записи, а не в потоке журнала
+        error = username_error(username)
+        if error:
+            return {'error': error}
+
+        # Проверка на дублирование имени (по всем столам процесса)
+        if username in self.active_names:
+            return {'error': 'Имя пользователя уже занято'}
+
+        # Вернувшийся игрок получает сохраненный баланс
+        stored = self.ledger.balance(username) if self.ledger is not None else None
+        if balance is not None:
+            # Переход с другого стола: журнал другого воркера мог отстать
+            player = self.players.add(sid, username, balance)
+            if stored != balance:
+                self._record_balance(player, balance - (stored or 0), ledger_module.TRANSFER)
+        elif stored is None:
+            player = self.players.add(sid, username, INITIAL_BALANCE)
+            self._record_balance(player, INITIAL_BALANCE, ledger_module.REGISTER)
+        else:
+            player = self.players.add(sid, username, stored)
+        self.active_names.add(username)
+        player.token = self._new_token()
+        self.sessions[player.token] = player
+
+        # Отправляем подтверждение
+        self.emit('player_registered', {
+            'id': player.id,
+            'username': player.username,
+            'balance': player.balance,
+            'token': player.token
+        }, to=sid)
+
+        log.info('player_registered', room=self.room_id, username=username, sid=sid)
+        return {'success': True}
+
+    def _place_bet(self, sid, bet):
+        player = self.players.get(sid)
+
+        if not player:
+            log.info('bet_rejected', reason='unknown_player', sid=sid)
+            return {'error': 'Пользователь не зарегистрирован'}
+
+        if bet <= 0:
+            log.info('bet_rejected', reason='not_positive', username=player.username, bet=bet)
+            return {'error': 'Ставка должна быть больше 0'}
+
+        limit_error = self._bet_limit_error(bet)
+        if limit_error:
+            return {'error': limit_error}
+
+        if bet > player.balance:
+            log.info('bet_rejected', reason='balance', username=player.username, bet=bet, balance=player.balance)
+            return {'error': 'Недостаточно средств'}
+
+        if not self._betting_open():
+            log.info('bet_rejected', reason='round_active', username=player.username, bet=bet)
+            return {'error': 'Ставки на текущую игру закрыты'}
+
+        if player.in_game:
+            # Например, ставку на раунд уже сделала программа автоставок
+            return {'error': 'Ставка на этот раунд уже сделана'}
+
+        self._accept_bet(player, bet)
+        log.info('bet_accepted', room=self.room_id, username=player.username, bet=bet)
+        return {'success': True}
+
+    def _new_token(self):
+        # Стол - в начале токена: по нему сервер находит движок при resume
+        secret = secrets.token_urlsafe(16)
+        return f'{self.room_id}.{secret}' if self.room_id else secret
+
+    def _bet_limit_error(self, bet):
+        if bet < self.min_bet:
+            return f'Минимальная ставка за этим столом: {self.min_bet}'
+        if self.max_bet is not None and bet > self.max_bet:
+            return f'Максимальная ставка за этим столом: {self.max_bet}'
+        return None
+
+    def _betting_open(self):
+        return self.phase not in (COUNTDOWN, RUNNING)
+
+    def _accept_bet(self, player, bet):
+        """Ставка прошла проверки: списываем и добавляем игрока в раунд"""
+        player.bet = bet
+        player.balance -= bet
+        self._record_balance(player, -bet, ledger_module.BET)
+        player.did_cash_out = False
+        player.cash_out_multiplier = 0
+        player.ready = True
+        self.players.join_round(player)
+        self.snapshot.bump()
+
+        # Отправляем подтверждение
+        self.emit('bet_confirmed', {
+            'bet': player.bet,
+            'balance': player.balance
+        }, to=player.id)
+
+        # Оповещаем всех о новой ставке (в пачке на ближайшем тике)
+        self.broadcasts.player_bet(player)
+
+        # Отсчет начнется на ближайшем тике движка
+        self._round_requested = True
+
+    def _cash_out(self, sid, received_at):
+        if self.phase != RUNNING:
+            return
+
+        player = self.players.get(sid)
+        if not player or not player.in_game or player.did_cash_out:
+            return
+
+        if self.curve_mode == EXTRAPOLATE:
+            # Запрос пришел после краха по кривой, даже если тик еще не наступил
+            if received_at >= self.crash_time:
+                return
+            multiplier = floor_hundredths(multiplier_at(self.curve, received_at - self.started_at))
+        else:
+            # Множитель, который игрок видел последним
+            multiplier = self.state['current_multiplier']
+
+        winnings = self._settle_cash_out(player, multiplier)
+        log.info('cash_out', room=self.room_id, username=player.username,
+                 multiplier=player.cash_out_multiplier, winnings=winnings)
+
+    def _set_auto_cashout(self, sid, multiplier):
+        player = self.players.get(sid)
+        if not player:
+            return
+
+        # NaN в куче ломает порядок: остальные авто-выводы не сработают
+        if (not isinstance(multiplier, (int, float)) or not math.isfinite(multiplier)
+                or multiplier < autobet.MIN_CASHOUT):
+            log.info('auto_cashout_rejected', room=self.room_id, username=player.username)
+            return {'error': f'Авто-вывод должен быть не меньше {autobet.MIN_CASHOUT}'}
+
+        player.auto_cashout_multiplier = multiplier
+        # Порог, заданный во время раунда, сразу попадает в индекс
+        if self.phase == RUNNING and self.players.is_in_round(player):
+            self.auto_cashouts.push(player)
+        self.emit('auto_cashout_set', {
+            'multiplier': player.auto_cashout_multiplier
+        }, to=sid)
+
+    def _disconnect(self, sid):
+        self.auto_bets.pop(sid, None)
+        in_round = sid in self.players.in_round
+        player = self.players.remove(sid)
+        if in_round:
+            self.snapshot.bump()
+        if player is not None:
+            self.active_names.discard(player.username)
+            self.sessions.pop(player.token, None)
+        return player
+
+    def _leave(self, sid, switching=False):
+        # Строка игрока нужна до краша: по ней ставка попадает в
+        # game_result, журнал раундов, историю и таблицу лидеров
+        if switching and sid in self.players.in_round:
+            return {'error': 'Сменить стол можно после окончания раунда'}
+        if sid in self.auto_bets:
+            self._stop_auto_bet(sid, autobet.STOP_LEAVE)
+        player = self._disconnect(sid)
+        if player is None:
+            return None
+        return {'balance': player.balance}
+
+    def _resume(self, sid, token, version=None, compact=False):
+        player = self.sessions.get(token)
+        if player is None:
+            return {'error': 'Сессия не найдена или истекла'}
+
+        previous = player.id
+        if previous != sid:
+            self.players.rekey(previous, sid)
+            if previous in self.auto_bets:
+                self.auto_bets[sid] = self.auto_bets.pop(previous)
+
+        result = {
+            'success': True,
+            'previous': previous,
+            'username': player.username,
+            'balance': player.balance,
+            'token': token,
+            'bet': player.bet,
+            'inGame': player.in_game,
+            'didCashOut': player.did_cash_out,
+            'autoBet': self.auto_bets[sid].info() if sid in self.auto_bets else None,
+            # Значения, которые меняются каждый тик, - текущие, без журнала
+            'isActive': self.state['is_active'],
+            'currentMultiplier': self.state['current_multiplier'],
+            'countdownActive': self.state['countdown_active'],
+            'timeToStart': self.state['time_to_start'],
+            'version': self.version
+        }
+        events = self._events_since(version, compact)
+        if events is None:
+            result['resync'] = True
+        else:
+            result['events'] = events
+        log.info('session_resumed', room=self.room_id, username=player.username, previous=previous, sid=sid)
+        return result
+
+    def _deposit(self, username, balance):
+        stored = self.ledger.balance(username) if self.ledger is not None else None
+        if self.ledger is not None and stored != balance:
+            self.ledger.record(username, balance - (stored or 0), balance, ledger_module.TRANSFER)
+
+    def _start_auto_bet(self, sid, settings):
+        player = self.players.get(sid)
+        if not player:
+            return {'error': 'Пользователь не зарегистрирован'}
+        try:
+            program = autobet.parse(settings)
+        except ValueError as e:
+            return {'error': str(e)}
+
+        limit_error = self._bet_limit_error(program.base_bet)
+        if limit_error:
+            return {'error': limit_error}
+        if program.base_bet > player.balance:
+            return {'error': 'Недостаточно средств'}
+
+        # Новая программа заменяет прежнюю
+        self.auto_bets[sid] = program
+        if program.cashout is not None:
+            self._set_auto_cashout(sid, program.cashout)
+        if self._betting_open() and not player.in_game:
+            self._place_auto_bet(player, program)
+        log.info('auto_bet_started', room=self.room_id, username=player.username,
+                 strategy=program.strategy, bet=program.base_bet)
+        return {'success': True, 'autoBet': program.info()}
+
+    def _stop_auto_bet(self, sid, reason=autobet.STOP_USER):
+        """Снимает программу; ставка уже идущего раунда остается"""
+        program = self.auto_bets.pop(sid, None)
+        if program is None:
+            return {'error': 'Автоставка не запущена'}
+        info = dict(program.info(), reason=reason)
+        self.emit('auto_bet_stopped', info, to=sid)
+        return info
+
+    def _apply_auto_bets(self):
+        """Ставки по всем программам стола, когда открылся прием ставок"""
+        placed = 0
+        for sid, program in list(self.auto_bets.items()):
+            player = self.players.get(sid)
+            if player is None:
+                del self.auto_bets[sid]
+            elif not player.in_game and self._place_auto_bet(player, program):
+                placed += 1
+        if placed:
+            log.info('auto_bets_placed', room=self.room_id, count=placed)
+
+    def _place_auto_bet(self, player, program):
+        bet = program.next_bet
+        if self._bet_limit_error(bet):
+            self._stop_auto_bet(player.id, autobet.STOP_LIMIT)
+            return False
+        if bet > player.balance:
+            self._stop_auto_bet(player.id, autobet.STOP_BALANCE)
+            return False
+        self._accept_bet(player, bet)
+        program.placed = True
+        return True
+
+    COMMANDS = {
+        'register': _register,
+        'place_bet': _place_bet,
+        'cash_out': _cash_out,
+        'set_auto_cashout': _set_auto_cashout,
+        'disconnect': _disconnect,
+        'leave': _leave,
+        'deposit': _deposit,
+        'start_auto_bet': _start_auto_bet,
+        'stop_auto_bet': _stop_auto_bet,
+        'resume': _resume,
+    }
+
+    # Чтение состояния - без очереди
+
+    def init_state(self):
+        """Снимок для нового клиента: готовые байты, пересобираются раз на версию"""
+        if self.broadcasts.legacy:
+            return self.snapshot.get_data()
+        return self.snapshot.get_bytes()
+
+    def get_history(self, cursor=None, limit=10):
+        return self.history.page(cursor, limit)
+
+    def get_leaderboard(self, username=None):
+        """Топы стола; с username - еще и итоги этого игрока"""
+        if self.leaderboard is None:
+            return {'error': 'Таблица лидеров отключена'}
+        result = self.leaderboard.snapshot()
+        if username:
+            result['player'] = self.leaderboard.player_stats(username)
+        return result
+
+    def fairness_info(self):
+        if self.crash_source is None:
+            return None
+        return dict(self.crash_source.info(), lastRound=self.last_finished_round)
+
+    def verify_round(self, round_id):
+        """Проверка завершенного раунда; зерна будущих раундов не раскрываются"""
+        if self.crash_source is None:
+            return {'error': 'Честная игра не включена'}
+        if not 1 <= round_id <= min(self.last_finished_round, self.crash_source.last_round):
+            return {'error': 'Раунд еще не завершен или сыгран без цепочки'}
+        return self.crash_source.verify(round_id)
+
+    def player_name(self, sid):
+        player = self.players.get(sid)
+        return player.username if player else None
+
+    def room_info(self):
+        """Сводка стола для списка столов"""
+        return {
+            'players': len(self.players),
+            'inRound': len(self.players.in_round),
+            'phase': self.phase
+        }
+
+
+def new_game_state(history):
+    return {
+        'is_active': False,
+        'current_multiplier': 1.00,
+        'countdown_active': False,
+        'time_to_start': COUNTDOWN_SECONDS,
+        'players': PlayerRegistry(),
+        'recent_games': [],
+        'game_history': history
+    }
+
+
+def from_env(emit, room=None, ledger=None, active_names=None):
+    """Движок с настройками из переменных окружения
+
+    NOLOVE_TICK_RATE - частота тиков; NOLOVE_LEGACY_BROADCASTS=1 - поштучные
+    события для старых клиентов; NOLOVE_CURVE_MODE=extrapolate - расчет
+    кривой на клиенте; NOLOVE_FAIR_CHAIN - цепочка хешей (fairness.py);
+    журналы раундов и балансов лежат в NOLOVE_DATA_DIR; NOLOVE_SERVER_TIME=1 -
+    время отправки в multiplier_update (для bench.py);
+    NOLOVE_LEADERBOARD_SIZE - длина топов таблицы лидеров.
+
+    room - настройки стола (rooms.py). Журнал раундов у каждого стола свой,
+    цепочка хешей - только у стола по умолчанию. ledger - общий журнал
+    балансов столов процесса (без него открывается журнал из окружения).
+    """
+    room = room or {}
+    default = room.get('default', True)
+    rounds = round_log_module.from_env('rounds' if default else os.path.join('rooms', room['id'], 'rounds'))
+    state = new_game_state(GameHistory(store=rounds))
+    leaders = leaderboard_module.Leaderboard(int(os.environ.get('NOLOVE_LEADERBOARD_SIZE', leaderboard_module.DEFAULT_SIZE)))
+    if rounds is not None:
+        leaders.replay(rounds)
+    return GameEngine(
+        state, emit,
+        tick_rate=float(os.environ.get('NOLOVE_TICK_RATE', DEFAULT_TICK_RATE)),
+        legacy_broadcasts=os.environ.get('NOLOVE_LEGACY_BROADCASTS') == '1',
+        curve_mode=room.get('curveMode') or os.environ.get('NOLOVE_CURVE_MODE', STREAM),
+        curve=room.get('curve') or DEFAULT_CURVE,
+        crash_source=fairness.from_env() if default else None,
+        round_log=rounds,
+        ledger=ledger if ledger is not None else ledger_module.from_env(),
+        server_time=os.environ.get('NOLOVE_SERVER_TIME') == '1',
+        min_bet=room.get('minBet', 1),
+        max_bet=room.get('maxBet'),
+        active_names=active_names,
+        leaderboard=leaders,
+        room_id=room.get('id')
+    )
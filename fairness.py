@@ -0,0 +1,233 @@
+"""
+NoLove Game - Честная игра (provably fair)
+
+Цепочка хешей генерируется заранее: h[0] - случайные 32 байта,
+h[j + 1] = sha256(h[j]). Раунды раскрывают цепочку с конца, поэтому
+раунд k использует зерно, хеш которого равен зерну раунда k - 1,
+а хеш зерна первого раунда (terminal) публикуется до начала игры.
+
+Файл цепочки: заголовок + зерна по 32 байта в порядке раундов.
+Зерно любого раунда читается из mmap за O(1), и так же за O(1)
+проверяется: sha256(зерно k) == зерно k - 1.
+
+Генерация:  python fairness.py generate chain.bin --rounds 1000000
+Проверка:   python fairness.py verify chain.bin --round 42 --salt <соль>
+"""
+import argparse
+import atexit
+import hashlib
+import hmac
+import mmap
+import os
+import struct
+import sys
+
+from curve import crash_point_from_uniform, crash_point_house_edge
+from storage import BackgroundWriter
+
+MAGIC = b'NLFC'
+HEADER = struct.Struct('<4sIQ32s')  # магия, версия, число раундов, terminal
+SEED_SIZE = 32
+FORMAT_VERSION = 1
+
+# 52 бита хеша дают равномерное число с точностью double
+RANDOM_BITS = 52
+RANDOM_SCALE = 2 ** RANDOM_BITS
+
+LEGACY = 'legacy'
+HOUSE_EDGE = 'house_edge'
+HOUSE_EDGE_PERCENT = 1
+
+
+def uniform_from_seed(seed, salt):
+    """Равномерное число в [0, 1) из зерна раунда и публичной соли"""
+    digest = hmac.new(seed, salt.encode('utf-8'), hashlib.sha256).digest()
+    return (int.from_bytes(digest[:8], 'big') >> (64 - RANDOM_BITS)) / RANDOM_SCALE
+
+
+def crash_point_from_seed(seed, salt, distribution=LEGACY):
+    r = uniform_from_seed(seed, salt)
+    if distribution == LEGACY:
+        # Исходное распределение игры: 1 + r^0.65 * 14
+        return crash_point_from_uniform(r)
+    if distribution == HOUSE_EDGE:
+        return crash_point_house_edge(r, HOUSE_EDGE_PERCENT)
+    raise ValueError(f'Неизвестное распределение: {distribution}')
+
+
+def generate_chain(path, rounds, seed=None):
+    """Записывает цепочку из rounds зерен; возвращает terminal (hex)"""
+    current = seed or os.urandom(SEED_SIZE)
+    size = HEADER.size + rounds * SEED_SIZE
+
+    with open(path, 'wb+') as f:
+        f.truncate(size)
+        with mmap.mmap(f.fileno(), size) as m:
+            # h[j] принадлежит раунду rounds - j: пишем с конца файла
+            for j in range(rounds):
+                offset = HEADER.size + (rounds - 1 - j) * SEED_SIZE
+                m[offset:offset + SEED_SIZE] = current
+                current = hashlib.sha256(current).digest()
+            m[:HEADER.size] = HEADER.pack(MAGIC, FORMAT_VERSION, rounds, current)
+            m.flush()
+
+    return current.hex()
+
+
+class HashChain:
+    """Цепочка зерен, отображенная в память"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.rounds, self.terminal = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f'{path}: не файл цепочки NoLove')
+
+    def seed(self, round_id):
+        """Зерно раунда (нумерация с 1)"""
+        if not 1 <= round_id <= self.rounds:
+            raise IndexError(f'Раунд {round_id} вне цепочки из {self.rounds}')
+        offset = HEADER.size + (round_id - 1) * SEED_SIZE
+        return self._mmap[offset:offset + SEED_SIZE]
+
+    def previous_hash(self, round_id):
+        """Значение, с которым сверяется sha256 зерна раунда"""
+        return self.terminal if round_id == 1 else self.seed(round_id - 1)
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+class PositionWriter(BackgroundWriter):
+    """Файл с номером последнего использованного раунда; пишется в фоне"""
+
+    def __init__(self, path):
+        super().__init__(fsync_interval=0, name='fair-position')
+        self.path = path
+
+    def write_batch(self, round_ids):
+        # Из пачки важен только последний номер
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(max(round_ids)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def sync(self):
+        pass
+
+
+class ProvablyFairSource:
+    """Источник точек краха из цепочки хешей
+
+    Номер последнего использованного раунда хранится рядом с цепочкой,
+    чтобы после перезапуска зерна не использовались повторно. Файл
+    пишет фоновый поток (PositionWriter): тик движка только ставит номер
+    в очередь. Номер попадает на диск за миллисекунды, а раунд длится
+    секунды, поэтому зерно раскрытого раунда повторно не используется.
+    """
+
+    def __init__(self, chain, salt, distribution=LEGACY):
+        self.chain = chain
+        self.salt = salt
+        self.distribution = distribution
+        self.position_path = chain.path + '.pos'
+        self.last_round = self._load_position()
+        self._writer = None
+
+    def _load_position(self):
+        try:
+            with open(self.position_path) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _save_position(self, round_id):
+        if self._writer is None:
+            # Поток нужен только игровому серверу, не проверке из консоли
+            self._writer = PositionWriter(self.position_path)
+            self._writer.start()
+            atexit.register(self._writer.stop)
+        self._writer.submit(round_id)
+
+    def crash_point(self, round_id):
+        """Точка краха раунда; None, если цепочка закончилась"""
+        if round_id > self.chain.rounds:
+            return None
+        # Отмечаем зерно использованным до начала раунда (в фоне)
+        self._save_position(round_id)
+        self.last_round = round_id
+        return crash_point_from_seed(self.chain.seed(round_id), self.salt, self.distribution)
+
+    def seed_hex(self, round_id):
+        return self.chain.seed(round_id).hex()
+
+    def info(self):
+        return {
+            'terminal': self.chain.terminal.hex(),
+            'salt': self.salt,
+            'distribution': self.distribution,
+            'rounds': self.chain.rounds
+        }
+
+    def verify(self, round_id):
+        """Проверка раунда за O(1): хеш зерна и пересчет точки краха"""
+        seed = self.chain.seed(round_id)
+        expected = self.chain.previous_hash(round_id)
+        return {
+            'round': round_id,
+            'seed': seed.hex(),
+            'previous': expected.hex(),
+            'hashValid': hashlib.sha256(seed).digest() == expected,
+            'crashPoint': round(crash_point_from_seed(seed, self.salt, self.distribution), 2)
+        }
+
+
+def from_env():
+    """Источник честной игры по NOLOVE_FAIR_CHAIN / _SALT / _DISTRIBUTION или None"""
+    path = os.environ.get('NOLOVE_FAIR_CHAIN')
+    if not path:
+        return None
+    return ProvablyFairSource(
+        HashChain(path),
+        salt=os.environ.get('NOLOVE_FAIR_SALT', ''),
+        distribution=os.environ.get('NOLOVE_FAIR_DISTRIBUTION', LEGACY)
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Цепочка хешей NoLove Game')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    gen = commands.add_parser('generate', help='сгенерировать цепочку')
+    gen.add_argument('path')
+    gen.add_argument('--rounds', type=int, default=1_000_000)
+
+    ver = commands.add_parser('verify', help='проверить раунд')
+    ver.add_argument('path')
+    ver.add_argument('--round', type=int, required=True)
+    ver.add_argument('--salt', default='')
+    ver.add_argument('--distribution', default=LEGACY, choices=[LEGACY, HOUSE_EDGE])
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        terminal = generate_chain(args.path, args.rounds)
+        print(f'Цепочка из {args.rounds} раундов записана в {args.path}')
+        print(f'Опубликуйте terminal: {terminal}')
+        return 0
+
+    chain = HashChain(args.path)
+    source = ProvablyFairSource(chain, args.salt, args.distribution)
+    result = source.verify(args.round)
+    for key, value in result.items():
+        print(f'{key}: {value}')
+    return 0 if result['hashValid'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,42 @@
 import multiprocessing
+import os
+import subprocess
+import sys
 
 bind = "0.0.0.0:8000"
 worker_class = "eventlet"
-workers = 1
+# Клиент подключается только по websocket, поэтому липкие сессии между
+# воркерами не нужны. При workers > 1 воркеры становятся шлюзами, а столы
+# ведут процессы движка (cluster.py): по одному на номер worker из NOLOVE_ROOMS
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
 worker_connections = 1000
 timeout = 300
 keepalive = 2
 
 errorlog = "-"
-loglevel = "debug"
+# debug пишет каждый запрос и кадр синхронно в stderr; свои логи - logs.py
+loglevel = os.environ.get("GUNICORN_LOGLEVEL", "info")
 accesslog = "-"
-access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s"' 
\ No newline at end of file
+access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s"'
+
+engine_processes = []
+
+
+def on_starting(server):
+    import rooms
+
+    if workers < 2:
+        return
+    base = os.environ.setdefault("NOLOVE_ENGINE_SOCKET", "/tmp/nolove-engine.sock")
+    for worker in rooms.worker_ids(rooms.load_configs()):
+        path = rooms.socket_path(base, worker)
+        process = subprocess.Popen([sys.executable, "cluster.py", path, str(worker)])
+        engine_processes.append(process)
+        server.log.info("Процесс движка %s запущен: pid %s, сокет %s", worker, process.pid, path)
+
+
+def on_exit(server):
+    for process in engine_processes:
+        process.terminate()
+    for process in engine_processes:
+        process.wait()
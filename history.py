@@ -0,0 +1,120 @@
+"""
+NoLove Game - История раундов
+"""
+import itertools
+import threading
+from collections import OrderedDict, deque
+
+SUMMARY_SIZE = 1000       # сводок в памяти для пагинации
+INIT_STATE_SIZE = 50      # сводок в init_state
+DETAIL_CACHE_SIZE = 100   # раундов с полным списком игроков
+MAX_PAGE_SIZE = 50
+
+
+def summarize(result):
+    """Короткая сводка раунда без списка игроков"""
+    return {
+        'id': result['id'],
+        'multiplier': result['multiplier'],
+        'timestamp': result['timestamp'],
+        'playerCount': len(result['players']),
+        'totalBet': sum(p['bet'] for p in result['players'])
+    }
+
+
+class GameHistory:
+    """Сводки последних раундов и LRU-кэш полных результатов
+
+    Если деталей раунда нет в кэше, они читаются из store - журнала
+    раундов на диске (round_log.RoundLog) с методами get() и recent().
+    """
+
+    def __init__(self, summary_size=SUMMARY_SIZE, detail_cache_size=DETAIL_CACHE_SIZE, store=None):
+        # Новые раунды слева
+        self.summaries = deque(maxlen=summary_size)
+        self.details = OrderedDict()
+        self.detail_cache_size = detail_cache_size
+        self.store = store
+        self.lock = threading.Lock()
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        if store is not None:
+            # История переживает перезапуск: сводки берем из журнала
+            for result in reversed(store.recent(INIT_STATE_SIZE)):
+                self.summaries.appendleft(summarize(result))
+
+    def __len__(self):
+        return len(self.summaries)
+
+    def add(self, result):
+        with self.lock:
+            self.summaries.appendleft(summarize(result))
+            self._remember(result['id'], result)
+
+    def recent(self, limit=INIT_STATE_SIZE):
+        with self.lock:
+            return list(itertools.islice(self.summaries, limit))
+
+    def get(self, round_id):
+        """Полный результат раунда или None"""
+        with self.lock:
+            result = self.details.get(round_id)
+            if result is not None:
+                self.details.move_to_end(round_id)
+                self.cache_hits += 1
+                return result
+            self.cache_misses += 1
+
+        if self.store is None:
+            return None
+        result = self.store.get(round_id)
+        if result is not None:
+            with self.lock:
+                self._remember(round_id, result)
+        return result
+
+    def page(self, cursor=None, limit=10):
+        """Раунды старше cursor (по убыванию id) с деталями
+
+        Возвращает {'rounds': [...], 'nextCursor': id | None}.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        with self.lock:
+            if not self.summaries:
+                return {'rounds': [], 'nextCursor': None}
+            newest = self.summaries[0]['id']
+            oldest = self.summaries[-1]['id']
+        if self.store is not None:
+            oldest = min(oldest, self.store.first_round_id)
+
+        # id раундов идут подряд, поэтому страница - это просто диапазон id
+        first = newest if cursor is None else min(newest, int(cursor) - 1)
+        last = max(oldest, first - limit + 1)
+
+        rounds = []
+        for round_id in range(first, last - 1, -1):
+            detail = self.get(round_id)
+            if detail is None:
+                summary = self._summary(newest, round_id)
+                if summary is None:
+                    continue
+                detail = dict(summary, players=None)
+            rounds.append(detail)
+
+        next_cursor = last if last > oldest else None
+        return {'rounds': rounds, 'nextCursor': next_cursor}
+
+    def _summary(self, newest, round_id):
+        with self.lock:
+            position = newest - round_id
+            if 0 <= position < len(self.summaries):
+                return self.summaries[position]
+        return None
+
+    def _remember(self, round_id, result):
+        self.details[round_id] = result
+        self.details.move_to_end(round_id)
+        while len(self.details) > self.detail_cache_size:
+            self.details.popitem(last=False)
@@ -0,0 +1,211 @@
+"""
+NoLove Game - Таблица лидеров
+
+Итоги игроков копятся по строкам результата раунда (profit, ставка,
+множитель вывода), которые движок и так считает при крахе. Пересчета
+по истории или по всем игрокам на запрос нет: топ каждого показателя
+хранится отсортированным и обновляется только для участников раунда.
+
+Показатели:
+  profit     - прибыль за все время;
+  daily      - прибыль за текущие сутки (UTC), сбрасывается в полночь;
+  multiplier - лучший множитель, на котором игрок вывел ставку.
+
+После перезапуска итоги берутся из снимка (каждые SNAPSHOT_ROUNDS
+раундов движок сохраняет его в журнал раундов стола), а по журналу
+проигрываются только раунды после снимка.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+DEFAULT_SIZE = 10
+DAY_SECONDS = 86400
+SNAPSHOT_ROUNDS = 1000
+
+PROFIT = 'profit'
+DAILY = 'daily'
+MULTIPLIER = 'multiplier'
+VIEWS = (PROFIT, DAILY, MULTIPLIER)
+
+
+class Ranking:
+    """Все игроки по одному показателю, по убыванию
+
+    Ключи (-значение, имя) лежат в отсортированных корзинах не длиннее
+    2 * BUCKET_SIZE (как в sortedcontainers): корзина ищется bisect по
+    максимумам за O(log n), вставка и удаление сдвигают только ее.
+    """
+
+    BUCKET_SIZE = 256
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self.buckets = []
+        self.maxes = []
+        self.values = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def update(self, username, value):
+        """Новое значение игрока; True, если изменился топ"""
+        old = self.values.get(username)
+        if old == value:
+            return False
+        changed = False
+        if old is not None:
+            changed = self._remove((-old, username))
+        self.values[username] = value
+        return self._insert((-value, username)) or changed
+
+    def _in_top(self, bucket_index, index):
+        position = index
+        for bucket in self.buckets[:bucket_index]:
+            position += len(bucket)
+            if position >= self.size:
+                return False
+        return position < self.size
+
+    def _insert(self, key):
+        if not self.buckets:
+            self.buckets.append([key])
+            self.maxes.append(key)
+            return self.size > 0
+        bucket_index = min(bisect_left(self.maxes, key), len(self.buckets) - 1)
+        bucket = self.buckets[bucket_index]
+        index = bisect_left(bucket, key)
+        bucket.insert(index, key)
+        if index == len(bucket) - 1:
+            self.maxes[bucket_index] = key
+        in_top = self._in_top(bucket_index, index)
+        if len(bucket) > 2 * self.BUCKET_SIZE:
+            half = bucket[self.BUCKET_SIZE:]
+            del bucket[self.BUCKET_SIZE:]
+            self.buckets.insert(bucket_index + 1, half)
+            self.maxes[bucket_index] = bucket[-1]
+            self.maxes.insert(bucket_index + 1, half[-1])
+        return in_top
+
+    def _remove(self, key):
+        bucket_index = bisect_left(self.maxes, key)
+        bucket = self.buckets[bucket_index]
+        index = bisect_left(bucket, key)
+        in_top = self._in_top(bucket_index, index)
+        del bucket[index]
+        if not bucket:
+            del self.buckets[bucket_index]
+            del self.maxes[bucket_index]
+        elif index == len(bucket):
+            self.maxes[bucket_index] = bucket[-1]
+        return in_top
+
+    def top(self):
+        result = []
+        for bucket in self.buckets:
+            for value, username in bucket:
+                if len(result) >= self.size:
+                    return result
+                result.append({'username': username, 'value': -value})
+        return result
+
+    def clear(self):
+        self.buckets.clear()
+        self.maxes.clear()
+        self.values.clear()
+
+
+class Leaderboard:
+    """Итоги игроков стола и топы по показателям"""
+
+    def __init__(self, size=DEFAULT_SIZE):
+        # Имя -> [раундов, сумма ставок, прибыль, лучший множитель]
+        self.totals = {}
+        self.rankings = {view: Ranking(size) for view in VIEWS}
+        self.day = None
+        self.lock = threading.Lock()
+
+    def add_round(self, result):
+        """Учитывает результат раунда; возвращает изменившиеся топы: показатель -> топ"""
+        changed = set()
+        with self.lock:
+            day = int(result['timestamp'] // DAY_SECONDS)
+            if self.day is None or day > self.day:
+                if self.rankings[DAILY]:
+                    changed.add(DAILY)
+                self.rankings[DAILY].clear()
+                self.day = day
+            daily = self.rankings[DAILY] if day == self.day else None
+
+            for row in result['players']:
+                username = row['username']
+                totals = self.totals.get(username)
+                if totals is None:
+                    totals = self.totals[username] = [0, 0, 0, 0.0]
+                totals[0] += 1
+                totals[1] += row['bet']
+                totals[2] += row['profit']
+                if self.rankings[PROFIT].update(username, totals[2]):
+                    changed.add(PROFIT)
+                if daily is not None and row['profit']:
+                    if daily.update(username, daily.values.get(username, 0) + row['profit']):
+                        changed.add(DAILY)
+                if row['didCashOut'] and row['cashOutMultiplier'] > totals[3]:
+                    totals[3] = row['cashOutMultiplier']
+                    if self.rankings[MULTIPLIER].update(username, totals[3]):
+                        changed.add(MULTIPLIER)
+
+            return {view: self.rankings[view].top() for view in changed}
+
+    def export(self, round_id):
+        """Снимок итогов после раунда round_id (копия, для записи в другом потоке)"""
+        with self.lock:
+            return {
+                'round': round_id,
+                'day': self.day,
+                'totals': {username: list(totals) for username, totals in self.totals.items()},
+                'daily': dict(self.rankings[DAILY].values)
+            }
+
+    def load(self, state):
+        """Итоги из снимка export(); возвращает номер его раунда"""
+        with self.lock:
+            self.day = state['day']
+            for username, totals in state['totals'].items():
+                self.totals[username] = totals
+                self.rankings[PROFIT].update(username, totals[2])
+                if totals[3]:
+                    self.rankings[MULTIPLIER].update(username, totals[3])
+            for username, value in state['daily'].items():
+                self.rankings[DAILY].update(username, value)
+        return state['round']
+
+    def replay(self, store):
+        """Итоги по снимку и журналу раундов после него (round_log.RoundLog)"""
+        first = store.first_round_id
+        state = store.load_leaderboard()
+        if state is not None:
+            first = max(first, self.load(state) + 1)
+        for round_id in range(first, store.last_round_id + 1):
+            result = store.get(round_id)
+            if result is not None:
+                self.add_round(result)
+
+    def snapshot(self, now=None):
+        """Все топы для клиента"""
+        day = int((time.time() if now is None else now) // DAY_SECONDS)
+        with self.lock:
+            result = {view: ranking.top() for view, ranking in self.rankings.items()}
+            if self.day is not None and day > self.day:
+                # Полночь прошла, а раунда в новых сутках еще не было:
+                # сброс сделает add_round, а итогов за сегодня пока нет
+                result[DAILY] = []
+            return result
+
+    def player_stats(self, username):
+        with self.lock:
+            totals = self.totals.get(username)
+            if totals is None:
+                return None
+            rounds, wagered, profit, best = totals
+            return {'rounds': rounds, 'wagered': wagered, 'profit': profit, 'bestMultiplier': best}
@@ -0,0 +1,214 @@
+"""
+NoLove Game - Журнал балансов (write-ahead log)
+
+Каждое изменение баланса - запись в ledger.wal: номер, изменение,
+баланс после, причина, имя игрока. Движок копит записи за тик и
+отдает их пачкой (group commit): фоновый поток пишет и делает fsync.
+Периодически поток сохраняет снимок всех балансов в ledger.snap и
+очищает WAL. При старте балансы = снимок + хвост WAL.
+"""
+import atexit
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+import logs
+from storage import BackgroundWriter, write_all
+
+ENTRY = struct.Struct('<QqqBH')  # номер, изменение, баланс после, причина, длина имени
+CRC = struct.Struct('<I')
+
+WAL_NAME = 'ledger.wal'
+SNAPSHOT_NAME = 'ledger.snap'
+SNAPSHOT_INTERVAL = 60.0    # секунд между снимками
+SNAPSHOT_ENTRIES = 100000   # или после стольких записей
+
+# Причины изменения баланса
+REGISTER = 1
+BET = 2
+CASH_OUT = 3
+TRANSFER = 4  # баланс перенесен с другого стола (воркера)
+REASONS = {REGISTER: 'register', BET: 'bet', CASH_OUT: 'cash_out', TRANSFER: 'transfer'}
+
+log = logs.get('ledger')
+
+
+def encode_entry(seq, username, delta, balance, reason):
+    name = username.encode('utf-8')
+    body = ENTRY.pack(seq, delta, balance, reason, len(name)) + name
+    return body + CRC.pack(zlib.crc32(body))
+
+
+def decode_entries(data):
+    """Записи WAL по порядку; останавливается на оборванной записи
+
+    Возвращает (список (seq, username, delta, balance, reason), длина целых записей).
+    """
+    entries = []
+    offset = 0
+    while len(data) - offset >= ENTRY.size + CRC.size:
+        seq, delta, balance, reason, name_len = ENTRY.unpack_from(data, offset)
+        end = offset + ENTRY.size + name_len
+        if len(data) < end + CRC.size:
+            break
+        (crc,) = CRC.unpack_from(data, end)
+        if zlib.crc32(data[offset:end]) != crc:
+            break
+        username = data[offset + ENTRY.size:end].decode('utf-8')
+        entries.append((seq, username, delta, balance, reason))
+        offset = end + CRC.size
+    return entries, offset
+
+
+class Ledger(BackgroundWriter):
+    """Балансы игроков по имени с журналом изменений на диске"""
+
+    def __init__(self, directory, snapshot_interval=SNAPSHOT_INTERVAL, snapshot_entries=SNAPSHOT_ENTRIES):
+        # fsync после каждой пачки: пачка - это один тик движка
+        super().__init__(fsync_interval=0, name='ledger')
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_entries = snapshot_entries
+        os.makedirs(directory, exist_ok=True)
+
+        self.balances = {}
+        self.seq = 0
+        self._pending = []
+        # Журнал общий для всех столов процесса, а у каждого стола свой поток
+        self._record_lock = threading.Lock()
+
+        self._recover()
+
+        # Состояние на диске ведет только фоновый поток
+        self._durable = dict(self.balances)
+        self._durable_seq = self.seq
+        self._entries_since_snapshot = 0
+        self._last_snapshot = time.monotonic()
+
+        self.wal_fd = os.open(self._path(WAL_NAME), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        # Конец последней целой пачки: до него откатывается неудачная запись
+        self.wal_size = os.fstat(self.wal_fd).st_size
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    # Восстановление
+
+    def _recover(self):
+        started = time.monotonic()
+        snapshot_seq = 0
+        try:
+            with open(self._path(SNAPSHOT_NAME)) as f:
+                snapshot = json.load(f)
+            self.balances = snapshot['balances']
+            snapshot_seq = snapshot['seq']
+        except FileNotFoundError:
+            pass
+
+        self.seq = snapshot_seq
+        wal_path = self._path(WAL_NAME)
+        replayed = 0
+        if os.path.exists(wal_path):
+            with open(wal_path, 'rb') as f:
+                data = f.read()
+            entries, valid = decode_entries(data)
+            for seq, username, _, balance, _ in entries:
+                # В записи хранится итоговый баланс, поэтому повтор безопасен
+                if seq > snapshot_seq:
+                    self.balances[username] = balance
+                    self.seq = seq
+                    replayed += 1
+            if valid < len(data):
+                log.warning('wal_tail_truncated', bytes=len(data) - valid)
+                os.truncate(wal_path, valid)
+
+        log.info('ledger_recovered', players=len(self.balances), wal_records=replayed,
+                 seconds=round(time.monotonic() - started, 3))
+
+    # Движки столов
+
+    def balance(self, username):
+        """Сохраненный баланс игрока или None - за O(1)"""
+        return self.balances.get(username)
+
+    def record(self, username, delta, balance, reason):
+        with self._record_lock:
+            self.seq += 1
+            self.balances[username] = balance
+            self._pending.append((self.seq, username, delta, balance, reason))
+
+    def commit(self):
+        """Отдает записи тика фоновому потоку одной пачкой"""
+        with self._record_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            self.submit(batch)
+
+    # Фоновый поток
+
+    def write_batch(self, batches):
+        data = []
+        durable = {}
+        durable_seq = self._durable_seq
+        for batch in batches:
+            for seq, username, delta, balance, reason in batch:
+                data.append(encode_entry(seq, username, delta, balance, reason))
+                durable[username] = balance
+                durable_seq = seq
+        count = len(data)
+        data = b''.join(data)
+        try:
+            write_all(self.wal_fd, data)
+        except OSError:
+            # Часть пачки могла попасть в WAL (например, ENOSPC): откатываем
+            # к концу прошлой пачки, иначе повтор записей ляжет за обрывком
+            os.ftruncate(self.wal_fd, self.wal_size)
+            raise
+        self.wal_size += len(data)
+        # Состояние для снимка - только после успешной записи
+        self._durable.update(durable)
+        self._durable_seq = durable_seq
+        self._entries_since_snapshot += count
+
+    def sync(self):
+        os.fsync(self.wal_fd)
+        if (self._entries_since_snapshot >= self.snapshot_entries
+                or time.monotonic() - self._last_snapshot >= self.snapshot_interval):
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        if not self._entries_since_snapshot:
+            self._last_snapshot = time.monotonic()
+            return
+        tmp_path = self._path(SNAPSHOT_NAME + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'seq': self._durable_seq, 'balances': self._durable}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(SNAPSHOT_NAME))
+
+        # Все записи WAL уже в снимке
+        os.ftruncate(self.wal_fd, 0)
+        self.wal_size = 0
+        self._entries_since_snapshot = 0
+        self._last_snapshot = time.monotonic()
+
+    def close(self):
+        self.commit()
+        self.stop()
+        os.close(self.wal_fd)
+
+
+def from_env(subdir='ledger'):
+    """Журнал балансов в NOLOVE_DATA_DIR/<subdir>; NOLOVE_LEDGER=0 отключает его"""
+    if os.environ.get('NOLOVE_LEDGER', '1') == '0':
+        return None
+    ledger = Ledger(os.path.join(os.environ.get('NOLOVE_DATA_DIR', 'data'), subdir))
+    ledger.start()
+    # Последний fsync и снимок - при выходе процесса
+    atexit.register(ledger.close)
+    return ledger
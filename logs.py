@@ -0,0 +1,253 @@
+"""
+NoLove Game - Структурированные логи
+
+Запись лога - словарь (время, уровень, подсистема, событие и поля), его
+вызывающий кладет в ограниченную очередь и идет дальше. Фоновый поток
+забирает записи пачками и пишет их JSON-строками одним write. Тик
+движка и обработчики не ждут вывода: если очередь полна, запись
+отбрасывается и учитывается в счетчике dropped.
+
+    log = logs.get('engine')
+    log.info('bet_accepted', username=username, bet=bet)
+
+Частые события ограничены по числу записей в секунду на событие
+(NOLOVE_LOG_RATE, 50); пропущенные учитываются в поле suppressed
+следующей записи этого события. Предупреждения и ошибки не
+ограничиваются.
+
+Уровни подсистем - NOLOVE_LOG_LEVELS, например "info,engine=debug,
+cluster=warning" (без имени - для всех). Во время работы их меняет
+запрос /logs?levels=...&token=... с токеном из NOLOVE_LOG_TOKEN (без
+него уровни только показываются). Записи стандартного logging
+(библиотеки) идут тем же путем.
+
+Под eventlet поток записи - настоящий поток ОС (как в eventlet.tpool):
+вывод не блокирует цикл событий.
+"""
+import atexit
+import hmac
+import json
+import logging
+import os
+import sys
+import time
+
+_patcher = sys.modules.get('eventlet.patcher')
+if _patcher is not None and _patcher.is_monkey_patched('thread'):
+    threading = _patcher.original('threading')
+    queue = _patcher.original('queue')
+else:
+    import queue
+    import threading
+
+ROOT = 'nolove'
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_RATE = 50
+BATCH_SIZE = 256
+
+LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+    'critical': logging.CRITICAL
+}
+LEVEL_NAMES = {level: name for name, level in LEVELS.items()}
+
+
+class Writer:
+    """Фоновая запись: ограниченная очередь, вывод пачками"""
+
+    def __init__(self, stream=None, size=DEFAULT_QUEUE_SIZE):
+        self.stream = stream or sys.stdout
+        self.queue = queue.Queue(size)
+        self.dropped = 0
+        self.written = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='nolove-log', daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def put(self, entry):
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < BATCH_SIZE:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            self._write(batch)
+
+    def _write(self, batch):
+        lines = ''.join(json.dumps(entry, ensure_ascii=False, default=str) + '\n' for entry in batch)
+        try:
+            self.stream.write(lines)
+            self.stream.flush()
+        except (OSError, ValueError):
+            self.dropped += len(batch)
+            return
+        self.written += len(batch)
+
+    def flush(self):
+        """Дописывает то, что осталось в очереди (при выходе)"""
+        batch = []
+        try:
+            while True:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        if batch:
+            self._write(batch)
+
+
+class Handler(logging.Handler):
+    """Записи стандартного logging - в ту же очередь"""
+
+    def __init__(self, writer):
+        super().__init__()
+        self.writer = writer
+        # У logging.Handler нет formatException - он есть только у Formatter
+        self.setFormatter(logging.Formatter())
+
+    def emit(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': LEVEL_NAMES.get(record.levelno, record.levelname.lower()),
+            'logger': record.name,
+            'event': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatter.formatException(record.exc_info)
+        self.writer.put(entry)
+
+
+class Logger:
+    """Логгер подсистемы; уровень - у logging.getLogger('nolove.<имя>')"""
+
+    def __init__(self, name):
+        self.name = name
+        self.logger = logging.getLogger(f'{ROOT}.{name}')
+        # событие -> [секунда, записей за секунду, пропущено]
+        self.windows = {}
+
+    def log(self, level, event, fields):
+        if not self.logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING:
+            now = int(time.monotonic())
+            window = self.windows.get(event)
+            if window is None or window[0] != now:
+                suppressed = window[2] if window is not None else 0
+                window = self.windows[event] = [now, 0, 0]
+                if suppressed:
+                    fields['suppressed'] = suppressed
+            if window[1] >= _rate:
+                window[2] += 1
+                _stats['suppressed'] += 1
+                return
+            window[1] += 1
+
+        entry = {'ts': round(time.time(), 3), 'level': LEVEL_NAMES[level], 'logger': self.name, 'event': event}
+        entry.update(fields)
+        if _writer is not None:
+            _writer.put(entry)
+        else:
+            # Без configure() (утилиты, проверки) - обычный logging
+            self.logger.log(level, '%s %s', event, fields)
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self.log(logging.ERROR, event, fields)
+
+
+_writer = None
+_rate = DEFAULT_RATE
+_stats = {'suppressed': 0}
+_loggers = {}
+
+
+def get(name):
+    """Логгер подсистемы name (engine, server, cluster...)"""
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = _loggers[name] = Logger(name)
+    return logger
+
+
+def configure(stream=None):
+    """Включает фоновую запись (один раз на процесс) и уровни из окружения"""
+    global _writer, _rate
+    if _writer is not None:
+        return _writer
+    _rate = int(os.environ.get('NOLOVE_LOG_RATE', DEFAULT_RATE))
+    _writer = Writer(stream, int(os.environ.get('NOLOVE_LOG_QUEUE', DEFAULT_QUEUE_SIZE)))
+    _writer.start()
+
+    root = logging.getLogger()
+    root.handlers = [Handler(_writer)]
+    root.setLevel(logging.WARNING)
+    logging.getLogger(ROOT).setLevel(logging.INFO)
+    set_levels(os.environ.get('NOLOVE_LOG_LEVELS', ''))
+    return _writer
+
+
+def set_levels(spec):
+    """Уровни из строки "info,engine=debug"; ValueError - при ошибке в строке"""
+    changes = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, level = item.rpartition('=')
+        if level.lower() not in LEVELS:
+            raise ValueError(f'Неизвестный уровень {level}')
+        changes.append((f'{ROOT}.{name}' if name else ROOT, LEVELS[level.lower()]))
+    for name, level in changes:
+        logging.getLogger(name).setLevel(level)
+
+
+def levels():
+    """Уровни подсистем: имя -> уровень ('' - общий)"""
+    result = {'': LEVEL_NAMES.get(logging.getLogger(ROOT).getEffectiveLevel())}
+    for name in _loggers:
+        result[name] = LEVEL_NAMES.get(logging.getLogger(f'{ROOT}.{name}').getEffectiveLevel())
+    return result
+
+
+def stats():
+    return {
+        'queued': _writer.queue.qsize() if _writer is not None else 0,
+        'written': _writer.written if _writer is not None else 0,
+        'dropped': _writer.dropped if _writer is not None else 0,
+        'suppressed': _stats['suppressed']
+    }
+
+
+def control(spec=None, token=None):
+    """Запрос /logs: (статус, ответ); spec - смена уровней, нужен NOLOVE_LOG_TOKEN"""
+    if spec:
+        expected = os.environ.get('NOLOVE_LOG_TOKEN')
+        if not expected or not hmac.compare_digest((token or '').encode(), expected.encode()):
+            return 403, {'error': 'Смена уровней не разрешена'}
+        try:
+            set_levels(spec)
+        except ValueError as e:
+            return 400, {'error': str(e)}
+    return 200, dict(stats(), levels=levels())
@@ -0,0 +1,303 @@
+"""
+NoLove Game - Метрики в формате Prometheus
+
+Гистограммы с фиксированными корзинами, датчики (gauge) и счетчики,
+которые считаются при запросе /metrics. Запись в гистограмму - bisect и
+два сложения под блокировкой, поэтому метрики можно держать включенными.
+
+Шлюз (cluster.py) добавляет к своим метрикам метрики процессов движка:
+ряды гистограмм и значения с одинаковыми именами складываются.
+"""
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+
+import logs
+import wire
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Корзины, секунды и байты
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 4096, 16384, 65536, 262144)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Гистограмма, при необходимости с одной меткой (например, событие)"""
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, label=None):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.label = label
+        # значение метки -> [счетчики по корзинам (+Inf последняя), сумма]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_value=None):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def totals(self):
+        """значение метки -> (число наблюдений, сумма)"""
+        with self._lock:
+            return {key: (sum(counts), total) for key, (counts, total) in self._series.items()}
+
+    def export(self):
+        """Ряды для другого процесса: [[метка, счетчики, сумма], ...]"""
+        with self._lock:
+            return [[key, list(counts), total] for key, (counts, total) in self._series.items()]
+
+    def render(self, remote=()):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        merged = {}
+        for label_value, counts, total in [row for rows in remote for row in rows] + self.export():
+            series = merged.get(label_value)
+            if series is None:
+                merged[label_value] = [counts, total]
+            else:
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+        series = [(key, counts, total) for key, (counts, total) in merged.items()]
+        for label_value, counts, total in sorted(series, key=lambda s: str(s[0])):
+            labels = f'{self.label}="{label_value}",' if self.label else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}le="{_format_value(bound)}"}} {cumulative}')
+            suffix = '{' + labels.rstrip(',') + '}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {total}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """Значение берется функцией в момент запроса; без функции - set/inc/dec
+
+    aggregate=False - значение только этого процесса (в шлюзе не
+    складывается со значениями процессов движка).
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, fn=None, aggregate=True):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.aggregate = aggregate
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def export(self):
+        return self.fn() if self.fn is not None else self.value
+
+    def render(self, remote=()):
+        value = self.export() + sum(remote)
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}',
+                f'{self.name} {value}']
+
+
+class Counter(Gauge):
+    """Монотонный счетчик (имена *_total): в Prometheus - rate()/increase()"""
+
+    type = 'counter'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        # Функции, которые возвращают export() другого процесса или None
+        self.sources = []
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS, label=None):
+        return self._register(Histogram(name, documentation, buckets, label))
+
+    def gauge(self, name, documentation, fn=None, aggregate=True):
+        return self._register(Gauge(name, documentation, fn, aggregate))
+
+    def counter(self, name, documentation, fn=None):
+        return self._register(Counter(name, documentation, fn))
+
+    def _register(self, metric):
+        # Повторная регистрация (перезагрузка модуля) возвращает существующую
+        return self.metrics.setdefault(metric.name, metric)
+
+    def add_source(self, fetch):
+        if fetch not in self.sources:
+            self.sources.append(fetch)
+
+    def export(self):
+        """Метрики процесса для шлюза: имя -> ряды или значение"""
+        return {name: metric.export() for name, metric in self.metrics.items()
+                if getattr(metric, 'aggregate', True)}
+
+    def render(self):
+        remote = [exported for exported in (fetch() for fetch in self.sources) if exported]
+        lines = []
+        for name, metric in self.metrics.items():
+            if getattr(metric, 'aggregate', True):
+                lines.extend(metric.render([exported[name] for exported in remote if name in exported]))
+            else:
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    'nolove_handler_duration_seconds', 'Время обработчика события Socket.IO', label='event')
+EMIT_SECONDS = REGISTRY.histogram(
+    'nolove_emit_duration_seconds', 'Время рассылки события всем клиентам', label='event')
+BROADCAST_BYTES = REGISTRY.histogram(
+    'nolove_broadcast_bytes', 'Размер рассылаемого события', SIZE_BUCKETS, label='event')
+CONNECTED_SOCKETS = REGISTRY.gauge(
+    'nolove_connected_sockets', 'Подключенные сокеты')
+REGISTRY.gauge('nolove_threads', 'Потоки процесса', threading.active_count, aggregate=False)
+
+
+def wire_bytes_saved():
+    """Сколько байт частых событий сэкономил один клиент с компактной кодировкой
+
+    Подробная и компактная формы рассылаются на каждом тике обе, поэтому
+    разница сумм размеров их пакетов - экономия на клиента.
+    """
+    saved = 0
+    for event, (count, total) in BROADCAST_BYTES.totals().items():
+        if event in wire.VERBOSE_EVENTS:
+            saved += total
+        elif event in wire.COMPACT_EVENTS:
+            saved -= total
+    return int(saved)
+
+
+REGISTRY.gauge('nolove_wire_bytes_saved',
+               'Байт, сэкономленных компактной кодировкой на одного клиента (rate() - байт/с)',
+               wire_bytes_saved)
+
+
+REGISTRY.gauge('nolove_log_queue', 'Записи лога в очереди на запись', lambda: logs.stats()['queued'])
+REGISTRY.counter('nolove_log_dropped_total', 'Записи лога, отброшенные из-за полной очереди',
+                 lambda: logs.stats()['dropped'])
+REGISTRY.counter('nolove_log_suppressed_total', 'Записи лога, пропущенные ограничением частоты',
+                 lambda: logs.stats()['suppressed'])
+
+
+def render():
+    return REGISTRY.render()
+
+
+def timed_handler(event):
+    """Декоратор обработчика Socket.IO (обычного или async): время по типу события"""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args)
+                finally:
+                    HANDLER_SECONDS.observe(time.perf_counter() - started, event)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args):
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                HANDLER_SECONDS.observe(time.perf_counter() - started, event)
+        return wrapper
+    return decorator
+
+
+def instrument_emit(emit):
+    """Оборачивает emit: время и размер широковещательных событий
+
+    Размер - длина пакета, который уже закодировал emit (его возвращает
+    outbound.ClientQueues); сам wrapper событие не сериализует. Адресные
+    события (to=sid) не меряются: их много, и они дешевые.
+    """
+    @functools.wraps(emit)
+    def wrapper(event, data=None, to=None, **kwargs):
+        if to is not None:
+            return emit(event, data, to=to, **kwargs)
+        started = time.perf_counter()
+        size = emit(event, data, **kwargs)
+        EMIT_SECONDS.observe(time.perf_counter() - started, event)
+        if isinstance(size, int):
+            BROADCAST_BYTES.observe(size, event)
+        return size
+    return wrapper
+
+
+def register_outbound(queues):
+    """Датчики исходящих очередей клиентов (outbound.ClientQueues)"""
+    REGISTRY.gauge('nolove_outbound_queue_depth_max', 'Самая длинная очередь пакетов клиента',
+                   lambda: max(queues.depths(), default=0))
+    REGISTRY.gauge('nolove_outbound_queue_depth_sum', 'Пакеты в очередях всех клиентов',
+                   lambda: sum(queues.depths()))
+    REGISTRY.gauge('nolove_outbound_congested_clients', 'Клиенты с очередью от порога',
+                   lambda: sum(1 for depth in queues.depths() if depth >= queues.limit))
+    REGISTRY.gauge('nolove_outbound_pending_clients', 'Клиенты с отложенными событиями',
+                   lambda: len(queues.pending.keys() | queues.backlog.keys()))
+    REGISTRY.counter('nolove_outbound_collapsed_total', 'Частые события, замененные более новыми',
+                     lambda: queues.collapsed)
+    REGISTRY.counter('nolove_outbound_deferred_total', 'События, отложенные до разгрузки очереди клиента',
+                     lambda: queues.deferred)
+    REGISTRY.counter('nolove_outbound_dropped_total', 'Отложенные события, вытесненные более новыми',
+                     lambda: queues.dropped)
+    REGISTRY.counter('nolove_outbound_disconnected_total', 'Клиенты, отключенные из-за переполненной очереди',
+                     lambda: queues.disconnected)
+
+
+def register_engines(engines):
+    """Датчики игроков по всем столам этого процесса"""
+    engines = list(engines)
+    REGISTRY.gauge('nolove_registered_players', 'Зарегистрированные игроки',
+                   lambda: sum(len(e.players) for e in engines))
+    REGISTRY.gauge('nolove_round_players', 'Игроки в текущем раунде',
+                   lambda: sum(len(e.players.in_round) for e in engines))
+    REGISTRY.gauge('nolove_command_queue', 'Команды игроков в очереди до ближайшего тика',
+                   lambda: sum(len(e.commands) for e in engines))
+    REGISTRY.gauge('nolove_auto_bets', 'Запущенные программы автоставок',
+                   lambda: sum(len(e.auto_bets) for e in engines))
+    REGISTRY.gauge('nolove_rooms', 'Столы в этом процессе', lambda: len(engines))
+    # Пачки событий игроков (broadcast.BroadcastBatcher)
+    REGISTRY.counter('nolove_player_events_total', 'События игроков (ставки и выводы) для рассылки',
+                     lambda: sum(e.broadcasts.events_queued for e in engines))
+    REGISTRY.counter('nolove_player_emits_total', 'Рассылки событий игроков (пачкой или по одному)',
+                     lambda: sum(e.broadcasts.emits_sent for e in engines))
+    REGISTRY.counter('nolove_player_emits_saved_total', 'Рассылки, сэкономленные пачками: кадр на каждый сокет',
+                     lambda: sum(e.broadcasts.emits_saved for e in engines))
+
+
+def register_cluster(engines):
+    """Шлюз: метрики процессов движка (тик, игроки, очередь команд) в его /metrics
+
+    engines - cluster.RemoteEngine; с каждого процесса движка метрики
+    запрашиваются при каждом /metrics.
+    """
+    register_engines(())
+    for client in {engine.client for engine in engines}:
+        REGISTRY.add_source(client.metrics)
@@ -1,288 +1,215 @@
 """
 NoLove Game - Сервер
 """
-from flask import Flask, send_from_directory, request
-from flask_socketio import SocketIO, emit
+from flask import Flask, Response, request, jsonify
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
 import os
 import random
-import math
-import time
 import json
-import threading
+
+from assets import AssetStore
+import chat
+import cluster
+import logs
+import metrics
+import outbound
+import rooms
+import wire
 
 # Настройка Flask и Socket.IO
-app = Flask(__name__, static_folder='.')
+# Статику отдает assets.AssetStore, встроенная раздача Flask выключена
+app = Flask(__name__, static_folder=None)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-here')
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', logger=True, engineio_logger=True)
+# Логи Socket.IO выключены: каждое событие и пакет писались бы в stdout.
+# Свои логи - JSON-строками из фонового потока (см. logs.py)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', logger=False, engineio_logger=False)
+logs.configure()
+log = logs.get('server')
+
+# Разрешенные файлы в памяти, заранее сжатые (см. assets.py)
+assets = AssetStore(os.path.dirname(os.path.abspath(__file__)))
 
-# Состояние игры
-game_state = {
-    'is_active': False,
-    'current_multiplier': 1.00,
-    'countdown_active': False,
-    'time_to_start': 5,
-    'players': [],
-    'recent_games': [],
-    'game_history': []
-}
+# Столы: у каждого свой игровой цикл, настройки из окружения (см. rooms.py).
+# С NOLOVE_ENGINE_SOCKET этот процесс - шлюз: столы ведут отдельные
+# процессы движка (cluster.py), а здесь только клиенты и рассылка
+room_configs = rooms.load_configs()
+engine_socket = os.environ.get('NOLOVE_ENGINE_SOCKET')
+# Рассылка в комнаты - с учетом очередей медленных клиентов (см. outbound.py)
+client_queues = outbound.from_env(socketio.server)
+metrics.register_outbound(client_queues)
+if engine_socket:
+    engines = cluster.connect_rooms(room_configs, engine_socket, client_queues.emit)
+    # Тик, игроки и очередь команд - с процессов движка (см. metrics.register_cluster)
+    metrics.register_cluster(engines.values())
+    lobby = rooms.Lobby(room_configs, engines)
+    chat_room = cluster.RemoteChat(lobby.default_engine.client, lobby.username)
+else:
+    broadcast = metrics.instrument_emit(client_queues.emit)
+    engines = rooms.build_engines(room_configs, broadcast)
+    metrics.register_engines(engines.values())
+    lobby = rooms.Lobby(room_configs, engines)
+    # Чат общий для всех столов: лимит на отправителя и рассылка пачками (см. chat.py)
+    chat_room = chat.from_env(broadcast, lobby.username)
 
 # Маршруты Flask
 @app.route('/')
 def index():
-    return send_from_directory('.', 'nolove.html')
+    return assets.flask_response('nolove.html')
+
+@app.route('/fair')
+def fair_info():
+    info = lobby.default_engine.fairness_info()
+    if info is None:
+        return jsonify({'error': 'Честная игра не включена'}), 404
+    return jsonify(info)
+
+@app.route('/fair/verify/<int:round_id>')
+def fair_verify(round_id):
+    result = lobby.default_engine.verify_round(round_id)
+    return jsonify(result), 400 if 'error' in result else 200
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+@app.route('/logs')
+def logs_endpoint():
+    # Уровни логов подсистем и счетчики; ?levels=engine=debug&token=... - смена уровней
+    status, body = logs.control(request.args.get('levels'), request.args.get('token'))
+    return jsonify(body), status
 
 @app.route('/<path:path>')
 def serve_static(path):
-    return send_from_directory('.', path)
+    return assets.flask_response(path)
 
 # События Socket.IO
 @socketio.on('connect')
 def handle_connect():
-    print(f'Новое подключение: {request.sid}')
+    log.info('connected', sid=request.sid)
+    metrics.CONNECTED_SOCKETS.inc()
+    for engine in engines.values():
+        engine.start(socketio)
+    chat_room.start(socketio)
+    lobby.start(socketio)
+    # Новый клиент садится за стол по умолчанию
+    for room in lobby.connect(request.sid, wire.wants_compact(request.args.get('wire'))):
+        join_room(room)
     # Отправляем текущее состояние
-    emit('init_state', {
-        'isActive': game_state['is_active'],
-        'currentMultiplier': game_state['current_multiplier'],
-        'countdownActive': game_state['countdown_active'],
-        'timeToStart': game_state['time_to_start'],
-        'recentGames': game_state['recent_games'],
-        'players': [
-            {
-                'id': p['id'],
-                'username': p['username'],
-                'bet': p['bet'],
-                'didCashOut': p.get('did_cash_out', False)
-            } for p in game_state['players'] if p.get('in_game', False)
-        ],
-        'gameHistory': game_state['game_history']
-    })
+    # (клиенту с сессией - только если resume не удастся)
+    if not request.args.get('session'):
+        emit('init_state', lobby.engine_for(request.sid).init_state())
+    emit('chat_history', chat_room.recent())
 
 @socketio.on('register_player')
+@metrics.timed_handler('register_player')
 def handle_register_player(data):
-    username = data.get('username', f'Гость{random.randint(100, 999)}')
-    
-    # Добавляем игрока
-    player = {
-        'id': request.sid,
-        'username': username,
-        'balance': 1000,
-        'bet': 0,
-        'in_game': False,
-        'did_cash_out': False,
-        'cash_out_multiplier': 0,
-        'ready': False
-    }
-    
-    game_state['players'].append(player)
-    
-    # Отправляем подтверждение
-    emit('player_registered', {
-        'id': player['id'],
-        'username': player['username'],
-        'balance': player['balance']
-    })
-    
-    print(f'Игрок зарегистрирован: {username}')
-    return {'success': True}
+    username = data.get('username') if isinstance(data, dict) else None
+    if username is None:
+        username = f'Гость{random.randint(100, 999)}'
+    elif isinstance(username, str):
+        username = username.strip()
+    # Остальное (тип, длина) проверяет движок
+    return lobby.register(request.sid, username)
 
 @socketio.on('place_bet')
+@metrics.timed_handler('place_bet')
 def handle_place_bet(data):
-    # Находим игрока
-    player = next((p for p in game_state['players'] if p['id'] == request.sid), None)
-    
-    if not player:
-        return {'error': 'Игрок не найден'}
-    
     try:
         bet = int(data['bet'])
     except (ValueError, KeyError, TypeError):
         return {'error': 'Неверная сумма ставки'}
     
-    if bet <= 0 or bet > player['balance']:
-        return {'error': 'Недостаточно средств'}
-    
-    if game_state['is_active'] or game_state['countdown_active']:
-        return {'error': 'Игра уже идет'}
-    
-    # Обновляем данные игрока
-    player['bet'] = bet
-    player['balance'] -= bet
-    player['in_game'] = True
-    player['did_cash_out'] = False
-    player['cash_out_multiplier'] = 0
-    player['ready'] = True
-    
-    # Отправляем подтверждение
-    emit('bet_confirmed', {
-        'bet': player['bet'],
-        'balance': player['balance']
-    })
-    
-    # Оповещаем всех
-    socketio.emit('player_bet', {
-        'id': player['id'],
-        'username': player['username'],
-        'bet': player['bet']
-    })
-    
-    # Если первая ставка, начинаем отсчет
-    if not game_state['countdown_active'] and not game_state['is_active']:
-        start_countdown()
+    return lobby.engine_for(request.sid).place_bet(request.sid, bet)
+
+@socketio.on('get_history')
+@metrics.timed_handler('get_history')
+def handle_get_history(data=None):
+    data = data or {}
+    try:
+        cursor = data.get('cursor')
+        cursor = int(cursor) if cursor is not None else None
+        limit = int(data.get('limit', 10))
+    except (TypeError, ValueError, AttributeError):
+        return {'error': 'Некорректный запрос истории'}
     
-    return {'success': True}
+    return lobby.engine_for(request.sid).get_history(cursor, limit)
+
+@socketio.on('get_leaderboard')
+@metrics.timed_handler('get_leaderboard')
+def handle_get_leaderboard(data=None):
+    return lobby.engine_for(request.sid).get_leaderboard(lobby.username(request.sid))
 
 @socketio.on('cash_out')
+@metrics.timed_handler('cash_out')
 def handle_cash_out():
-    if not game_state['is_active']:
-        return
-    
-    player = next((p for p in game_state['players'] if p['id'] == request.sid), None)
-    
-    if not player or not player['in_game'] or player['did_cash_out']:
-        return
-    
-    # Фиксируем выигрыш
-    player['did_cash_out'] = True
-    player['cash_out_multiplier'] = game_state['current_multiplier']
-    winnings = math.floor(player['bet'] * player['cash_out_multiplier'])
-    player['balance'] += winnings
-    
-    # Отправляем подтверждение
-    emit('cash_out_confirmed', {
-        'multiplier': player['cash_out_multiplier'],
-        'winnings': winnings,
-        'balance': player['balance']
-    })
-    
-    # Оповещаем всех
-    socketio.emit('player_cashed_out', {
-        'id': player['id'],
-        'username': player['username'],
-        'bet': player['bet'],
-        'multiplier': player['cash_out_multiplier'],
-        'winnings': winnings
-    })
+    lobby.engine_for(request.sid).cash_out(request.sid)
 
-@socketio.on('disconnect')
-def handle_disconnect():
-    for i, player in enumerate(game_state['players']):
-        if player['id'] == request.sid:
-            print(f'Игрок отключился: {player["username"]}')
-            game_state['players'].pop(i)
-            break
+@socketio.on('start_auto_bet')
+@metrics.timed_handler('start_auto_bet')
+def handle_start_auto_bet(data):
+    # Программа автоставок: дальше ставки каждый раунд делает движок
+    return lobby.engine_for(request.sid).start_auto_bet(request.sid, data)
 
-# Функции игры
-def start_countdown():
-    if game_state['countdown_active']:
-        return
-    
-    game_state['countdown_active'] = True
-    game_state['time_to_start'] = 5
-    
-    socketio.emit('countdown_start', {'timeLeft': game_state['time_to_start']})
-    
-    # Запускаем отсчет в отдельном потоке
-    def countdown_thread():
-        for i in range(game_state['time_to_start'], 0, -1):
-            time.sleep(1)
-            game_state['time_to_start'] = i
-            socketio.emit('countdown_update', {'timeLeft': i})
-        
-        game_state['countdown_active'] = False
-        start_game()
-    
-    threading.Thread(target=countdown_thread, daemon=True).start()
+@socketio.on('stop_auto_bet')
+@metrics.timed_handler('stop_auto_bet')
+def handle_stop_auto_bet(data=None):
+    return lobby.engine_for(request.sid).stop_auto_bet(request.sid)
 
-def start_game():
-    game_state['is_active'] = True
-    game_state['current_multiplier'] = 1.00
-    
-    # Определяем точку краха (от 1.1 до 15)
-    crash_point = 1 + math.pow(random.random(), 0.65) * 14
-    
-    print(f'Новая игра начата. Точка краха: {crash_point:.2f}x')
-    
-    # Уведомляем о начале игры
-    active_players = [
-        {
-            'id': p['id'],
-            'username': p['username'],
-            'bet': p['bet']
-        }
-        for p in game_state['players'] if p['in_game']
-    ]
-    
-    socketio.emit('game_start', {'activePlayers': active_players})
-    
-    # Запускаем игру в отдельном потоке
-    def game_thread():
-        while game_state['is_active'] and game_state['current_multiplier'] < crash_point:
-            time.sleep(0.1)
-            
-            # Увеличиваем множитель
-            game_state['current_multiplier'] += random.random() * 0.05 + 0.01
-            game_state['current_multiplier'] = round(game_state['current_multiplier'], 2)
-            
-            # Отправляем обновление
-            socketio.emit('multiplier_update', {'multiplier': game_state['current_multiplier']})
-        
-        # Игра закончилась
-        handle_crash(crash_point)
-    
-    threading.Thread(target=game_thread, daemon=True).start()
+@socketio.on('chat_message')
+@metrics.timed_handler('chat_message')
+def handle_chat_message(data):
+    message = data.get('message') if isinstance(data, dict) else None
+    return chat_room.post(request.sid, message)
 
-def handle_crash(crash_point):
-    game_state['is_active'] = False
-    
-    # Сохраняем результат
-    game_result = {
-        'multiplier': crash_point,
-        'timestamp': time.time(),
-        'players': [
-            {
-                'username': p['username'],
-                'bet': p['bet'],
-                'didCashOut': p['did_cash_out'],
-                'cashOutMultiplier': p.get('cash_out_multiplier', 0),
-                'profit': (math.floor(p['bet'] * p['cash_out_multiplier']) - p['bet']) 
-                         if p['did_cash_out'] else -p['bet']
-            }
-            for p in game_state['players'] if p['in_game']
-        ]
-    }
-    
-    # Обновляем историю
-    game_state['recent_games'].insert(0, f"{crash_point:.2f}")
-    if len(game_state['recent_games']) > 10:
-        game_state['recent_games'].pop()
-    
-    game_state['game_history'].insert(0, game_result)
-    if len(game_state['game_history']) > 50:
-        game_state['game_history'].pop()
-    
-    # Оповещаем о крахе
-    socketio.emit('game_crash', {
-        'crashPoint': f"{crash_point:.2f}",
-        'gameResult': game_result
-    })
-    
-    # Сбрасываем статусы игроков
-    for player in game_state['players']:
-        if player.get('in_game', False):
-            player['in_game'] = False
-            player['bet'] = 0
-            player['did_cash_out'] = False
-            player['cash_out_multiplier'] = 0
-    
-    # Если есть игроки, запускаем новую игру через 3 секунды
-    def next_game_timer():
-        time.sleep(3)
-        if any(p.get('ready', False) for p in game_state['players']):
-            start_countdown()
-    
-    threading.Thread(target=next_game_timer, daemon=True).start()
+@socketio.on('list_rooms')
+@metrics.timed_handler('list_rooms')
+def handle_list_rooms(data=None):
+    return lobby.list()
+
+@socketio.on('join_room')
+@metrics.timed_handler('join_room')
+def handle_join_room(data):
+    room_id = data.get('room') if isinstance(data, dict) else None
+    return switch_room(room_id)
+
+@socketio.on('leave_room')
+@metrics.timed_handler('leave_room')
+def handle_leave_room(data=None):
+    # Уйти из-за стола - вернуться за стол по умолчанию
+    return switch_room(lobby.default)
+
+@socketio.on('resume')
+@metrics.timed_handler('resume')
+def handle_resume(data):
+    data = data if isinstance(data, dict) else {}
+    result = lobby.resume(request.sid, data.get('token'), data.get('version'), join_room, leave_room)
+    if 'error' in result or result.get('resync'):
+        # Сессии нет или журнал уже не покрывает пропуск: полное состояние
+        emit('init_state', lobby.engine_for(request.sid).init_state())
+    return result
+
+def switch_room(room_id):
+    def leave(room):
+        leave_room(room)
+        # Отложенные пакеты старого стола за новым уже не нужны
+        client_queues.reset(request.sid)
+
+    result = lobby.join(request.sid, room_id, join_room, leave)
+    if lobby.room_of(request.sid) == room_id:
+        # Состояние нового стола; баланс придет в player_registered
+        emit('init_state', lobby.engine_for(request.sid).init_state())
+    return result
+
+@socketio.on('disconnect')
+@metrics.timed_handler('disconnect')
+def handle_disconnect():
+    metrics.CONNECTED_SOCKETS.dec()
+    username = lobby.disconnect(request.sid)
+    client_queues.forget(request.sid)
+    if username:
+        log.info('disconnected', username=username, sid=request.sid)
 
 if __name__ == "__main__":
     port = int(os.environ.get('PORT', 8000))
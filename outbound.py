@@ -0,0 +1,223 @@
+"""
+NoLove Game - Исходящие очереди клиентов
+
+Socket.IO складывает пакеты каждого клиента в его очередь engine.io, а
+поток записи отправляет их в сокет. У клиента на медленной связи очередь
+растет: в ней копятся устаревшие множители, а game_crash, который ему
+действительно нужен, стоит за ними.
+
+Широковещательные события стола идут через ClientQueues, которая смотрит
+на глубину очереди каждого получателя:
+  - частые события (множитель, таймер) при глубине от limit не ставятся
+    в очередь, а запоминаются по одному на событие - последнее значение;
+  - прочие события (пачки игроков, чат) при глубине от limit ждут в
+    отложенном списке клиента не длиннее limit: старые вытесняются;
+  - отложенное уходит со следующим событием, когда очередь освободится;
+    смена фазы раунда (game_start, game_crash) отменяет последние
+    значения и события игроков - их заменяет полное состояние в ней;
+  - события фазы уходят всегда, поэтому перед game_crash и ответами
+    игроку (адресные события идут мимо) стоит не больше limit пакетов;
+  - клиент с очередью от max_depth пакетов отключается.
+
+Пакет кодируется один раз на рассылку, а не для каждого клиента; emit
+возвращает его размер (для метрик).
+
+NOLOVE_OUTBOUND_LIMIT - порог (16 по умолчанию), NOLOVE_OUTBOUND_MAX -
+предел очереди (512).
+"""
+import os
+import threading
+from collections import deque
+
+from socketio import packet
+
+import logs
+import wire
+
+DEFAULT_LIMIT = 16
+DEFAULT_MAX_DEPTH = 512
+
+# Новое значение заменяет старое: в очереди достаточно последнего
+COALESCED_EVENTS = {'multiplier_update', 'multiplier_sync', 'countdown_update', wire.MULTIPLIER}
+# Смена фазы раунда: отложенные значения прошлой фазы уже не нужны
+PHASE_EVENTS = {'countdown_start', 'game_start', 'game_crash'}
+# События игроков раунда: фаза приносит их итог (activePlayers, gameResult)
+ROUND_EVENTS = {'players_batch', 'player_bet', 'player_cashed_out', wire.PLAYERS}
+
+log = logs.get('outbound')
+
+
+class ClientQueues:
+    """Рассылка по комнатам с учетом глубины очередей получателей
+
+    server - socketio.Server или socketio.AsyncServer.
+    """
+
+    def __init__(self, server, limit=DEFAULT_LIMIT, max_depth=DEFAULT_MAX_DEPTH, namespace='/'):
+        self.server = server
+        self.limit = limit
+        self.max_depth = max_depth
+        self.namespace = namespace
+        # sid -> событие -> закодированный пакет с последним значением
+        self.pending = {}
+        # sid -> deque[(событие, пакет)]: прочие события, не больше limit
+        self.backlog = {}
+        # Клиенты, которые уже отключаются
+        self.closing = set()
+        # Рассылают потоки движков столов, а клиенты отключаются из обработчиков
+        self.lock = threading.Lock()
+
+        self.collapsed = 0
+        self.deferred = 0
+        self.dropped = 0
+        self.disconnected = 0
+
+    def depth(self, eio_sid):
+        socket = self.server.eio.sockets.get(eio_sid)
+        return socket.queue.qsize() if socket is not None else 0
+
+    def depths(self):
+        """Глубины очередей всех клиентов"""
+        return [socket.queue.qsize() for socket in list(self.server.eio.sockets.values())]
+
+    def forget(self, sid):
+        """Клиент отключился"""
+        with self.lock:
+            self.pending.pop(sid, None)
+            self.backlog.pop(sid, None)
+            self.closing.discard(sid)
+
+    def reset(self, sid):
+        """Клиент сменил стол: отложенное относится к старому"""
+        with self.lock:
+            self.pending.pop(sid, None)
+            self.backlog.pop(sid, None)
+
+    def _encode(self, event, data):
+        encoded = self.server.packet_class(
+            packet.EVENT, namespace=self.namespace, data=[event, data]).encode()
+        # Пакет с бинарными данными - список: заголовок и вложения
+        return encoded if isinstance(encoded, list) else [encoded]
+
+    @staticmethod
+    def _size(encoded):
+        # JSON Socket.IO - ASCII, поэтому длина строки равна числу байт
+        return sum(len(part) for part in encoded)
+
+    def _plan(self, event, data, room):
+        """Что кому отправить: [(eio_sid, [пакеты])], кого отключить и размер пакета"""
+        if self.namespace not in self.server.manager.rooms:
+            return [], [], None
+        encoded = self._encode(event, data)
+        participants = list(self.server.manager.get_participants(self.namespace, room))
+        with self.lock:
+            sends, stuck = self._plan_locked(event, encoded, participants)
+        return sends, stuck, self._size(encoded)
+
+    def _plan_locked(self, event, encoded, participants):
+        coalesced = event in COALESCED_EVENTS
+        phase = event in PHASE_EVENTS
+        sends = []
+        stuck = []
+        for sid, eio_sid in participants:
+            if sid in self.closing:
+                continue
+            depth = self.depth(eio_sid)
+            if depth >= self.max_depth:
+                self.closing.add(sid)
+                stuck.append(sid)
+                continue
+
+            if phase:
+                # Фаза заменяет отложенные значения и события игроков раунда
+                self.pending.pop(sid, None)
+                backlog = self.backlog.get(sid)
+                if backlog:
+                    self.backlog[sid] = deque(item for item in backlog if item[0] not in ROUND_EVENTS)
+            if depth >= self.limit:
+                if coalesced:
+                    self.pending.setdefault(sid, {})[event] = encoded
+                    self.collapsed += 1
+                    continue
+                if not phase:
+                    self._defer(sid, event, encoded)
+                    continue
+                # Фаза уходит сразу, остальное ждет, пока очередь освободится
+                sends.append((eio_sid, list(encoded)))
+                continue
+
+            packets = []
+            backlog = self.backlog.pop(sid, None)
+            if backlog:
+                for _, waiting in backlog:
+                    packets.extend(waiting)
+            pending = self.pending.pop(sid, None)
+            if pending:
+                pending.pop(event, None)
+                for waiting in pending.values():
+                    packets.extend(waiting)
+            packets.extend(encoded)
+            sends.append((eio_sid, packets))
+        return sends, stuck
+
+    def _defer(self, sid, event, encoded):
+        backlog = self.backlog.get(sid)
+        if backlog is None:
+            backlog = self.backlog[sid] = deque()
+        if len(backlog) >= self.limit:
+            # Старое событие вытесняется: очередь клиента не растет дальше limit
+            backlog.popleft()
+            self.dropped += 1
+        backlog.append((event, encoded))
+        self.deferred += 1
+
+    def emit(self, event, data=None, to=None, room=None, **kwargs):
+        """socketio.emit для движков: рассылка в комнату - через очереди
+
+        Возвращает размер пакета рассылки в комнату (None - другие случаи).
+        """
+        if to is not None or room is None:
+            self.server.emit(event, data, to=to, room=room, namespace=self.namespace, **kwargs)
+            return None
+        sends, stuck, size = self._plan(event, data, room)
+        for eio_sid, packets in sends:
+            for encoded in packets:
+                self.server.eio.send(eio_sid, encoded)
+        if stuck:
+            # Отключение вызывает обработчик disconnect, а он - движок:
+            # из тика движка это делать нельзя
+            self.server.start_background_task(self._disconnect, stuck)
+        return size
+
+    async def emit_async(self, event, data=None, to=None, room=None, **kwargs):
+        """То же для socketio.AsyncServer"""
+        if to is not None or room is None:
+            await self.server.emit(event, data, to=to, room=room, namespace=self.namespace, **kwargs)
+            return None
+        sends, stuck, size = self._plan(event, data, room)
+        for eio_sid, packets in sends:
+            for encoded in packets:
+                await self.server.eio.send(eio_sid, encoded)
+        if stuck:
+            self.server.start_background_task(self._disconnect_async, stuck)
+        return size
+
+    def _disconnect(self, sids):
+        for sid in sids:
+            log.warning('slow_client_disconnected', sid=sid)
+            self.disconnected += 1
+            self.server.disconnect(sid, namespace=self.namespace)
+
+    async def _disconnect_async(self, sids):
+        for sid in sids:
+            log.warning('slow_client_disconnected', sid=sid)
+            self.disconnected += 1
+            await self.server.disconnect(sid, namespace=self.namespace)
+
+
+def from_env(server):
+    return ClientQueues(
+        server,
+        limit=int(os.environ.get('NOLOVE_OUTBOUND_LIMIT', DEFAULT_LIMIT)),
+        max_depth=int(os.environ.get('NOLOVE_OUTBOUND_MAX', DEFAULT_MAX_DEPTH))
+    )
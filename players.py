@@ -0,0 +1,121 @@
+"""
+NoLove Game - Реестр игроков
+"""
+
+# Имя пишется в журналы балансов и раундов; в журнале раундов под него
+# поле фиксированной длины (round_log.USERNAME_BYTES)
+USERNAME_MAX_BYTES = 32
+
+
+def username_error(username):
+    """Текст ошибки для клиента или None, если имя подходит"""
+    if not isinstance(username, str) or not username.strip():
+        return 'Некорректное имя пользователя'
+    if len(username.encode('utf-8')) > USERNAME_MAX_BYTES:
+        return f'Имя длиннее {USERNAME_MAX_BYTES} байт'
+    return None
+
+
+class Player:
+    """Игрок: компактная запись с фиксированным набором полей"""
+    __slots__ = (
+        'id', 'handle', 'username', 'balance', 'bet', 'in_game', 'did_cash_out',
+        'cash_out_multiplier', 'ready', 'auto_cashout_multiplier', 'token'
+    )
+
+    def __init__(self, sid, username, balance, handle=0):
+        self.id = sid
+        # Короткий номер игрока за столом для компактной кодировки (wire.py)
+        self.handle = handle
+        self.username = username
+        self.balance = balance
+        self.bet = 0
+        self.in_game = False
+        self.did_cash_out = False
+        self.cash_out_multiplier = 0
+        self.ready = False
+        self.auto_cashout_multiplier = None
+        # Токен сессии (engine.GameEngine._resume)
+        self.token = None
+
+    def public_info(self):
+        """Данные игрока для рассылки (без баланса)"""
+        return {
+            'id': self.id,
+            'username': self.username,
+            'bet': self.bet
+        }
+
+    def reset_round(self):
+        self.in_game = False
+        self.bet = 0
+        self.did_cash_out = False
+        self.cash_out_multiplier = 0
+
+
+class PlayerRegistry:
+    """Игроки с индексами по sid и по имени и множеством участников раунда"""
+
+    def __init__(self):
+        self.by_sid = {}
+        self.by_username = {}
+        # Участники текущего раунда в порядке ставок
+        self.in_round = {}
+        self._next_handle = 1
+
+    def __len__(self):
+        return len(self.by_sid)
+
+    def __iter__(self):
+        return iter(self.by_sid.values())
+
+    def get(self, sid):
+        return self.by_sid.get(sid)
+
+    def get_by_username(self, username):
+        return self.by_username.get(username)
+
+    def add(self, sid, username, balance):
+        player = Player(sid, username, balance, self._next_handle)
+        self._next_handle += 1
+        self.by_sid[sid] = player
+        self.by_username[username] = player
+        return player
+
+    def remove(self, sid):
+        player = self.by_sid.pop(sid, None)
+        if player is None:
+            return None
+        if self.by_username.get(player.username) is player:
+            del self.by_username[player.username]
+        self.in_round.pop(sid, None)
+        return player
+
+    def rekey(self, old_sid, new_sid):
+        """Игрок переподключился с новым sid; место в раунде сохраняется"""
+        player = self.by_sid.pop(old_sid)
+        player.id = new_sid
+        self.by_sid[new_sid] = player
+        if old_sid in self.in_round:
+            # Порядок ставок сохраняем: словарь пересобирается с новым ключом
+            self.in_round = {new_sid if sid == old_sid else sid: p for sid, p in self.in_round.items()}
+        return player
+
+    def join_round(self, player):
+        player.in_game = True
+        self.in_round[player.id] = player
+
+    def is_in_round(self, player):
+        return self.in_round.get(player.id) is player
+
+    def round_players(self):
+        return list(self.in_round.values())
+
+    def reset_round(self):
+        """Сбрасывает состояние всех участников завершившегося раунда"""
+        for player in self.in_round.values():
+            player.reset_round()
+        self.in_round.clear()
+
+    def any_ready(self):
+        return any(p.ready for p in self.by_sid.values())
@@ -0,0 +1,323 @@
+"""
+NoLove Game - Столы (комнаты)
+
+У каждого стола свой движок со своим раундом, пределами ставок и
+кривой. Клиенты стола состоят в одноименной комнате Socket.IO, поэтому
+события раунда получает только этот стол. Клиент после подключения
+сидит за столом по умолчанию (первым в списке) и может перейти за
+другой (join_room) со своим балансом. Частые события стол рассылает в
+комнаты кодировок (wire.py): клиент сидит в комнате стола и в комнате
+своей кодировки.
+
+Отключившийся игрок остается за столом еще NOLOVE_SESSION_GRACE секунд
+(30 по умолчанию): если клиент за это время переподключится и пришлет
+токен сессии (resume), он вернется к своему игроку и ставке, а вместо
+init_state получит события, которые пропустил (engine.GameEngine._resume).
+
+Список столов - NOLOVE_ROOMS: JSON или путь к JSON-файлу, например
+    [{"id": "main", "name": "Общий"},
+     {"id": "high", "name": "Высокие ставки", "minBet": 100, "worker": 1}]
+worker - номер процесса движка в кластере (cluster.py): столы разных
+процессов считаются на разных ядрах. Без кластера все столы живут в
+процессе сервера. Стол по умолчанию всегда в процессе 0: там же чат и
+основной журнал балансов.
+"""
+import asyncio
+import json
+import os
+import time
+
+import engine as engine_module
+import ledger as ledger_module
+import logs
+import wire
+
+DEFAULT_ROOMS = [
+    {'id': 'main', 'name': 'Общий стол'},
+    {'id': 'low', 'name': 'Низкие ставки', 'minBet': 1, 'maxBet': 100},
+    {'id': 'high', 'name': 'Высокие ставки', 'minBet': 100,
+     'curve': {'type': 'exponential', 'rate': 0.12}, 'curveMode': 'extrapolate'},
+]
+
+# Поля, которые клиент видит в списке столов
+PUBLIC_FIELDS = ('id', 'name', 'minBet', 'maxBet')
+
+SESSION_GRACE = 30.0
+SWEEP_INTERVAL = 1.0
+
+log = logs.get('rooms')
+
+
+def load_configs():
+    """Настройки столов из NOLOVE_ROOMS (или DEFAULT_ROOMS); первый - по умолчанию"""
+    raw = os.environ.get('NOLOVE_ROOMS')
+    if not raw:
+        rooms = DEFAULT_ROOMS
+    elif raw.lstrip().startswith('['):
+        rooms = json.loads(raw)
+    else:
+        with open(raw, encoding='utf-8') as f:
+            rooms = json.load(f)
+
+    configs = []
+    seen = set()
+    for index, room in enumerate(rooms):
+        if room['id'] in seen:
+            raise ValueError(f"Стол {room['id']} описан дважды")
+        seen.add(room['id'])
+        configs.append(dict(
+            {'name': room['id'], 'minBet': 1, 'maxBet': None, 'worker': 0},
+            **room, default=index == 0
+        ))
+    if not configs:
+        raise ValueError('Нужен хотя бы один стол')
+    if configs[0]['worker'] != 0:
+        raise ValueError('Стол по умолчанию должен быть в процессе 0')
+    return configs
+
+
+def worker_ids(configs):
+    """Номера процессов движка, за которыми закреплены столы"""
+    return sorted({room['worker'] for room in configs})
+
+
+def socket_path(base, worker):
+    """Unix-сокет процесса движка: base для процесса 0, base.N для остальных"""
+    return base if worker == 0 else f'{base}.{worker}'
+
+
+def room_emitter(emit, room_id):
+    """emit для движка стола: широковещательные события - только в комнаты стола"""
+    def emit_to_room(event, data=None, to=None):
+        if to is not None:
+            return emit(event, data, to=to)
+        return emit(event, data, room=wire.room_for_event(room_id, event))
+    return emit_to_room
+
+
+def build_engines(configs, emit, worker=None):
+    """Движки столов процесса worker (None - всех столов): id -> GameEngine
+
+    emit(event, data, to=None, room=None) - общий для всех столов. Журнал
+    балансов и занятые имена у столов одного процесса общие.
+    """
+    ledger = ledger_module.from_env('ledger' if not worker else f'worker-{worker}/ledger')
+    active_names = set()
+    engines = {}
+    for room in configs:
+        if worker is not None and room['worker'] != worker:
+            continue
+        engines[room['id']] = engine_module.from_env(
+            room_emitter(emit, room['id']), room=room, ledger=ledger, active_names=active_names)
+    return engines
+
+
+class Lobby:
+    """Кто за каким столом: sid -> стол, sid -> имя игрока
+
+    engines - движки столов (GameEngine или cluster.RemoteEngine). Вход и
+    выход из комнат Socket.IO - на стороне сервера, через enter/leave.
+    """
+
+    def __init__(self, configs, engines, grace=None):
+        self.configs = configs
+        self.engines = engines
+        self.default = configs[0]['id']
+        self.rooms = {}
+        self.usernames = {}
+        # sid клиентов с компактной кодировкой
+        self.compact = set()
+
+        if grace is None:
+            grace = float(os.environ.get('NOLOVE_SESSION_GRACE', SESSION_GRACE))
+        self.grace = grace
+        # Отключившиеся игроки, которых ждем: sid -> (срок, стол, имя)
+        self.detached = {}
+        self._started = False
+
+    def connect(self, sid, compact=False):
+        """Клиент за столом по умолчанию; возвращает комнаты Socket.IO для входа"""
+        self.rooms[sid] = self.default
+        if compact:
+            self.compact.add(sid)
+        return self.socket_rooms(sid, self.default)
+
+    def socket_rooms(self, sid, room_id):
+        """Комнаты Socket.IO клиента за столом: стол и кодировка"""
+        return wire.rooms_for(room_id, sid in self.compact)
+
+    def room_of(self, sid):
+        return self.rooms.get(sid, self.default)
+
+    def engine_for(self, sid):
+        return self.engines[self.room_of(sid)]
+
+    @property
+    def default_engine(self):
+        return self.engines[self.default]
+
+    def register(self, sid, username):
+        """Регистрация за текущим столом игрока"""
+        result = self.engine_for(sid).register(sid, username)
+        if 'error' not in result:
+            self.registered(sid, username)
+        return result
+
+    def registered(self, sid, username):
+        self.usernames[sid] = username
+
+    def username(self, sid):
+        return self.usernames.get(sid)
+
+    def list(self):
+        """Столы для клиента: настройки и текущая сводка"""
+        result = []
+        for room in self.configs:
+            info = {field: room[field] for field in PUBLIC_FIELDS}
+            summary = self.engines[room['id']].room_info()
+            if isinstance(summary, dict) and 'error' not in summary:
+                info.update(summary)
+            result.append(info)
+        return {'rooms': result}
+
+    def join(self, sid, room_id, enter, leave):
+        """Переход за другой стол с текущим балансом
+
+        enter(room_id) / leave(room_id) - вход и выход из комнаты Socket.IO.
+        """
+        if room_id not in self.engines:
+            return {'error': 'Нет такого стола'}
+        old = self.room_of(sid)
+        if old == room_id:
+            return {'success': True, 'room': room_id}
+
+        username = self.usernames.get(sid)
+        balance = None
+        if username:
+            left = self.engines[old].leave(sid, True)
+            if isinstance(left, dict) and 'error' in left:
+                return dict(left, room=old)
+            if isinstance(left, dict) and 'balance' in left:
+                balance = left['balance']
+        for name in self.socket_rooms(sid, old):
+            leave(name)
+        for name in self.socket_rooms(sid, room_id):
+            enter(name)
+        self.rooms[sid] = room_id
+
+        if username:
+            result = self.engines[room_id].register(sid, username, balance)
+            if 'error' in result:
+                # Имя занято за новым столом: игрок остается наблюдателем
+                self.usernames.pop(sid, None)
+                if balance is not None:
+                    self.default_engine.deposit(username, balance)
+                return dict(result, room=room_id)
+        return {'success': True, 'room': room_id}
+
+    def start(self, socketio):
+        """Фоновая уборка игроков, которые не вернулись (только один раз)"""
+        if self._claim_start():
+            socketio.start_background_task(self.run_forever, socketio.sleep)
+
+    def start_async(self, drop):
+        """То же для asyncio; drop(sid, стол, имя) - корутина вместо self.drop"""
+        if self._claim_start():
+            asyncio.ensure_future(self.run_async(drop))
+
+    def _claim_start(self):
+        if self._started or self.grace <= 0:
+            return False
+        self._started = True
+        return True
+
+    def run_forever(self, sleep):
+        while True:
+            sleep(SWEEP_INTERVAL)
+            for sid, room_id, username in self.expired():
+                self.drop(sid, room_id, username)
+                log.info('session_expired', room=room_id, username=username, sid=sid)
+
+    async def run_async(self, drop):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            for sid, room_id, username in self.expired():
+                await drop(sid, room_id, username)
+                log.info('session_expired', room=room_id, username=username, sid=sid)
+
+    def detach(self, sid, now=None):
+        """Сокет отключился: (стол, имя, ждем ли возвращения игрока)"""
+        room_id = self.rooms.pop(sid, self.default)
+        username = self.usernames.pop(sid, None)
+        self.compact.discard(sid)
+        kept = bool(username) and self.grace > 0
+        if kept:
+            deadline = (time.monotonic() if now is None else now) + self.grace
+            self.detached[sid] = (deadline, room_id, username)
+        return room_id, username, kept
+
+    def expired(self, now=None):
+        """Забирает отключенных игроков, чей срок вышел: [(sid, стол, имя)]"""
+        now = time.monotonic() if now is None else now
+        result = [(sid, room_id, username)
+                  for sid, (deadline, room_id, username) in self.detached.items()
+                  if deadline <= now]
+        for sid, _, _ in result:
+            del self.detached[sid]
+        return result
+
+    def session_room(self, token):
+        """Стол сессии по токену (engine.GameEngine._new_token)"""
+        room_id = token.rpartition('.')[0] if isinstance(token, str) else None
+        room_id = room_id or self.default
+        return room_id if room_id in self.engines else None
+
+    def resumed(self, sid, room_id, result):
+        """Учет после успешного resume; возвращает прежний стол сокета sid"""
+        previous = result['previous']
+        self.detached.pop(previous, None)
+        if previous != sid:
+            # Старый сокет еще не заметил обрыв: его отключение игрока не уберет
+            self.rooms.pop(previous, None)
+            self.usernames.pop(previous, None)
+            self.compact.discard(previous)
+        old = self.room_of(sid)
+        self.rooms[sid] = room_id
+        self.usernames[sid] = result['username']
+        return old
+
+    def resume(self, sid, token, version, enter, leave):
+        """Возвращает сокету sid игрока сессии token (см. join)"""
+        room_id = self.session_room(token)
+        if room_id is None:
+            return {'error': 'Сессия не найдена или истекла'}
+        result = self.engines[room_id].resume(sid, token, version, sid in self.compact)
+        if not isinstance(result, dict) or 'error' in result:
+            return result
+        old = self.resumed(sid, room_id, result)
+        if old != room_id:
+            for name in self.socket_rooms(sid, old):
+                leave(name)
+            for name in self.socket_rooms(sid, room_id):
+                enter(name)
+        return dict(result, room=room_id)
+
+    def disconnect(self, sid):
+        """Сокет отключился; игрок уходит сразу или после срока ожидания. Возвращает имя"""
+        room_id, username, kept = self.detach(sid)
+        if not kept:
+            return self.drop(sid, room_id, username)
+        return username
+
+    def drop(self, sid, room_id, username):
+        """Убирает игрока со стола; возвращает его имя"""
+        engine = self.engines[room_id]
+        if username and room_id != self.default:
+            # Баланс возвращается в основной журнал: при следующем входе
+            # игрок садится за стол по умолчанию
+            left = engine.leave(sid)
+            if isinstance(left, dict) and 'balance' in left:
+                self.default_engine.deposit(username, left['balance'])
+            return username
+        player = engine.disconnect(sid)
+        return player.username if player else username
@@ -0,0 +1,421 @@
+"""
+NoLove Game - Журнал раундов на диске
+
+Каталог журнала:
+  rounds-<первый id>.seg  - сегменты с записями раундов фиксированного формата
+  rounds.idx              - индекс: запись на каждый раунд (сегмент, смещение)
+  leaderboard.json        - снимок таблицы лидеров (leaderboard.py)
+
+Запись раунда: заголовок, игроки, CRC32. Номера раундов идут подряд,
+поэтому позиция в индексе равна id - base и ищется за O(1) через mmap.
+Запись идет в фоне (storage.BackgroundWriter), игровой цикл не ждет диска.
+"""
+import atexit
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+import logs
+from players import USERNAME_MAX_BYTES
+from storage import BackgroundWriter, DEFAULT_FSYNC_INTERVAL, write_all
+
+# Длиннее имя не пропускает регистрация (players.username_error)
+USERNAME_BYTES = USERNAME_MAX_BYTES
+
+ROUND = struct.Struct('<QddIq')         # id, краш, время, игроков, сумма ставок
+PLAYER = struct.Struct(f'<{USERNAME_BYTES}sqBdq')   # имя, ставка, вывел, множитель, профит
+# Ширина имени входит в формат уже записанных сегментов: другой лимит
+# регистрации требует новой версии формата, а не молча другой записи
+assert PLAYER.size == 57, 'USERNAME_MAX_BYTES изменил формат записей журнала раундов'
+CRC = struct.Struct('<I')
+INDEX_HEADER = struct.Struct('<4sIQ')   # магия, версия, base (id первой записи)
+INDEX_ENTRY = struct.Struct('<QQ')      # первый id сегмента, смещение (+1; 0 - нет записи)
+
+INDEX_MAGIC = b'NLRI'
+INDEX_VERSION = 1
+INDEX_NAME = 'rounds.idx'
+LEADERBOARD_NAME = 'leaderboard.json'
+SEGMENT_PREFIX = 'rounds-'
+SEGMENT_SUFFIX = '.seg'
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+log = logs.get('round_log')
+
+
+def segment_name(first_id):
+    return f'{SEGMENT_PREFIX}{first_id:012d}{SEGMENT_SUFFIX}'
+
+
+def encode_username(username):
+    """Имя в фиксированные USERNAME_BYTES байт UTF-8 без обрезки посреди символа"""
+    data = username.encode('utf-8')
+    if len(data) <= USERNAME_BYTES:
+        return data
+    # Старые записи: режем перед первым байтом символа (не 10xxxxxx)
+    end = USERNAME_BYTES
+    while end and data[end] & 0xC0 == 0x80:
+        end -= 1
+    return data[:end]
+
+
+def encode_round(result):
+    players = result['players']
+    parts = [ROUND.pack(
+        result['id'], result['multiplier'], result['timestamp'],
+        len(players), sum(p['bet'] for p in players)
+    )]
+    for p in players:
+        parts.append(PLAYER.pack(
+            encode_username(p['username']), p['bet'], p['didCashOut'],
+            p['cashOutMultiplier'], p['profit']
+        ))
+    body = b''.join(parts)
+    return body + CRC.pack(zlib.crc32(body))
+
+
+def decode_round(data, offset=0):
+    """Раунд из буфера; возвращает (результат, длина записи) или (None, 0)"""
+    if len(data) - offset < ROUND.size + CRC.size:
+        return None, 0
+    round_id, crash_point, timestamp, count, _ = ROUND.unpack_from(data, offset)
+    size = ROUND.size + count * PLAYER.size
+    if len(data) - offset < size + CRC.size:
+        return None, 0
+    (crc,) = CRC.unpack_from(data, offset + size)
+    if zlib.crc32(data[offset:offset + size]) != crc:
+        return None, 0
+
+    players = []
+    position = offset + ROUND.size
+    for _ in range(count):
+        name, bet, did_cash_out, multiplier, profit = PLAYER.unpack_from(data, position)
+        players.append({
+            'username': name.rstrip(b'\0').decode('utf-8', 'ignore'),
+            'bet': bet,
+            'didCashOut': bool(did_cash_out),
+            'cashOutMultiplier': multiplier,
+            'profit': profit
+        })
+        position += PLAYER.size
+
+    result = {'id': round_id, 'multiplier': crash_point, 'timestamp': timestamp, 'players': players}
+    return result, size + CRC.size
+
+
+class RoundLog(BackgroundWriter):
+    """Журнал раундов: только дозапись, ротация сегментов и компакция"""
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, fsync_interval=DEFAULT_FSYNC_INTERVAL,
+                 retain_rounds=None):
+        super().__init__(fsync_interval=fsync_interval, name='round-log')
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        # Сколько последних раундов хранить; None - без ограничения
+        self.retain_rounds = retain_rounds
+        os.makedirs(directory, exist_ok=True)
+
+        self._read_lock = threading.Lock()
+        self._segment_fds = {}
+        self._index_map = None
+
+        self.segments = self._list_segments()
+        self._open_index()
+        self._recover()
+        self._open_active_segment()
+
+    # Открытие и восстановление
+
+    def _list_segments(self):
+        names = [n for n in os.listdir(self.directory)
+                 if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX)]
+        return sorted(int(n[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) for n in names)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _open_index(self):
+        path = self._path(INDEX_NAME)
+        self.index_fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self.index_fd).st_size < INDEX_HEADER.size:
+            base = self.segments[0] if self.segments else 1
+            os.ftruncate(self.index_fd, 0)
+            os.pwrite(self.index_fd, INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, base), 0)
+        header = os.pread(self.index_fd, INDEX_HEADER.size, 0)
+        magic, version, self.base = INDEX_HEADER.unpack(header)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f'{path}: не индекс журнала раундов')
+
+    def _index_count(self):
+        size = os.fstat(self.index_fd).st_size
+        return (size - INDEX_HEADER.size) // INDEX_ENTRY.size
+
+    def _write_index(self, round_id, segment_id, offset):
+        position = INDEX_HEADER.size + (round_id - self.base) * INDEX_ENTRY.size
+        os.pwrite(self.index_fd, INDEX_ENTRY.pack(segment_id, offset + 1), position)
+
+    def _recover(self):
+        """Дописывает индекс по сегментам новее него и обрезает оборванную запись"""
+        self.last_round_id = self.base - 1
+        count = self._index_count()
+        if count:
+            entry = os.pread(self.index_fd, INDEX_ENTRY.size, INDEX_HEADER.size + (count - 1) * INDEX_ENTRY.size)
+            segment_id, offset = INDEX_ENTRY.unpack(entry)
+            if offset:
+                self.last_round_id = self.base + count - 1
+
+        # Сканируем только сегменты, где могут быть раунды новее индекса
+        for i, segment_id in enumerate(self.segments):
+            is_last = i + 1 == len(self.segments)
+            if is_last or self.segments[i + 1] > self.last_round_id + 1:
+                valid = self._scan_segment(segment_id, truncate=is_last)
+                if is_last:
+                    self._trim_index(segment_id, valid)
+
+    def _trim_index(self, segment_id, size):
+        """Убирает записи индекса, которые указывают за обрезанный конец сегмента
+
+        Индекс мог попасть на диск раньше данных: без этого раунд остался бы
+        в индексе без записи, а новый раунд с тем же id не записался бы.
+        """
+        count = keep = self._index_count()
+        while keep:
+            entry = os.pread(self.index_fd, INDEX_ENTRY.size, INDEX_HEADER.size + (keep - 1) * INDEX_ENTRY.size)
+            entry_segment, offset = INDEX_ENTRY.unpack(entry)
+            if entry_segment != segment_id or offset - 1 < size:
+                break
+            keep -= 1
+        if keep < count:
+            os.ftruncate(self.index_fd, INDEX_HEADER.size + keep * INDEX_ENTRY.size)
+            self.last_round_id = self.base + keep - 1
+            log.warning('round_log_index_trimmed', rounds=count - keep)
+
+    def _scan_segment(self, segment_id, truncate):
+        path = self._path(segment_name(segment_id))
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        offset = 0
+        while offset < len(data):
+            result, size = decode_round(data, offset)
+            if result is None:
+                break
+            if result['id'] > self.last_round_id:
+                self._write_index(result['id'], segment_id, offset)
+                self.last_round_id = result['id']
+            offset += size
+
+        if truncate and offset < len(data):
+            log.warning('round_log_tail_truncated', path=path, bytes=len(data) - offset)
+            os.truncate(path, offset)
+        return offset
+
+    def _open_active_segment(self):
+        if not self.segments:
+            self.segments.append(self.last_round_id + 1)
+        self.active_segment = self.segments[-1]
+        path = self._path(segment_name(self.active_segment))
+        self.active_fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.active_size = os.fstat(self.active_fd).st_size
+
+    # Запись (фоновый поток)
+
+    def append(self, result):
+        """Ставит раунд в очередь на запись; не блокирует"""
+        self.submit(('round', result))
+
+    def request_compaction(self, keep_from_round_id):
+        """Удалить сегменты, целиком состоящие из раундов старше keep_from_round_id"""
+        self.submit(('compact', keep_from_round_id))
+
+    def save_leaderboard(self, state):
+        """Снимок таблицы лидеров (Leaderboard.export); пишется после раундов из очереди"""
+        self.submit(('leaderboard', state))
+
+    def load_leaderboard(self):
+        """Последний снимок таблицы лидеров или None"""
+        try:
+            with open(self._path(LEADERBOARD_NAME), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            log.warning('leaderboard_snapshot_invalid', directory=self.directory)
+            return None
+
+    def write_batch(self, items):
+        for kind, payload in items:
+            if kind == 'round':
+                self._append_round(payload)
+            elif kind == 'compact':
+                self._compact(payload)
+            elif kind == 'leaderboard':
+                self._write_leaderboard(payload)
+
+    def _write_leaderboard(self, state):
+        tmp_path = self._path(LEADERBOARD_NAME + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(LEADERBOARD_NAME))
+
+    def _append_round(self, result):
+        if result['id'] <= self.last_round_id:
+            return
+        record = encode_round(result)
+        if self.active_size and self.active_size + len(record) > self.segment_bytes:
+            self._rotate(result['id'])
+
+        # Сначала данные, затем индекс: читатель не увидит запись раньше данных
+        offset = self.active_size
+        try:
+            write_all(self.active_fd, record)
+            self._write_index(result['id'], self.active_segment, offset)
+        except OSError:
+            # Обрывок записи отрезаем: повтор (BackgroundWriter._write) пишет с того же места
+            os.ftruncate(self.active_fd, offset)
+            raise
+        self.active_size += len(record)
+        self.last_round_id = result['id']
+
+    def _rotate(self, first_id):
+        os.fsync(self.active_fd)
+        os.close(self.active_fd)
+        self.segments.append(first_id)
+        self.active_segment = first_id
+        path = self._path(segment_name(first_id))
+        self.active_fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.active_size = 0
+
+        if self.retain_rounds:
+            self._compact(first_id - self.retain_rounds)
+
+    def _compact(self, keep_from_round_id):
+        # Сегмент i содержит раунды [segments[i], segments[i + 1])
+        removable = [
+            first_id for first_id, next_id in zip(self.segments, self.segments[1:])
+            if next_id <= keep_from_round_id
+        ]
+        if not removable:
+            return
+
+        new_base = self.segments[len(removable)]
+        skip = (new_base - self.base) * INDEX_ENTRY.size
+        tail = b''
+        index_size = os.fstat(self.index_fd).st_size
+        if index_size > INDEX_HEADER.size + skip:
+            tail = os.pread(self.index_fd, index_size - INDEX_HEADER.size - skip, INDEX_HEADER.size + skip)
+
+        # Новый индекс пишем рядом и атомарно подменяем
+        tmp_path = self._path(INDEX_NAME + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, new_base))
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self._read_lock:
+            os.replace(tmp_path, self._path(INDEX_NAME))
+            os.close(self.index_fd)
+            self.index_fd = os.open(self._path(INDEX_NAME), os.O_RDWR)
+            self.base = new_base
+            self._close_index_map()
+            for first_id in removable:
+                fd = self._segment_fds.pop(first_id, None)
+                if fd is not None:
+                    os.close(fd)
+                os.remove(self._path(segment_name(first_id)))
+            self.segments = self.segments[len(removable):]
+
+        log.info('round_log_compacted', segments=len(removable), first_round=new_base)
+
+    def sync(self):
+        os.fsync(self.active_fd)
+        os.fsync(self.index_fd)
+
+    # Чтение (любой поток)
+
+    @property
+    def first_round_id(self):
+        return self.base
+
+    def _close_index_map(self):
+        if self._index_map is not None:
+            self._index_map.close()
+            self._index_map = None
+
+    def _lookup(self, round_id):
+        position = INDEX_HEADER.size + (round_id - self.base) * INDEX_ENTRY.size
+        if self._index_map is None or len(self._index_map) < position + INDEX_ENTRY.size:
+            # Индекс вырос с прошлого отображения
+            self._close_index_map()
+            size = os.fstat(self.index_fd).st_size
+            if size < position + INDEX_ENTRY.size:
+                return None
+            self._index_map = mmap.mmap(self.index_fd, size, access=mmap.ACCESS_READ)
+        segment_id, offset = INDEX_ENTRY.unpack_from(self._index_map, position)
+        if not offset:
+            return None
+        return segment_id, offset - 1
+
+    def _segment_fd(self, segment_id):
+        fd = self._segment_fds.get(segment_id)
+        if fd is None:
+            fd = os.open(self._path(segment_name(segment_id)), os.O_RDONLY)
+            self._segment_fds[segment_id] = fd
+        return fd
+
+    def get(self, round_id):
+        """Раунд по id за O(1) или None"""
+        with self._read_lock:
+            if round_id < self.base:
+                return None
+            location = self._lookup(round_id)
+            if location is None:
+                return None
+            segment_id, offset = location
+            fd = self._segment_fd(segment_id)
+            header = os.pread(fd, ROUND.size, offset)
+            if len(header) < ROUND.size:
+                return None
+            count = ROUND.unpack(header)[3]
+            data = os.pread(fd, ROUND.size + count * PLAYER.size + CRC.size, offset)
+        result, _ = decode_round(data)
+        return result
+
+    def recent(self, limit):
+        """Последние limit раундов, от новых к старым"""
+        rounds = []
+        round_id = self.last_round_id
+        while round_id >= self.base and len(rounds) < limit:
+            result = self.get(round_id)
+            if result is not None:
+                rounds.append(result)
+            round_id -= 1
+        return rounds
+
+    def close(self):
+        self.stop()
+        with self._read_lock:
+            self._close_index_map()
+            for fd in self._segment_fds.values():
+                os.close(fd)
+            self._segment_fds.clear()
+        os.close(self.active_fd)
+        os.close(self.index_fd)
+
+
+def from_env(subdir='rounds'):
+    """Журнал раундов в NOLOVE_DATA_DIR/<subdir>; NOLOVE_ROUND_LOG=0 отключает его"""
+    if os.environ.get('NOLOVE_ROUND_LOG', '1') == '0':
+        return None
+    directory = os.path.join(os.environ.get('NOLOVE_DATA_DIR', 'data'), subdir)
+    retain = os.environ.get('NOLOVE_ROUND_LOG_RETAIN')
+    log = RoundLog(directory, retain_rounds=int(retain) if retain else None)
+    log.start()
+    # Последний fsync - при выходе процесса
+    atexit.register(log.close)
+    return log
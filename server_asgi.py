@@ -0,0 +1,384 @@
+"""
+NoLove Game - Сервер на asyncio (socketio.AsyncServer + ASGI)
+
+Тот же движок и протокол, что у nolove_server_8000, но без eventlet и
+потоков: цикл движка и рассылка чата - задачи asyncio, а события
+рассылаются через await. Команды игроков выполняются на тике (очередь
+движка стола), обработчик ждет ответ через future. Движки вызывают emit
+синхронно, поэтому события копятся в Outbox и отправляются по порядку
+после тика.
+
+    pip install -r requirements.txt
+    python server_asgi.py                  # или: uvicorn server_asgi:app --port 8000
+
+Режим шлюза (NOLOVE_ENGINE_SOCKET) здесь не поддерживается.
+"""
+import asyncio
+import inspect
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs
+
+import socketio
+
+import chat
+import engine as engine_module
+import logs
+import metrics
+import outbound
+import rooms
+import wire
+from assets import AssetStore
+
+
+async def command(engine, name, *args):
+    """Команда движка стола с ответом: выполнится на ближайшем тике
+
+    Ждет не дольше engine.COMMAND_TIMEOUT и отменяет команду, до которой
+    тик не дошел, - как GameEngine._call.
+    """
+    future = asyncio.get_running_loop().create_future()
+    claim = threading.Lock()
+
+    def callback(result):
+        # Клиент мог отключиться, и обработчик уже отменен
+        if not future.done():
+            future.set_result(result)
+
+    engine.submit(name, *args, callback=callback, claim=claim)
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), engine_module.COMMAND_TIMEOUT)
+    except asyncio.TimeoutError:
+        pass
+    if claim.acquire(False):
+        # Тик до команды не дошел: после ответа об ошибке она не выполнится
+        return {'error': 'Сервер не ответил'}
+    # Команда уже выполняется - ответ будет в этом же тике
+    try:
+        return await asyncio.wait_for(future, engine_module.COMMAND_TIMEOUT)
+    except asyncio.TimeoutError:
+        return {'error': 'Сервер не ответил'}
+
+
+class Outbox:
+    """События в порядке вызова emit; отправка - await drain()
+
+    Рассылка в комнаты - через очереди клиентов (outbound.ClientQueues).
+    """
+
+    def __init__(self, sio, queues):
+        self.sio = sio
+        self.queues = queues
+        self.pending = deque()
+        self.lock = asyncio.Lock()
+
+    def emit(self, event, data=None, to=None, room=None):
+        self.pending.append((event, data, to, room))
+
+    async def drain(self):
+        # Один drain за раз: иначе события тика и обработчика перемешаются
+        async with self.lock:
+            while self.pending:
+                event, data, to, room = self.pending.popleft()
+                if to is not None:
+                    await self.sio.emit(event, data, to=to)
+                    continue
+                started = time.perf_counter()
+                size = await self.queues.emit_async(event, data, room=room)
+                metrics.EMIT_SECONDS.observe(time.perf_counter() - started, event)
+                if size is not None:
+                    metrics.BROADCAST_BYTES.observe(size, event)
+
+
+if os.environ.get('NOLOVE_ENGINE_SOCKET'):
+    raise SystemExit('server_asgi не работает шлюзом: уберите NOLOVE_ENGINE_SOCKET')
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+logs.configure()
+log = logs.get('server')
+client_queues = outbound.from_env(sio)
+metrics.register_outbound(client_queues)
+outbox = Outbox(sio, client_queues)
+
+assets = AssetStore(os.path.dirname(os.path.abspath(__file__)))
+room_configs = rooms.load_configs()
+engines = rooms.build_engines(room_configs, outbox.emit)
+metrics.register_engines(engines.values())
+lobby = rooms.Lobby(room_configs, engines)
+chat_room = chat.from_env(outbox.emit, lobby.username)
+
+
+async def maybe_await(result):
+    # enter_room/leave_room стали корутинами в новых python-socketio
+    if inspect.isawaitable(result):
+        await result
+
+
+async def join(sid, room_id):
+    """rooms.Lobby.join без блокирующих ожиданий: команды - через await"""
+    if room_id not in engines:
+        return {'error': 'Нет такого стола'}
+    old = lobby.room_of(sid)
+    if old == room_id:
+        return {'success': True, 'room': room_id}
+
+    username = lobby.username(sid)
+    balance = None
+    if username:
+        left = await command(engines[old], 'leave', sid, True)
+        if isinstance(left, dict) and 'error' in left:
+            return dict(left, room=old)
+        if isinstance(left, dict) and 'balance' in left:
+            balance = left['balance']
+    for room in lobby.socket_rooms(sid, old):
+        await maybe_await(sio.leave_room(sid, room))
+    # Отложенные пакеты старого стола за новым уже не нужны
+    client_queues.reset(sid)
+    for room in lobby.socket_rooms(sid, room_id):
+        await maybe_await(sio.enter_room(sid, room))
+    lobby.rooms[sid] = room_id
+    await sio.emit('init_state', engines[room_id].init_state(), to=sid)
+
+    if username:
+        result = await command(engines[room_id], 'register', sid, username, balance)
+        if 'error' in result:
+            lobby.usernames.pop(sid, None)
+            if balance is not None:
+                lobby.default_engine.deposit(username, balance)
+            return dict(result, room=room_id)
+    return {'success': True, 'room': room_id}
+
+
+async def resume(sid, data):
+    """rooms.Lobby.resume через await"""
+    data = data if isinstance(data, dict) else {}
+    token = data.get('token')
+    room_id = lobby.session_room(token)
+    if room_id is None:
+        return {'error': 'Сессия не найдена или истекла'}
+    result = await command(engines[room_id], 'resume', sid, token, data.get('version'), sid in lobby.compact)
+    if 'error' in result:
+        return result
+    old = lobby.resumed(sid, room_id, result)
+    if old != room_id:
+        for room in lobby.socket_rooms(sid, old):
+            await maybe_await(sio.leave_room(sid, room))
+        for room in lobby.socket_rooms(sid, room_id):
+            await maybe_await(sio.enter_room(sid, room))
+    return dict(result, room=room_id)
+
+
+async def drop(sid, room_id, username):
+    """rooms.Lobby.drop через await"""
+    if username and room_id != lobby.default:
+        # Баланс - в основной журнал (см. rooms.Lobby.drop)
+        left = await command(engines[room_id], 'leave', sid)
+        if isinstance(left, dict) and 'balance' in left:
+            lobby.default_engine.deposit(username, left['balance'])
+    else:
+        engines[room_id].disconnect(sid)
+
+
+# HTTP: статика, честная игра, метрики
+
+def json_response(data, status=200):
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    return status, [('Content-Type', 'application/json')], body
+
+
+def route(path, headers, query):
+    if path == '/metrics':
+        return 200, [('Content-Type', metrics.CONTENT_TYPE)], metrics.render().encode('utf-8')
+    if path == '/logs':
+        status, body = logs.control(query.get('levels', [None])[0], query.get('token', [None])[0])
+        return json_response(body, status)
+    if path == '/fair':
+        info = lobby.default_engine.fairness_info()
+        if info is None:
+            return json_response({'error': 'Честная игра не включена'}, 404)
+        return json_response(info)
+    if path.startswith('/fair/verify/'):
+        try:
+            round_id = int(path[len('/fair/verify/'):])
+        except ValueError:
+            return json_response({'error': 'Некорректный номер раунда'}, 404)
+        result = lobby.default_engine.verify_round(round_id)
+        return json_response(result, 400 if 'error' in result else 200)
+
+    asset = 'nolove.html' if path == '/' else path.lstrip('/')
+    return assets.serve(
+        asset,
+        accept_encoding=headers.get('accept-encoding'),
+        if_none_match=headers.get('if-none-match')
+    )
+
+
+async def http_app(scope, receive, send):
+    if scope['type'] != 'http':
+        return
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    status, response_headers, body = route(scope['path'], headers, query)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in response_headers]
+    })
+    await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+
+
+app = socketio.ASGIApp(sio, other_asgi_app=http_app)
+
+
+# События Socket.IO
+
+@sio.event
+async def connect(sid, environ, auth=None):
+    log.info('connected', sid=sid)
+    metrics.CONNECTED_SOCKETS.inc()
+    for engine in engines.values():
+        engine.start_async(outbox.drain)
+    chat_room.start_async(outbox.drain)
+    lobby.start_async(drop)
+    query = parse_qs(environ.get('QUERY_STRING', ''))
+    for room in lobby.connect(sid, wire.wants_compact(query.get('wire', [None])[0])):
+        await maybe_await(sio.enter_room(sid, room))
+    # Клиенту с сессией - только если resume не удастся
+    if not query.get('session'):
+        await sio.emit('init_state', lobby.engine_for(sid).init_state(), to=sid)
+    await sio.emit('chat_history', chat_room.recent(), to=sid)
+
+
+@sio.on('register_player')
+@metrics.timed_handler('register_player')
+async def handle_register_player(sid, data):
+    username = data.get('username') if isinstance(data, dict) else None
+    if username is None:
+        username = f'Гость{random.randint(100, 999)}'
+    elif isinstance(username, str):
+        username = username.strip()
+    # Остальное (тип, длина) проверяет движок
+    result = await command(lobby.engine_for(sid), 'register', sid, username)
+    if 'error' not in result:
+        lobby.registered(sid, username)
+    return result
+
+
+@sio.on('place_bet')
+@metrics.timed_handler('place_bet')
+async def handle_place_bet(sid, data):
+    try:
+        bet = int(data['bet'])
+    except (ValueError, KeyError, TypeError):
+        return {'error': 'Неверная сумма ставки'}
+
+    return await command(lobby.engine_for(sid), 'place_bet', sid, bet)
+
+
+@sio.on('get_history')
+@metrics.timed_handler('get_history')
+async def handle_get_history(sid, data=None):
+    data = data or {}
+    try:
+        cursor = data.get('cursor')
+        cursor = int(cursor) if cursor is not None else None
+        limit = int(data.get('limit', 10))
+    except (TypeError, ValueError, AttributeError):
+        return {'error': 'Некорректный запрос истории'}
+
+    # Старые страницы читаются из журнала раундов с диска: не в цикле событий
+    return await asyncio.to_thread(lobby.engine_for(sid).get_history, cursor, limit)
+
+
+@sio.on('get_leaderboard')
+@metrics.timed_handler('get_leaderboard')
+async def handle_get_leaderboard(sid, data=None):
+    return lobby.engine_for(sid).get_leaderboard(lobby.username(sid))
+
+
+@sio.on('cash_out')
+@metrics.timed_handler('cash_out')
+async def handle_cash_out(sid, data=None):
+    lobby.engine_for(sid).cash_out(sid)
+
+
+@sio.on('set_auto_cashout')
+@metrics.timed_handler('set_auto_cashout')
+async def handle_set_auto_cashout(sid, data):
+    try:
+        multiplier = float(data['multiplier'])
+    except (TypeError, ValueError, KeyError):
+        return
+
+    lobby.engine_for(sid).set_auto_cashout(sid, multiplier)
+
+
+@sio.on('start_auto_bet')
+@metrics.timed_handler('start_auto_bet')
+async def handle_start_auto_bet(sid, data):
+    return await command(lobby.engine_for(sid), 'start_auto_bet', sid, data)
+
+
+@sio.on('stop_auto_bet')
+@metrics.timed_handler('stop_auto_bet')
+async def handle_stop_auto_bet(sid, data=None):
+    return await command(lobby.engine_for(sid), 'stop_auto_bet', sid)
+
+
+@sio.on('chat_message')
+@metrics.timed_handler('chat_message')
+async def handle_chat_message(sid, data):
+    message = data.get('message') if isinstance(data, dict) else None
+    return chat_room.post(sid, message)
+
+
+@sio.on('list_rooms')
+@metrics.timed_handler('list_rooms')
+async def handle_list_rooms(sid, data=None):
+    return lobby.list()
+
+
+@sio.on('join_room')
+@metrics.timed_handler('join_room')
+async def handle_join_room(sid, data):
+    room_id = data.get('room') if isinstance(data, dict) else None
+    return await join(sid, room_id)
+
+
+@sio.on('leave_room')
+@metrics.timed_handler('leave_room')
+async def handle_leave_room(sid, data=None):
+    return await join(sid, lobby.default)
+
+
+@sio.on('resume')
+@metrics.timed_handler('resume')
+async def handle_resume(sid, data):
+    result = await resume(sid, data)
+    if 'error' in result or result.get('resync'):
+        await sio.emit('init_state', lobby.engine_for(sid).init_state(), to=sid)
+    return result
+
+
+@sio.event
+async def disconnect(sid, reason=None):
+    metrics.CONNECTED_SOCKETS.dec()
+    room_id, username, kept = lobby.detach(sid)
+    client_queues.forget(sid)
+    if not kept:
+        await drop(sid, room_id, username)
+    if username:
+        log.info('disconnected', username=username, sid=sid)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.environ.get('PORT', 8000))
+    print(f'NoLove Game (asyncio) - порт {port}')
+    uvicorn.run(app, host='0.0.0.0', port=port, log_level='warning', ws_per_message_deflate=True)
@@ -0,0 +1,362 @@
+"""
+NoLove Game - Симулятор экономики раундов (Монте-Карло)
+
+Раунды разыгрываются офлайн пачками на NumPy по тем же формулам, что и
+в движке (curve.py): точка краха, шаг множителя, округление множителя
+и выплаты. Игроки - группы со стратегиями:
+  auto   - авто-вывод на фиксированном множителе (cashout);
+  manual - ручной вывод: цель из логнормального распределения (median,
+           sigma) и время реакции игрока в секундах (reaction).
+Отчет: RTP по группам и в целом, прибыль и просадка банка казино,
+распределения точки краха и длины раунда в тиках.
+
+    pip install -r requirements-dev.txt
+    python simulate.py --rounds 20000000 --mode extrapolate
+    python simulate.py --rounds 1000000 --population players.json --distribution house_edge
+
+В режиме extrapolate (кривая) исход раунда считается в замкнутой форме:
+десятки миллионов раундов - секунды. Режим stream (исходная игра)
+проходит случайное блуждание по тикам и медленнее на порядок-два.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+
+import numpy as np
+
+from curve import (
+    STREAM, EXTRAPOLATE, DEFAULT_CURVE,
+    crash_point_from_uniform, crash_point_house_edge, walk_step, multiplier_at, time_to_reach,
+    floor_hundredths, cash_out_winnings
+)
+from engine import DEFAULT_TICK_RATE, COUNTDOWN_SECONDS, COOLDOWN_SECONDS
+from fairness import LEGACY, HOUSE_EDGE, HOUSE_EDGE_PERCENT
+
+DEFAULT_POPULATION = [
+    {'name': 'auto-1.5x', 'strategy': 'auto', 'players': 10, 'bet': 100, 'cashout': 1.5},
+    {'name': 'auto-2x', 'strategy': 'auto', 'players': 10, 'bet': 100, 'cashout': 2.0},
+    {'name': 'auto-5x', 'strategy': 'auto', 'players': 5, 'bet': 100, 'cashout': 5.0},
+    {'name': 'manual', 'strategy': 'manual', 'players': 20, 'bet': 100,
+     'median': 2.0, 'sigma': 0.6, 'reaction': 0.3},
+]
+DEFAULT_BATCH = 200_000
+# Сколько разных целей на раунд разыгрывать для группы ручных игроков;
+# остальные игроки группы повторяют их с тем же весом
+MANUAL_SAMPLES = 8
+MIN_TARGET = 1.01
+# Гистограммы: точка краха по сотым до CRASH_BINS / 100, тики до TICK_BINS
+CRASH_BINS = 10_000
+TICK_BINS = 100_000
+MAX_TICKS = 100_000
+
+
+class Column:
+    """Одна цель вывода в раунде: группа, вес (сколько игроков) и задержка"""
+    __slots__ = ('group', 'weight', 'auto', 'reaction')
+
+    def __init__(self, group, weight, auto, reaction):
+        self.group = group
+        self.weight = weight
+        self.auto = auto
+        self.reaction = reaction
+
+
+class Histogram:
+    """Счетчики целых корзин с переполнением: перцентили без хранения выборки"""
+
+    def __init__(self, bins, scale=1):
+        self.counts = np.zeros(bins + 1, dtype=np.int64)
+        self.scale = scale
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, values):
+        index = np.minimum((values * self.scale + 1e-9).astype(np.int64), len(self.counts) - 1)
+        self.counts += np.bincount(index, minlength=len(self.counts))
+        self.total += float(values.sum())
+        self.max = max(self.max, float(values.max()))
+
+    def summary(self):
+        count = int(self.counts.sum())
+        cumulative = np.cumsum(self.counts)
+        result = {'mean': round(self.total / count, 4)}
+        for q in (50, 90, 99, 99.9):
+            index = int(np.searchsorted(cumulative, count * q / 100))
+            result[f'p{q:g}'] = index / self.scale
+        result['max'] = round(self.max, 2)
+        return result
+
+
+def load_population(path):
+    if path is None:
+        return DEFAULT_POPULATION
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_columns(population, tick_interval, samples=MANUAL_SAMPLES):
+    columns = []
+    for index, group in enumerate(population):
+        if group['strategy'] == 'auto':
+            # Все игроки группы выводят одинаково: одна цель с весом группы
+            columns.append(Column(index, group['players'], True, 0.0))
+        elif group['strategy'] == 'manual':
+            count = min(group['players'], samples)
+            for _ in range(count):
+                columns.append(Column(index, group['players'] / count, False, group.get('reaction', 0.0)))
+        else:
+            raise ValueError(f"Неизвестная стратегия: {group['strategy']}")
+    return columns
+
+
+def sample_crash_points(rng, n, distribution):
+    r = rng.random(n)
+    if distribution == LEGACY:
+        return crash_point_from_uniform(r)
+    if distribution == HOUSE_EDGE:
+        return crash_point_house_edge(r, HOUSE_EDGE_PERCENT)
+    raise ValueError(f'Неизвестное распределение: {distribution}')
+
+
+def sample_targets(rng, n, population, columns):
+    targets = np.empty((n, len(columns)))
+    for i, column in enumerate(columns):
+        group = population[column.group]
+        if column.auto:
+            targets[:, i] = group['cashout']
+        else:
+            targets[:, i] = group['median'] * np.exp(group['sigma'] * rng.standard_normal(n))
+    return np.maximum(targets, MIN_TARGET)
+
+
+def settle_extrapolate(curve, crash, targets, columns, tick_interval):
+    """Режим кривой: исход раунда без тиков
+
+    Авто-вывод платит порог, если он не выше точки краха; ручной вывод -
+    множитель кривой в момент получения запроса, если он раньше краха.
+    """
+    crash_time = time_to_reach(curve, crash)
+    payouts = np.empty_like(targets)
+    for i, column in enumerate(columns):
+        target = targets[:, i]
+        if column.auto:
+            payouts[:, i] = np.where(target <= crash, target, 0.0)
+        else:
+            received = time_to_reach(curve, target) + column.reaction
+            payouts[:, i] = np.where(received < crash_time,
+                                     floor_hundredths(multiplier_at(curve, received)), 0.0)
+    ticks = np.maximum(1, np.ceil(crash_time / tick_interval - 1e-9)).astype(np.int64)
+    return ticks, payouts
+
+
+def settle_stream(rng, crash, targets, columns, tick_interval, max_ticks=MAX_TICKS):
+    """Исходный режим: случайное блуждание по тикам, как в GameEngine._advance_walk
+
+    На тике множитель растет на walk_step; если он дошел до точки краха -
+    крах. Иначе текущий множитель - round(m, 2): авто-вывод с порогом не
+    выше него платит его же. Ручной вывод игрок отправляет, увидев цель,
+    и движок выполняет его на тике после прихода запроса по последнему
+    разосланному множителю.
+    """
+    n, k = targets.shape
+    # Задержка в тиках от тика, где цель пройдена, до тика выплаты
+    delays = np.array([0 if c.auto else max(0, math.ceil(c.reaction / tick_interval - 1e-9) - 1)
+                       for c in columns])
+    order = np.argsort(targets, axis=1)
+    sorted_targets = np.take_along_axis(targets, order, axis=1)
+
+    payouts = np.zeros((n, k))
+    ticks = np.full(n, max_ticks, dtype=np.int64)
+    rows = np.arange(n)              # исходные номера живых раундов
+    multiplier = np.ones(n)
+    crash_left = crash.copy()
+    pointer = np.zeros(n, dtype=np.intp)
+    alive = np.ones(n, dtype=bool)
+    position = np.arange(n)          # исходный номер -> индекс среди живых
+    due = {}                         # тик -> [(исходные номера, цели)]
+
+    tick = 0
+    while rows.size and tick < max_ticks:
+        tick += 1
+        multiplier += walk_step(rng.random(rows.size), tick_interval)
+        crashed = multiplier >= crash_left
+        if crashed.any():
+            ticks[rows[crashed]] = tick
+            alive[rows[crashed]] = False
+            keep = ~crashed
+            rows, multiplier, crash_left, pointer = rows[keep], multiplier[keep], crash_left[keep], pointer[keep]
+            position[rows] = np.arange(rows.size)
+        current = np.round(multiplier, 2)
+
+        # Цели, пройденные на этом тике: по возрастанию внутри раунда
+        candidates = np.nonzero(pointer < k)[0]
+        while candidates.size:
+            hit = current[candidates] >= sorted_targets[rows[candidates], pointer[candidates]]
+            candidates = candidates[hit]
+            if not candidates.size:
+                break
+            source = rows[candidates]
+            cols = order[source, pointer[candidates]]
+            delay = delays[cols]
+            now = delay == 0
+            payouts[source[now], cols[now]] = current[candidates[now]]
+            for d in np.unique(delay[~now]):
+                chosen = delay == d
+                due.setdefault(tick + int(d), []).append((source[chosen], cols[chosen]))
+            pointer[candidates] += 1
+            candidates = candidates[pointer[candidates] < k]
+
+        # Ручные выводы, дошедшие до движка к этому тику
+        for source, cols in due.pop(tick, ()):
+            live = alive[source]
+            source, cols = source[live], cols[live]
+            payouts[source, cols] = current[position[source]]
+
+    return ticks, payouts
+
+
+class Report:
+    """Накопление результатов по пачкам; просадка - по порядку раундов"""
+
+    def __init__(self, population, bankroll=0):
+        self.population = population
+        self.rounds = 0
+        self.wagered = np.zeros(len(population))
+        self.paid = np.zeros(len(population))
+        self.hits = np.zeros(len(population))
+        self.bets = np.zeros(len(population))
+        self.crash = Histogram(CRASH_BINS, scale=100)
+        self.ticks = Histogram(TICK_BINS)
+        self.truncated = 0
+
+        self.bankroll = bankroll
+        self.profit = 0.0
+        self.peak = 0.0
+        self.max_drawdown = 0.0
+        self.lowest = 0.0
+        self.worst_round = 0.0
+        self.sum_squares = 0.0
+
+    def add(self, crash, ticks, payouts, columns, max_ticks):
+        n = len(crash)
+        self.rounds += n
+        self.crash.add(crash)
+        self.ticks.add(ticks)
+        self.truncated += int((ticks >= max_ticks).sum())
+
+        round_paid = np.zeros(n)
+        round_wagered = 0.0
+        for i, column in enumerate(columns):
+            group = self.population[column.group]
+            won = cash_out_winnings(group['bet'], payouts[:, i]) * column.weight
+            round_paid += won
+            round_wagered += group['bet'] * column.weight
+            self.paid[column.group] += won.sum()
+            self.wagered[column.group] += group['bet'] * column.weight * n
+            self.hits[column.group] += (payouts[:, i] > 0).sum() * column.weight
+            self.bets[column.group] += column.weight * n
+
+        # Результат казино по раундам: ставки минус выплаты
+        house = round_wagered - round_paid
+        balance = self.profit + np.cumsum(house)
+        peaks = np.maximum.accumulate(np.maximum(balance, self.peak))
+        self.max_drawdown = max(self.max_drawdown, float((peaks - balance).max()))
+        self.peak = float(peaks[-1])
+        self.lowest = min(self.lowest, float(balance.min()))
+        self.profit = float(balance[-1])
+        self.worst_round = min(self.worst_round, float(house.min()))
+        self.sum_squares += float((house ** 2).sum())
+
+    def summary(self, seconds, tick_interval):
+        mean = self.profit / self.rounds
+        wagered = self.wagered.sum()
+        ticks = self.ticks.summary()
+        round_seconds = ticks['mean'] * tick_interval + COUNTDOWN_SECONDS + COOLDOWN_SECONDS
+        return {
+            'rounds': self.rounds,
+            'seconds': round(seconds, 2),
+            'roundsPerSecond': round(self.rounds / seconds),
+            'rtp': round(self.paid.sum() / wagered, 5) if wagered else None,
+            'groups': [
+                {
+                    'name': group.get('name', group['strategy']),
+                    'rtp': round(self.paid[i] / self.wagered[i], 5),
+                    'hitRate': round(self.hits[i] / self.bets[i], 5),
+                }
+                for i, group in enumerate(self.population)
+            ],
+            'house': {
+                'profit': round(self.profit),
+                'perRound': round(mean, 3),
+                'perRoundStd': round(math.sqrt(max(0.0, self.sum_squares / self.rounds - mean ** 2)), 3),
+                'worstRound': round(self.worst_round),
+                'maxDrawdown': round(self.max_drawdown),
+                'minBankroll': round(self.bankroll + self.lowest),
+                'ruined': self.bankroll + self.lowest < 0,
+            },
+            'crashPoint': self.crash.summary(),
+            'ticks': dict(ticks, truncated=self.truncated),
+            'roundSeconds': round(round_seconds, 2),
+            'roundsPerHour': round(3600 / round_seconds),
+        }
+
+
+def simulate(rounds, mode=EXTRAPOLATE, curve=DEFAULT_CURVE, distribution=LEGACY,
+             population=None, tick_rate=DEFAULT_TICK_RATE, batch=DEFAULT_BATCH,
+             bankroll=0, seed=None, max_ticks=MAX_TICKS):
+    population = population or DEFAULT_POPULATION
+    tick_interval = 1.0 / tick_rate
+    columns = build_columns(population, tick_interval)
+    rng = np.random.default_rng(seed)
+    report = Report(population, bankroll)
+
+    started = time.perf_counter()
+    done = 0
+    while done < rounds:
+        n = min(batch, rounds - done)
+        crash = sample_crash_points(rng, n, distribution)
+        targets = sample_targets(rng, n, population, columns)
+        if mode == EXTRAPOLATE:
+            ticks, payouts = settle_extrapolate(curve, crash, targets, columns, tick_interval)
+        elif mode == STREAM:
+            ticks, payouts = settle_stream(rng, crash, targets, columns, tick_interval, max_ticks)
+        else:
+            raise ValueError(f'Неизвестный режим: {mode}')
+        report.add(crash, ticks, payouts, columns, max_ticks)
+        done += n
+    return report.summary(time.perf_counter() - started, tick_interval)
+
+
+def parse_curve(text):
+    """linear:0.35 или exponential:0.12"""
+    kind, _, rate = text.partition(':')
+    return {'type': kind, 'rate': float(rate)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Симулятор раундов NoLove Game')
+    parser.add_argument('--rounds', type=int, default=1_000_000)
+    parser.add_argument('--mode', choices=[STREAM, EXTRAPOLATE], default=EXTRAPOLATE)
+    parser.add_argument('--curve', type=parse_curve, default=DEFAULT_CURVE,
+                        help='кривая режима extrapolate, например exponential:0.12')
+    parser.add_argument('--distribution', choices=[LEGACY, HOUSE_EDGE], default=LEGACY)
+    parser.add_argument('--population', help='JSON со списком групп игроков')
+    parser.add_argument('--tick-rate', type=float, default=DEFAULT_TICK_RATE)
+    parser.add_argument('--batch', type=int, default=DEFAULT_BATCH)
+    parser.add_argument('--bankroll', type=float, default=0, help='стартовый банк казино')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    result = simulate(
+        args.rounds, mode=args.mode, curve=args.curve, distribution=args.distribution,
+        population=load_population(args.population), tick_rate=args.tick_rate,
+        batch=args.batch, bankroll=args.bankroll, seed=args.seed
+    )
+    json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
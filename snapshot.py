@@ -0,0 +1,53 @@
+"""
+NoLove Game - Кэш снимка состояния для новых подключений
+"""
+import json
+import threading
+
+
+class SnapshotCache:
+    """init_state, собранный и сериализованный один раз на версию состояния
+
+    Версию поднимает движок при ставках, выводах, крахе и смене фазы.
+    Множитель и таймер внутри версии могут устареть - клиент получит
+    свежие значения со следующим multiplier_update / countdown_update.
+    """
+
+    def __init__(self, build, lock=None):
+        self.build = build
+        self.lock = lock or threading.RLock()
+        self.version = 0
+        # (версия, словарь, байты) - заменяется целиком, читается без блокировки
+        self._cached = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def bump(self):
+        self.version += 1
+
+    def _current(self):
+        cached = self._cached
+        if cached is not None and cached[0] == self.version:
+            self.hits += 1
+            return cached
+        with self.lock:
+            # Пока ждали блокировку, снимок мог собрать другой поток
+            cached = self._cached
+            if cached is not None and cached[0] == self.version:
+                self.hits += 1
+                return cached
+            version = self.version
+            data = self.build()
+            payload = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+            self._cached = cached = (version, data, payload)
+            self.misses += 1
+        return cached
+
+    def get_bytes(self):
+        """Готовый JSON в UTF-8 для отправки бинарным кадром"""
+        return self._current()[2]
+
+    def get_data(self):
+        """Тот же снимок в виде словаря (для старых клиентов)"""
+        return self._current()[1]
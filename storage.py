@@ -0,0 +1,152 @@
+"""
+NoLove Game - Фоновая запись на диск
+
+Общая основа журналов: игровой цикл только кладет записи в очередь,
+а отдельный поток пишет их пачками (group commit) и периодически
+вызывает fsync.
+"""
+import os
+import queue
+import sys
+import threading
+import time
+
+import logs
+
+DEFAULT_FSYNC_INTERVAL = 1.0
+QUEUE_TIMEOUT = 0.5
+
+log = logs.get('storage')
+
+
+def run_blocking(fn, *args):
+    """Блокирующий системный вызов; под eventlet - в пуле настоящих потоков"""
+    # Сам eventlet не импортируем: импорт из потока записи ломает в нем
+    # ожидания с таймаутом (и остановку потока при выходе)
+    patcher = sys.modules.get('eventlet.patcher')
+    if patcher is not None and patcher.is_monkey_patched('thread'):
+        from eventlet import tpool
+        return tpool.execute(fn, *args)
+    return fn(*args)
+
+
+def write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+class BackgroundWriter:
+    """Очередь записей и поток, который сбрасывает их пачками
+
+    Наследник реализует write_batch(items) и sync(). Упавший write_batch
+    не должен оставлять на диске часть пачки: после ошибки записи
+    повторяются по одной.
+    """
+
+    def __init__(self, fsync_interval=DEFAULT_FSYNC_INTERVAL, name='writer'):
+        self.fsync_interval = fsync_interval
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopped = threading.Event()
+        # Запись и fsync идут под одной блокировкой с flush()
+        self._io_lock = threading.Lock()
+        self._last_sync = time.monotonic()
+        self._dirty = False
+
+        self.batches_written = 0
+        self.items_written = 0
+        self.items_failed = 0
+        self.syncs = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def submit(self, item):
+        """Не блокирует: запись уйдет на диск в фоне"""
+        self._queue.put_nowait(item)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                batch = [self._queue.get(timeout=QUEUE_TIMEOUT)]
+            except queue.Empty:
+                batch = []
+
+            # Забираем все, что накопилось, одной пачкой
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Ошибка не должна останавливать поток: иначе все следующие
+            # записи молча теряются
+            try:
+                with self._io_lock:
+                    if batch:
+                        self._write(batch)
+                    if self._dirty and time.monotonic() - self._last_sync >= self.fsync_interval:
+                        self._sync()
+            except Exception as e:
+                log.error('sync_failed', writer=self.name, error=repr(e))
+
+    def _write(self, batch):
+        try:
+            self.write_batch(batch)
+        except Exception as e:
+            log.error('batch_failed', writer=self.name, items=len(batch), error=repr(e))
+            # По одной: плохая запись не должна утянуть за собой остальные
+            written = []
+            for item in batch:
+                try:
+                    self.write_batch([item])
+                    written.append(item)
+                except Exception as e:
+                    self.items_failed += 1
+                    log.error('item_failed', writer=self.name, error=repr(e))
+            batch = written
+            if not batch:
+                return
+        self.batches_written += 1
+        self.items_written += len(batch)
+        self._dirty = True
+
+    def _sync(self):
+        run_blocking(self.sync)
+        self._dirty = False
+        self._last_sync = time.monotonic()
+        self.syncs += 1
+
+    def flush(self):
+        """Синхронно дописывает очередь и делает fsync"""
+        with self._io_lock:
+            batch = []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            if self._dirty:
+                self._sync()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def write_batch(self, items):
+        raise NotImplementedError
+
+    def sync(self):
+        raise NotImplementedError
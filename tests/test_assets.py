@@ -0,0 +1,81 @@
+import gzip
+
+import pytest
+
+import assets
+from assets import AssetStore
+
+PAGE = ('<html><body>' + 'NoLove ' * 200 + '</body></html>').encode('utf-8')
+
+
+@pytest.fixture
+def store(tmp_path):
+    (tmp_path / 'nolove.html').write_bytes(PAGE)
+    (tmp_path / 'secret.txt').write_text('пароль')
+    (tmp_path / 'public').mkdir()
+    (tmp_path / 'public' / 'index.html').write_bytes(b'<html></html>')
+    (tmp_path / 'public' / 'extra.js').write_text('alert(1)')
+    return AssetStore(str(tmp_path), files=('nolove.html', 'public/index.html', 'missing.html'))
+
+
+def header(headers, name):
+    return dict(headers).get(name)
+
+
+def test_only_listed_files_are_served(store):
+    assert 'nolove.html' in store
+    assert 'public/index.html' in store
+    # Файл из списка, которого нет на диске, просто пропускается
+    assert 'missing.html' not in store
+    for path in ('secret.txt', 'public/extra.js', '../nolove.html', 'public/../secret.txt',
+                 '/etc/passwd', 'public/../../nolove.html'):
+        status, _, body = store.serve(path)
+        assert status == 404
+        assert body == b'Not Found'
+
+
+def test_etag_and_not_modified(store):
+    status, headers, body = store.serve('nolove.html')
+    assert status == 200
+    assert body == PAGE
+    etag = header(headers, 'ETag')
+    assert header(headers, 'Cache-Control') == assets.REVALIDATE
+
+    status, headers, body = store.serve('nolove.html', if_none_match=etag)
+    assert (status, body) == (304, b'')
+    assert header(headers, 'ETag') == etag
+    # Тег сжатого представления той же версии тоже подходит
+    gzip_etag = header(store.serve('nolove.html', accept_encoding='gzip')[1], 'ETag')
+    assert store.serve('nolove.html', if_none_match=f'W/{gzip_etag}')[0] == 304
+    assert store.serve('nolove.html', if_none_match='*')[0] == 304
+    assert store.serve('nolove.html', if_none_match='"0000000000000000"')[0] == 200
+
+
+def test_encoding_negotiation(store):
+    status, headers, body = store.serve('nolove.html', accept_encoding='gzip, deflate')
+    assert header(headers, 'Content-Encoding') == 'gzip'
+    assert header(headers, 'Vary') == 'Accept-Encoding'
+    assert gzip.decompress(body) == PAGE
+    assert header(headers, 'ETag').endswith('-gzip"')
+
+    # q=0 запрещает кодировку
+    _, headers, body = store.serve('nolove.html', accept_encoding='gzip;q=0, identity')
+    assert header(headers, 'Content-Encoding') is None
+    assert body == PAGE
+
+    if assets.brotli is not None:
+        _, headers, body = store.serve('nolove.html', accept_encoding='gzip, br;q=0.5')
+        assert header(headers, 'Content-Encoding') == 'br'
+        assert assets.brotli.decompress(body) == PAGE
+
+
+def test_small_files_are_not_compressed(store):
+    _, headers, body = store.serve('public/index.html', accept_encoding='gzip, br')
+    assert header(headers, 'Content-Encoding') is None
+    assert body == b'<html></html>'
+    assert header(headers, 'Content-Type') == 'text/html; charset=utf-8'
+
+
+def test_parse_accept_encoding():
+    assert assets.parse_accept_encoding('gzip;q=0.8, BR, deflate;q=0, x;q=bad') == {'gzip', 'br'}
+    assert assets.parse_accept_encoding(None) == set()
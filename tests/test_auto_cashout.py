@@ -0,0 +1,90 @@
+import math
+import time
+
+from engine import AutoCashoutIndex, GameEngine, new_game_state
+from history import GameHistory
+from players import PlayerRegistry
+
+
+class FixedCrash:
+    """Источник точек краха для тестов: каждый раунд падает на одном множителе"""
+    last_round = 0
+
+    def __init__(self, crash_point):
+        self.value = crash_point
+
+    def crash_point(self, round_id):
+        return self.value
+
+
+def round_registry(thresholds):
+    registry = PlayerRegistry()
+    for i, threshold in enumerate(thresholds):
+        player = registry.add(f'sid{i}', f'игрок{i}', 1000)
+        player.auto_cashout_multiplier = threshold
+        registry.join_round(player)
+    return registry
+
+
+def test_pop_crossed_returns_thresholds_in_order():
+    registry = round_registry([2.0, 1.5, 3.0, 1.2])
+    index = AutoCashoutIndex()
+    index.rebuild(registry.round_players())
+
+    assert index.pop_crossed(1.1, registry) == []
+    crossed = index.pop_crossed(2.0, registry)
+    assert [p.auto_cashout_multiplier for p in crossed] == [1.2, 1.5, 2.0]
+    assert len(index) == 1
+    assert [p.auto_cashout_multiplier for p in index.pop_crossed(10.0, registry)] == [3.0]
+
+
+def test_pop_crossed_skips_stale_entries():
+    registry = round_registry([1.5, 1.5, 1.5])
+    index = AutoCashoutIndex()
+    index.rebuild(registry.round_players())
+    left, cashed, moved = registry.round_players()
+
+    registry.remove(left.id)
+    cashed.did_cash_out = True
+    # Новый порог попадает в кучу отдельной записью, старая устаревает
+    moved.auto_cashout_multiplier = 2.5
+    index.push(moved)
+
+    assert index.pop_crossed(2.0, registry) == []
+    assert index.pop_crossed(2.5, registry) == [moved]
+    assert len(index) == 0
+
+
+def make_engine(crash_point=3.0):
+    return GameEngine(new_game_state(GameHistory()), lambda *args, **kwargs: None,
+                      cooldown_seconds=0, crash_source=FixedCrash(crash_point))
+
+
+def test_invalid_thresholds_are_rejected():
+    engine = make_engine()
+    engine.register('a', 'Вася')
+
+    for value in (math.nan, math.inf, -math.inf, 1.0, 0, '2.0', None):
+        assert 'error' in engine._set_auto_cashout('a', value)
+        assert engine.players.get('a').auto_cashout_multiplier is None
+
+    engine._set_auto_cashout('a', 1.01)
+    assert engine.players.get('a').auto_cashout_multiplier == 1.01
+
+
+def test_nan_threshold_does_not_block_other_auto_cashouts():
+    engine = make_engine(crash_point=3.0)
+    for sid, name, threshold in (('a', 'Вася', math.nan), ('b', 'Петя', 1.5), ('c', 'Коля', 2.0)):
+        engine.register(sid, name)
+        engine.place_bet(sid, 10)
+        engine.set_auto_cashout(sid, threshold)
+
+    now = time.monotonic()
+    while engine.last_finished_round == 0:
+        engine.tick(now)
+        now += 0.05
+
+    balances = {sid: engine.players.get(sid).balance for sid in 'abc'}
+    assert balances['a'] == 990
+    assert balances['b'] == 990 + 15
+    assert balances['c'] == 990 + 20
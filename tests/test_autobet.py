@@ -0,0 +1,130 @@
+import math
+import time
+
+import pytest
+
+import autobet
+from engine import GameEngine, new_game_state
+from history import GameHistory
+
+
+def test_parse_defaults():
+    program = autobet.parse({'bet': '10'})
+    assert program.strategy == autobet.FIXED
+    assert program.base_bet == program.next_bet == 10
+    assert program.factor == autobet.DEFAULT_FACTOR
+    assert program.cashout is None
+    assert (program.max_rounds, program.take_profit, program.stop_loss) == (0, 0, 0)
+
+
+@pytest.mark.parametrize('settings', [
+    None,
+    {},
+    {'bet': 0},
+    {'bet': 10, 'strategy': 'dalembert'},
+    {'bet': math.inf},
+    {'bet': 'Infinity'},
+    {'bet': 10, 'stopLoss': math.inf},
+    {'bet': 10, 'takeProfit': -math.inf},
+    {'bet': 10, 'takeProfit': math.nan},
+    {'bet': 10, 'rounds': -1},
+    {'bet': 10, 'cashout': 1.0},
+    {'bet': 10, 'cashout': math.nan},
+    {'bet': 10, 'factor': 0.5},
+    {'bet': 10, 'factor': math.inf},
+    {'bet': 10, 'factor': autobet.MAX_FACTOR + 1},
+])
+def test_parse_rejects_invalid_settings(settings):
+    with pytest.raises(ValueError):
+        autobet.parse(settings)
+
+
+def test_fixed_strategy_keeps_the_bet():
+    program = autobet.parse({'bet': 10})
+    assert program.settle(-10) is None
+    assert program.settle(5) is None
+    assert program.next_bet == 10
+    assert (program.rounds, program.profit) == (2, -5)
+
+
+def test_martingale_doubles_after_loss_and_resets_after_win():
+    program = autobet.parse({'bet': 10, 'strategy': autobet.MARTINGALE, 'factor': 1.5})
+    bets = []
+    for profit in (-10, -15, -23, 40, -10):
+        program.settle(profit)
+        bets.append(program.next_bet)
+    assert bets == [15, 23, 35, 10, 15]
+
+
+@pytest.mark.parametrize('settings, profits, reason', [
+    ({'rounds': 3}, (5, -5, 5), autobet.STOP_ROUNDS),
+    ({'takeProfit': 20}, (5, 10, 5), autobet.STOP_PROFIT),
+    ({'stopLoss': 25}, (-10, 5, -20), autobet.STOP_LOSS),
+])
+def test_stop_conditions(settings, profits, reason):
+    program = autobet.parse(dict(settings, bet=10))
+    results = [program.settle(profit) for profit in profits]
+    assert results == [None, None, reason]
+
+
+class FixedCrash:
+    """Каждый раунд падает на одном множителе"""
+    last_round = 0
+
+    def __init__(self, crash_point):
+        self.value = crash_point
+
+    def crash_point(self, round_id):
+        return self.value
+
+
+def make_engine(crash_point=1.5):
+    return GameEngine(new_game_state(GameHistory()), lambda *args, **kwargs: None,
+                      cooldown_seconds=0, crash_source=FixedCrash(crash_point))
+
+
+def play_round(engine, now):
+    finished = engine.last_finished_round
+    while engine.last_finished_round == finished:
+        engine.tick(now)
+        now += 0.05
+    return now
+
+
+def test_inline_start_rejects_infinite_limits():
+    engine = make_engine()
+    engine.register('a', 'Вася')
+    # Без цикла движка команда выполняется сразу: ошибка не должна вылететь в обработчик
+    result = engine.start_auto_bet('a', {'bet': 10, 'stopLoss': math.inf})
+    assert result == {'error': 'Некорректное значение stopLoss'}
+    assert not engine.auto_bets
+
+
+def test_martingale_stops_when_balance_runs_out():
+    engine = make_engine()
+    engine.register('a', 'Вася')
+    assert engine.start_auto_bet('a', {'bet': 300, 'strategy': autobet.MARTINGALE})['success']
+    # Прием ставок открыт: первая ставка сделана сразу
+    assert engine.players.get('a').bet == 300
+
+    # Без вывода ставка проигрывает: 300, затем 600 - баланса хватает
+    now = play_round(engine, time.monotonic())
+    assert engine.auto_bets['a'].next_bet == 600
+    assert engine.players.get('a').bet == 600
+    # 1200 уже больше оставшихся 100
+    play_round(engine, now)
+    assert 'a' not in engine.auto_bets
+    assert engine.players.get('a').balance == 100
+
+
+def test_auto_cashout_program_stops_on_take_profit():
+    engine = make_engine(crash_point=3.0)
+    engine.register('a', 'Вася')
+    assert engine.start_auto_bet('a', {'bet': 100, 'cashout': 2, 'takeProfit': 150})['success']
+
+    now = time.monotonic()
+    for _ in range(2):
+        now = play_round(engine, now)
+    assert 'a' not in engine.auto_bets
+    # Вывод на тике, где множитель прошел 2: выигрыш не меньше 100 за раунд
+    assert 1200 <= engine.players.get('a').balance < 1220
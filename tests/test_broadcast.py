@@ -0,0 +1,105 @@
+import time
+
+import wire
+from broadcast import BATCH_EVENT, BroadcastBatcher
+from engine import GameEngine, new_game_state
+from history import GameHistory
+from players import Player
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event, data=None):
+        self.events.append((event, data))
+
+
+def make_player(sid, username, bet, handle):
+    player = Player(sid, username, 1000, handle)
+    player.bet = bet
+    return player
+
+
+def test_events_are_held_until_flush():
+    sent = Recorder()
+    batcher = BroadcastBatcher(sent)
+    batcher.player_bet(make_player('a', 'Вася', 10, 1))
+    batcher.player_bet(make_player('b', 'Петя', 20, 2))
+    assert len(batcher) == 2
+    assert sent.events == []
+
+    batcher.flush()
+    assert [event for event, _ in sent.events] == [wire.PLAYERS, BATCH_EVENT]
+    assert len(batcher) == 0
+
+    # Пустой сброс ничего не рассылает
+    batcher.flush()
+    assert len(sent.events) == 2
+
+
+def test_batch_keeps_order_of_bets_and_cash_outs():
+    sent = Recorder()
+    batcher = BroadcastBatcher(sent)
+    vasya = make_player('a', 'Вася', 10, 1)
+    petya = make_player('b', 'Петя', 20, 2)
+    batcher.player_bet(vasya)
+    batcher.player_bet(petya)
+    petya.cash_out_multiplier = 1.5
+    batcher.player_cashed_out(petya, 30)
+    vasya.cash_out_multiplier = 2.25
+    batcher.player_cashed_out(vasya, 22)
+    batcher.flush()
+
+    (_, compact), (_, batch) = sent.events
+    assert [p['username'] for p in batch['bets']] == ['Вася', 'Петя']
+    assert [(p['username'], p['multiplier'], p['winnings']) for p in batch['cashOuts']] == [
+        ('Петя', 1.5, 30), ('Вася', 2.25, 22)]
+    assert compact == [[1, 'Вася', 10, 2, 'Петя', 20], [2, 150, 30, 1, 225, 22]]
+
+
+def test_one_emit_per_flush_and_counters():
+    sent = Recorder()
+    batcher = BroadcastBatcher(sent)
+    for i in range(5):
+        batcher.player_bet(make_player(f'sid{i}', f'игрок{i}', 10, i + 1))
+    batcher.flush()
+    batcher.player_bet(make_player('x', 'Коля', 10, 9))
+    batcher.flush()
+
+    assert [event for event, _ in sent.events].count(BATCH_EVENT) == 2
+    assert batcher.stats() == {'events_queued': 6, 'emits_sent': 2, 'emits_saved': 4}
+
+
+def test_legacy_mode_sends_events_one_by_one_at_flush():
+    sent = Recorder()
+    batcher = BroadcastBatcher(sent, legacy=True)
+    player = make_player('a', 'Вася', 10, 1)
+    batcher.player_bet(player)
+    player.cash_out_multiplier = 2.0
+    batcher.player_cashed_out(player, 20)
+    assert sent.events == []
+
+    batcher.flush()
+    assert [event for event, _ in sent.events] == [wire.PLAYERS, 'player_bet', 'player_cashed_out']
+    assert batcher.stats() == {'events_queued': 2, 'emits_sent': 2, 'emits_saved': 0}
+
+
+def test_engine_flushes_player_events_before_phase_events():
+    sent = []
+    engine = GameEngine(new_game_state(GameHistory()),
+                        lambda event, data=None, **kwargs: sent.append(event), cooldown_seconds=0)
+    engine.register('a', 'Вася')
+    engine.register('b', 'Петя')
+    engine.place_bet('a', 10)
+    engine.place_bet('b', 10)
+    # Ставки копятся до тика: одна пачка на обе
+    assert BATCH_EVENT not in sent
+
+    now = time.monotonic()
+    while 'game_start' not in sent:
+        engine.tick(now)
+        now += 0.05
+    phases = [event for event in sent if event in (BATCH_EVENT, 'countdown_start', 'game_start')]
+    assert phases == [BATCH_EVENT, 'countdown_start', 'game_start']
+    assert engine.broadcasts.stats()['emits_saved'] == 1
@@ -0,0 +1,105 @@
+import chat
+from chat import ChatRoom
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_room(monkeypatch, names, rate=1.0, burst=3):
+    clock = Clock()
+    monkeypatch.setattr(chat.time, 'monotonic', clock)
+    sent = []
+    room = ChatRoom(lambda event, data: sent.append((event, data)), names.get, rate=rate, burst=burst)
+    return room, clock, sent
+
+
+def test_bucket_refills_with_time(monkeypatch):
+    room, clock, _ = make_room(monkeypatch, {'a': 'Вася'})
+    for _ in range(3):
+        assert room.post('a', 'привет') == {'success': True}
+    assert 'error' in room.post('a', 'привет')
+
+    # Полсекунды - еще не целый жетон
+    clock.now += 0.5
+    assert 'error' in room.post('a', 'привет')
+    clock.now += 0.5
+    assert room.post('a', 'привет') == {'success': True}
+    assert 'error' in room.post('a', 'привет')
+
+    # Корзина не наполняется выше burst
+    clock.now += 100
+    for _ in range(3):
+        assert room.post('a', 'привет') == {'success': True}
+    assert 'error' in room.post('a', 'привет')
+    assert room.messages_accepted == 7
+    assert room.messages_rejected == 4
+
+
+def test_limit_is_per_username(monkeypatch):
+    room, _, _ = make_room(monkeypatch, {'a': 'Вася', 'b': 'Петя'})
+    for _ in range(3):
+        room.post('a', 'привет')
+    assert 'error' in room.post('a', 'привет')
+    assert room.post('b', 'привет') == {'success': True}
+
+
+def test_reconnect_does_not_reset_limit(monkeypatch):
+    names = {'a': 'Вася'}
+    room, clock, _ = make_room(monkeypatch, names)
+    for _ in range(3):
+        room.post('a', 'привет')
+
+    # Тот же игрок с новым сокетом
+    del names['a']
+    names['b'] = 'Вася'
+    assert 'error' in room.post('b', 'привет')
+    clock.now += 1
+    assert room.post('b', 'привет') == {'success': True}
+
+
+def test_idle_buckets_expire_on_sweep(monkeypatch):
+    room, clock, _ = make_room(monkeypatch, {'a': 'Вася', 'b': 'Петя'})
+    room.post('a', 'привет')
+    clock.now += 2
+    room.post('b', 'привет')
+
+    # Проход раз в SWEEP_INTERVAL: до него корзины живут
+    clock.now = room._last_sweep + chat.SWEEP_INTERVAL - 0.1
+    room.flush()
+    assert set(room.buckets) == {'Вася', 'Петя'}
+
+    # Корзина Васи простояла burst / rate секунд, Пети - еще нет
+    clock.now = 1000.0 + chat.SWEEP_INTERVAL
+    room.buckets['Петя'].updated = clock.now - 1
+    room.flush()
+    assert set(room.buckets) == {'Петя'}
+
+
+def test_expired_bucket_starts_full(monkeypatch):
+    room, clock, _ = make_room(monkeypatch, {'a': 'Вася'})
+    for _ in range(3):
+        room.post('a', 'привет')
+    clock.now += chat.SWEEP_INTERVAL
+    room.flush()
+    assert room.buckets == {}
+    for _ in range(3):
+        assert room.post('a', 'привет') == {'success': True}
+    assert 'error' in room.post('a', 'привет')
+
+
+def test_flush_sends_one_batch(monkeypatch):
+    room, _, sent = make_room(monkeypatch, {'a': 'Вася'})
+    assert 'error' in room.post('x', 'привет')
+    room.post('a', ' раз ')
+    room.post('a', 'два')
+    room.flush()
+    assert sent == [('chat_batch', {'messages': [
+        {'username': 'Вася', 'message': 'раз'},
+        {'username': 'Вася', 'message': 'два'},
+    ]})]
+    assert room.recent()['messages'] == sent[0][1]['messages']
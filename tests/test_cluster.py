@@ -0,0 +1,77 @@
+from cluster import EngineBusServer
+from engine import GameEngine, new_game_state
+from history import GameHistory
+
+
+class FakeConnection:
+    """Шлюз без сокета: ответы и события копятся в списке"""
+
+    def __init__(self):
+        self.sids = {}
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+
+def make_server():
+    server = EngineBusServer('/nonexistent')
+    server.engines = {'main': GameEngine(new_game_state(GameHistory()), server.emit, cooldown_seconds=0)}
+    return server, server.engines['main']
+
+
+def register(server, conn, sid, username, req):
+    server.handle(conn, {'op': 'register', 'room': 'main', 'req': req, 'args': [sid, username]})
+
+
+def test_register_routes_events_to_gateway():
+    server, engine = make_server()
+    conn = FakeConnection()
+    register(server, conn, 'a', 'Вася', 1)
+    engine._drain_commands()
+
+    # player_registered пришел до ответа на команду - через тот же шлюз
+    assert [m.get('event', m.get('req')) for m in conn.sent] == ['player_registered', 1]
+    assert conn.sent[1]['result'] == {'success': True}
+    assert server.owners == {'a': conn}
+    assert conn.sids == {'a': 'main'}
+
+
+def test_failed_register_leaves_no_owner():
+    server, engine = make_server()
+    first, second = FakeConnection(), FakeConnection()
+    register(server, first, 'a', 'Вася', 1)
+    engine._drain_commands()
+
+    # Имя занято: sid второго шлюза не должен остаться за ним
+    register(server, second, 'b', 'Вася', 2)
+    engine._drain_commands()
+    assert 'error' in second.sent[-1]['result']
+    assert 'b' not in server.owners
+    assert second.sids == {}
+    assert server.owners == {'a': first}
+
+
+def test_failed_register_keeps_previous_owner():
+    server, engine = make_server()
+    first, second = FakeConnection(), FakeConnection()
+    register(server, first, 'a', 'Вася', 1)
+    engine._drain_commands()
+
+    # Повтор с тем же sid через другой шлюз и некорректным именем
+    register(server, second, 'a', '', 2)
+    engine._drain_commands()
+    assert 'error' in second.sent[-1]['result']
+    assert server.owners == {'a': first}
+    assert first.sids == {'a': 'main'}
+    assert second.sids == {}
+
+
+def test_failed_resume_without_reply_leaves_no_owner():
+    server, engine = make_server()
+    conn = FakeConnection()
+    server.handle(conn, {'op': 'resume', 'room': 'main', 'args': ['a', 'unknown-token']})
+    engine._drain_commands()
+    assert conn.sent == []
+    assert server.owners == {}
+    assert conn.sids == {}
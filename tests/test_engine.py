@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+import engine as engine_module
+from engine import GameEngine, new_game_state
+from history import GameHistory
+
+
+@pytest.fixture
+def engine():
+    game = GameEngine(new_game_state(GameHistory()), lambda *args, **kwargs: None)
+    # Как в run_forever: команды ждут тика, а не выполняются сразу
+    game._running = True
+    return game
+
+
+def call_in_thread(fn, *args):
+    box = []
+    thread = threading.Thread(target=lambda: box.append(fn(*args)), daemon=True)
+    thread.start()
+    return thread, box
+
+
+def wait_for_commands(engine, count):
+    deadline = time.monotonic() + 5
+    while len(engine.commands) < count and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert len(engine.commands) == count
+
+
+def test_commands_run_in_submission_order(engine):
+    results = []
+
+    def reply(tag):
+        return lambda result: results.append((tag, result))
+
+    engine.submit('place_bet', 'a', 10, callback=reply('bet before register'))
+    engine.submit('register', 'a', 'Вася', callback=reply('register'))
+    engine.submit('place_bet', 'a', 10, callback=reply('bet'))
+    engine.submit('place_bet', 'a', 10, callback=reply('second bet'))
+    assert not engine.players
+
+    engine.tick(time.monotonic())
+
+    assert [tag for tag, _ in results] == ['bet before register', 'register', 'bet', 'second bet']
+    assert 'error' in results[0][1]
+    assert results[1][1]['success']
+    assert results[2][1]['success']
+    assert 'error' in results[3][1]
+    assert engine.players.get('a').bet == 10
+    assert not engine.commands
+
+
+def test_commands_from_a_tick_wait_for_the_next_one(engine):
+    results = []
+
+    def register_second(result):
+        results.append(result)
+        engine.submit('register', 'b', 'Петя', callback=results.append)
+
+    engine.submit('register', 'a', 'Вася', callback=register_second)
+    engine.tick(time.monotonic())
+    assert len(results) == 1
+    assert len(engine.commands) == 1
+
+    engine.tick(time.monotonic())
+    assert len(results) == 2
+    assert len(engine.players) == 2
+
+
+def test_failing_command_does_not_stop_the_batch(engine):
+    results = []
+    # Лишний аргумент: команда падает с TypeError
+    engine.submit('register', 'a', 'Вася', None, 'лишний', callback=results.append)
+    engine.submit('register', 'b', 'Петя', callback=results.append)
+    engine.tick(time.monotonic())
+    assert results[0] == {'error': 'Внутренняя ошибка сервера'}
+    assert results[1]['success']
+
+
+def test_call_waits_for_the_tick(engine):
+    thread, box = call_in_thread(engine.register, 'a', 'Вася')
+    wait_for_commands(engine, 1)
+    assert not box
+
+    engine.tick(time.monotonic())
+    thread.join(5)
+    assert box[0]['success']
+    assert engine.players.get('a').username == 'Вася'
+
+
+def test_timed_out_call_is_cancelled(engine, monkeypatch):
+    monkeypatch.setattr(engine_module, 'COMMAND_TIMEOUT', 0.05)
+    thread, box = call_in_thread(engine.register, 'a', 'Вася')
+    thread.join(5)
+    assert box == [{'error': 'Сервер не ответил'}]
+
+    # Тик дошел до команды после ответа об ошибке: она не выполняется
+    engine.tick(time.monotonic())
+    assert not engine.players
+    assert engine.commands_cancelled == 1
+    assert 'Вася' not in engine.active_names
+
+
+def test_enqueue_without_loop_runs_inline():
+    game = GameEngine(new_game_state(GameHistory()), lambda *args, **kwargs: None)
+    assert game.register('a', 'Вася')['success']
+    assert game.place_bet('a', 10)['success']
+    assert not game.commands
+
+
+def test_switching_tables_waits_for_the_round_end():
+    game = GameEngine(new_game_state(GameHistory()), lambda *args, **kwargs: None,
+                      cooldown_seconds=0)
+    game.register('a', 'Вася')
+    game.place_bet('a', 10)
+    now = time.monotonic()
+    while 'a' not in game.players.in_round:
+        game.tick(now)
+        now += 0.05
+
+    assert game.leave('a', switching=True) == {'error': 'Сменить стол можно после окончания раунда'}
+    assert game.players.get('a') is not None
+
+    # Обычный уход (отключение) не откладывается
+    assert game.leave('a') == {'balance': 990}
+    assert game.players.get('a') is None
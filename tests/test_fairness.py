@@ -0,0 +1,87 @@
+import hashlib
+
+import pytest
+
+import fairness
+from engine import GameEngine, new_game_state
+from history import GameHistory
+
+
+@pytest.fixture
+def chain(tmp_path):
+    path = str(tmp_path / 'chain.bin')
+    terminal = fairness.generate_chain(path, 20, seed=b'\x01' * fairness.SEED_SIZE)
+    chain = fairness.HashChain(path)
+    yield chain, terminal
+    chain.close()
+
+
+def test_chain_links_every_round(chain):
+    chain, terminal = chain
+    assert chain.terminal.hex() == terminal
+    for round_id in range(1, chain.rounds + 1):
+        assert hashlib.sha256(chain.seed(round_id)).digest() == chain.previous_hash(round_id)
+    with pytest.raises(IndexError):
+        chain.seed(chain.rounds + 1)
+
+
+def test_verify_matches_crash_point(chain):
+    chain, _ = chain
+    source = fairness.ProvablyFairSource(chain, 'соль', fairness.HOUSE_EDGE)
+    try:
+        for round_id in (1, 2, 20):
+            crash_point = source.crash_point(round_id)
+            result = source.verify(round_id)
+            assert result['hashValid']
+            assert result['crashPoint'] == round(crash_point, 2)
+            assert result['seed'] == source.seed_hex(round_id)
+        assert source.crash_point(21) is None
+    finally:
+        source._writer.stop()
+    # Номер использованного раунда пишет фоновый поток
+    assert fairness.ProvablyFairSource(chain, 'соль').last_round == 20
+
+
+def test_verify_depends_on_salt(chain):
+    chain, _ = chain
+    a = fairness.ProvablyFairSource(chain, 'a').verify(3)
+    b = fairness.ProvablyFairSource(chain, 'b').verify(3)
+    assert a['hashValid'] and b['hashValid']
+    assert a['seed'] == b['seed']
+    assert a['crashPoint'] != b['crashPoint']
+
+
+def play_round(engine, now):
+    engine.register('sid', 'Вася')
+    engine.place_bet('sid', 10)
+    finished = engine.last_finished_round
+    while engine.last_finished_round == finished:
+        engine.tick(now)
+        now += 0.05
+    return now
+
+
+def test_engine_verify_round(chain):
+    chain, _ = chain
+    source = fairness.ProvablyFairSource(chain, 'соль')
+    results = []
+
+    def emit(event, data=None, **kwargs):
+        if event == 'game_crash':
+            results.append(data)
+
+    engine = GameEngine(new_game_state(GameHistory()), emit, crash_source=source, cooldown_seconds=0)
+    try:
+        now = play_round(engine, 1000.0)
+        assert engine.verify_round(2) == {'error': 'Раунд еще не завершен или сыгран без цепочки'}
+        play_round(engine, now)
+    finally:
+        source._writer.stop()
+
+    for data in results:
+        round_id = data['gameResult']['id']
+        verified = engine.verify_round(round_id)
+        assert verified['hashValid']
+        assert verified['seed'] == data['gameResult']['seed']
+        assert f"{verified['crashPoint']:.2f}" == data['crashPoint']
+    assert len(results) == 2
@@ -0,0 +1,93 @@
+from leaderboard import DAY_SECONDS, Leaderboard
+from round_log import RoundLog
+
+
+def make_round(round_id):
+    return {
+        'id': round_id,
+        'multiplier': 2.0,
+        'timestamp': 1700000000.0 + round_id * 3600,
+        'players': [
+            {'username': 'Вася', 'bet': 10, 'didCashOut': True,
+             'cashOutMultiplier': 1 + round_id / 10, 'profit': round_id},
+            {'username': 'Петя', 'bet': 20, 'didCashOut': False,
+             'cashOutMultiplier': 0.0, 'profit': -20}
+        ]
+    }
+
+
+def write_log(directory, ids, snapshot_at=None):
+    log = RoundLog(directory)
+    log.start()
+    board = Leaderboard()
+    for round_id in ids:
+        result = make_round(round_id)
+        log.append(result)
+        board.add_round(result)
+        if round_id == snapshot_at:
+            log.save_leaderboard(board.export(round_id))
+    log.close()
+    return board
+
+
+def replayed(directory):
+    log = RoundLog(directory)
+    try:
+        board = Leaderboard()
+        board.replay(log)
+        return board
+    finally:
+        log.close()
+
+
+def test_snapshot_replay_matches_live_board(tmp_path):
+    live = write_log(str(tmp_path), range(1, 51), snapshot_at=30)
+
+    board = replayed(str(tmp_path))
+    assert board.totals == live.totals
+    assert board.snapshot() == live.snapshot()
+    assert board.player_stats('Вася') == live.player_stats('Вася')
+
+
+def test_replay_starts_after_snapshot(tmp_path):
+    write_log(str(tmp_path), range(1, 11), snapshot_at=10)
+
+    log = RoundLog(str(tmp_path))
+    try:
+        read = []
+        get = log.get
+        log.get = lambda round_id: read.append(round_id) or get(round_id)
+        board = Leaderboard()
+        board.replay(log)
+        # Раунды до снимка из журнала не читаются
+        assert read == []
+        assert board.totals['Петя'] == [10, 200, -200, 0.0]
+    finally:
+        log.close()
+
+
+def test_replay_without_snapshot(tmp_path):
+    live = write_log(str(tmp_path), range(1, 21))
+
+    board = replayed(str(tmp_path))
+    assert board.totals == live.totals
+    assert board.snapshot() == live.snapshot()
+
+
+def test_daily_view_is_empty_after_midnight_before_next_round():
+    board = Leaderboard()
+    first = make_round(1)
+    board.add_round(first)
+    today = first['timestamp']
+    assert [entry['username'] for entry in board.snapshot(today)['daily']] == ['Вася', 'Петя']
+
+    tomorrow = (today // DAY_SECONDS + 1) * DAY_SECONDS + 1
+    snapshot = board.snapshot(tomorrow)
+    assert snapshot['daily'] == []
+    # Итоги за все время не сбрасываются
+    assert snapshot['profit'] == board.snapshot(today)['profit']
+
+    next_round = dict(make_round(2), timestamp=tomorrow)
+    board.add_round(next_round)
+    assert board.snapshot(tomorrow)['daily'] == [
+        {'username': 'Вася', 'value': 2}, {'username': 'Петя', 'value': -20}]
@@ -0,0 +1,147 @@
+import errno
+import os
+import time
+
+import ledger
+import storage
+from ledger import Ledger
+
+
+def test_round_trip_after_reopen(tmp_path):
+    book = Ledger(str(tmp_path))
+    book.start()
+    book.record('Вася', 1000, 1000, ledger.REGISTER)
+    book.record('Вася', -100, 900, ledger.BET)
+    book.record('Петя', 1000, 1000, ledger.REGISTER)
+    book.commit()
+    book.record('Вася', 250, 1150, ledger.CASH_OUT)
+    book.commit()
+    book.close()
+
+    book = Ledger(str(tmp_path))
+    try:
+        assert book.balances == {'Вася': 1150, 'Петя': 1000}
+        assert book.seq == 4
+        assert book.balance('Вася') == 1150
+        assert book.balance('Коля') is None
+    finally:
+        book.close()
+
+
+def test_recovery_from_snapshot_and_wal_tail(tmp_path):
+    book = Ledger(str(tmp_path), snapshot_entries=2)
+    book.start()
+    book.record('Вася', 1000, 1000, ledger.REGISTER)
+    book.record('Вася', -100, 900, ledger.BET)
+    book.commit()
+    book.flush()
+    assert os.path.exists(tmp_path / ledger.SNAPSHOT_NAME)
+
+    # После снимка - еще одна запись, она только в WAL
+    book.record('Вася', -50, 850, ledger.BET)
+    book.commit()
+    book.stop()
+    os.close(book.wal_fd)
+
+    book = Ledger(str(tmp_path))
+    try:
+        assert book.balances == {'Вася': 850}
+        assert book.seq == 3
+    finally:
+        book.close()
+
+
+def test_recovery_truncates_torn_entry(tmp_path):
+    book = Ledger(str(tmp_path))
+    book.start()
+    book.record('Вася', 1000, 1000, ledger.REGISTER)
+    book.record('Вася', -100, 900, ledger.BET)
+    book.commit()
+    book.stop()
+    os.close(book.wal_fd)
+
+    wal = tmp_path / ledger.WAL_NAME
+    size = wal.stat().st_size
+    os.truncate(wal, size - 3)
+
+    book = Ledger(str(tmp_path))
+    try:
+        assert book.balances == {'Вася': 1000}
+        assert book.seq == 1
+        # Оборванная запись отрезана: новые записи идут за целыми
+        assert wal.stat().st_size == size // 2
+    finally:
+        book.close()
+
+
+def test_decode_stops_at_corrupted_entry():
+    data = (ledger.encode_entry(1, 'Вася', 1000, 1000, ledger.REGISTER)
+            + ledger.encode_entry(2, 'Вася', -100, 900, ledger.BET))
+    broken = bytearray(data)
+    broken[-1] ^= 0xFF
+    entries, valid = ledger.decode_entries(bytes(broken))
+    assert [entry[0] for entry in entries] == [1]
+    assert valid == len(data) // 2
+
+
+def test_writer_survives_bad_entry(tmp_path):
+    book = Ledger(str(tmp_path))
+    book.start()
+    # Имя не строка: запись не кодируется, но поток записи должен жить
+    book.submit([(1, 123, 1, 1, ledger.REGISTER)])
+    book.record('Вася', 1000, 1000, ledger.REGISTER)
+    book.commit()
+    deadline = time.monotonic() + 5
+    while book.items_written < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    try:
+        assert book._thread.is_alive()
+        assert book.items_failed == 1
+        assert book.items_written == 1
+    finally:
+        book.close()
+
+    book = Ledger(str(tmp_path))
+    try:
+        assert book.balances == {'Вася': 1000}
+    finally:
+        book.close()
+
+
+def test_short_write_is_rolled_back_before_retry(tmp_path, monkeypatch):
+    book = Ledger(str(tmp_path))
+    book.record('Вася', 1000, 1000, ledger.REGISTER)
+    book.commit()
+    book.flush()
+
+    failures = []
+
+    def short_write(fd, data):
+        # Первая пачка попадает на диск наполовину, как при ENOSPC
+        if not failures:
+            failures.append(len(data))
+            os.write(fd, data[:len(data) // 2])
+            raise OSError(errno.ENOSPC, 'No space left on device')
+        storage.write_all(fd, data)
+
+    monkeypatch.setattr(ledger, 'write_all', short_write)
+    book.record('Вася', -100, 900, ledger.BET)
+    book.commit()
+    book.record('Петя', 1000, 1000, ledger.REGISTER)
+    book.commit()
+    book.flush()
+    assert failures
+    assert book.items_failed == 0
+    book.close()
+
+    data = (tmp_path / ledger.WAL_NAME).read_bytes()
+    entries, valid = ledger.decode_entries(data)
+    assert valid == len(data)
+    assert [entry[0] for entry in entries] == [1, 2, 3]
+
+    book = Ledger(str(tmp_path))
+    try:
+        assert book.balances == {'Вася': 900, 'Петя': 1000}
+        assert book.seq == 3
+    finally:
+        book.close()
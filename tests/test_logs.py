@@ -0,0 +1,45 @@
+import io
+import json
+import logging
+
+import logs
+
+
+def routed_logger(name):
+    writer = logs.Writer(io.StringIO())
+    logger = logging.getLogger(name)
+    logger.addHandler(logs.Handler(writer))
+    logger.propagate = False
+    return writer, logger
+
+
+def written(writer):
+    writer.flush()
+    return [json.loads(line) for line in writer.stream.getvalue().splitlines()]
+
+
+def test_standard_logging_record_is_routed():
+    writer, logger = routed_logger('test.routed')
+    logger.warning('disk %s', 'full')
+
+    [entry] = written(writer)
+    assert entry['level'] == 'warning'
+    assert entry['logger'] == 'test.routed'
+    assert entry['event'] == 'disk full'
+    assert 'exc' not in entry
+
+
+def test_exception_record_keeps_traceback(capsys):
+    writer, logger = routed_logger('test.exception')
+    try:
+        raise RuntimeError('обработчик упал')
+    except RuntimeError:
+        logger.exception('message async handler error')
+
+    [entry] = written(writer)
+    assert entry['level'] == 'error'
+    assert entry['event'] == 'message async handler error'
+    assert entry['exc'].startswith('Traceback')
+    assert 'RuntimeError: обработчик упал' in entry['exc']
+    # Запись не ушла в handleError
+    assert capsys.readouterr().err == ''
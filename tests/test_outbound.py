@@ -0,0 +1,145 @@
+import json
+
+from socketio import packet
+
+import outbound
+
+
+class FakeQueue:
+    def __init__(self):
+        self.depth = 0
+
+    def qsize(self):
+        return self.depth
+
+
+class FakeSocket:
+    def __init__(self):
+        self.queue = FakeQueue()
+
+
+class FakeEngineIO:
+    def __init__(self):
+        self.sockets = {}
+        self.sent = {}
+
+    def send(self, eio_sid, encoded):
+        self.sent.setdefault(eio_sid, []).append(encoded)
+
+
+class FakeManager:
+    def __init__(self):
+        self.rooms = {'/': {}}
+
+    def get_participants(self, namespace, room):
+        return list(self.rooms[namespace].get(room, {}).items())
+
+
+class FakeServer:
+    """Минимум socketio.Server, который нужен ClientQueues"""
+    packet_class = packet.Packet
+
+    def __init__(self):
+        self.eio = FakeEngineIO()
+        self.manager = FakeManager()
+        self.disconnected = []
+
+    def connect(self, sid, room):
+        eio_sid = 'eio-' + sid
+        self.eio.sockets[eio_sid] = FakeSocket()
+        self.manager.rooms['/'].setdefault(room, {})[sid] = eio_sid
+
+    def set_depth(self, sid, depth):
+        self.eio.sockets['eio-' + sid].queue.depth = depth
+
+    def received(self, sid):
+        """Имена событий, отправленных клиенту, по порядку"""
+        return [json.loads(encoded[1:])[0] for encoded in self.eio.sent.pop('eio-' + sid, [])]
+
+    def start_background_task(self, fn, *args):
+        fn(*args)
+
+    def disconnect(self, sid, namespace=None):
+        self.disconnected.append(sid)
+
+
+def make_queues(limit=4, max_depth=100):
+    server = FakeServer()
+    server.connect('fast', 'main')
+    server.connect('slow', 'main')
+    return server, outbound.ClientQueues(server, limit=limit, max_depth=max_depth)
+
+
+def test_fast_client_gets_everything_in_order():
+    server, queues = make_queues()
+    for event in ('countdown_start', 'countdown_update', 'players_batch', 'game_start', 'multiplier_update'):
+        assert queues.emit(event, {}, room='main') > 0
+    assert server.received('fast') == [
+        'countdown_start', 'countdown_update', 'players_batch', 'game_start', 'multiplier_update']
+
+
+def test_congested_client_keeps_only_latest_multiplier():
+    server, queues = make_queues()
+    server.set_depth('slow', 4)
+    for value in (1.1, 1.2, 1.3):
+        queues.emit('multiplier_update', {'multiplier': value}, room='main')
+    assert server.received('slow') == []
+    assert queues.collapsed == 3
+
+    server.set_depth('slow', 0)
+    queues.emit('chat_messages', {}, room='main')
+    sent = server.eio.sent.pop('eio-slow')
+    assert [json.loads(encoded[1:]) for encoded in sent] == [
+        ['multiplier_update', {'multiplier': 1.3}], ['chat_messages', {}]]
+
+
+def test_congested_backlog_is_bounded_and_phase_goes_first():
+    server, queues = make_queues(limit=4)
+    server.set_depth('slow', 4)
+    for _ in range(10):
+        queues.emit('players_batch', {'bets': [], 'cashOuts': []}, room='main')
+    queues.emit('chat_messages', {}, room='main')
+    queues.emit('multiplier_update', {'multiplier': 2.0}, room='main')
+
+    # Очередь клиента не растет: ничего из частого не ушло
+    assert server.received('slow') == []
+    assert len(queues.backlog['slow']) == 4
+    assert queues.dropped == 7
+
+    # game_crash уходит сразу и отменяет устаревшие события раунда
+    queues.emit('game_crash', {'crashPoint': '2.00'}, room='main')
+    assert server.received('slow') == ['game_crash']
+    assert [event for event, _ in queues.backlog['slow']] == ['chat_messages']
+    assert 'slow' not in queues.pending
+
+    # Очередь освободилась: чат уходит перед новым событием
+    server.set_depth('slow', 0)
+    queues.emit('countdown_start', {'timeLeft': 5}, room='main')
+    assert server.received('slow') == ['chat_messages', 'countdown_start']
+    assert 'slow' not in queues.backlog
+    assert server.received('fast')[-2:] == ['game_crash', 'countdown_start']
+
+
+def test_stuck_client_is_disconnected_once():
+    server, queues = make_queues(max_depth=8)
+    server.set_depth('slow', 8)
+    queues.emit('game_start', {}, room='main')
+    queues.emit('game_crash', {}, room='main')
+    assert server.disconnected == ['slow']
+    assert queues.disconnected == 1
+    assert server.received('slow') == []
+
+    queues.forget('slow')
+    assert 'slow' not in queues.closing
+
+
+def test_reset_drops_deferred_packets_of_the_old_table():
+    server, queues = make_queues()
+    server.set_depth('slow', 4)
+    queues.emit('multiplier_update', {'multiplier': 5.0}, room='main')
+    queues.emit('players_batch', {}, room='main')
+
+    queues.reset('slow')
+    server.set_depth('slow', 0)
+    queues.emit('countdown_start', {}, room='main')
+    assert server.received('slow') == ['countdown_start']
@@ -0,0 +1,143 @@
+import errno
+import os
+
+import players
+import round_log
+import storage
+from round_log import RoundLog
+
+
+def make_round(round_id, names=('Вася', 'Петя')):
+    return {
+        'id': round_id,
+        'multiplier': 1.5 + round_id / 100,
+        'timestamp': 1700000000.0 + round_id,
+        'players': [
+            {'username': name, 'bet': 10 * (i + 1), 'didCashOut': i == 0,
+             'cashOutMultiplier': 1.25 if i == 0 else 0.0, 'profit': 2 if i == 0 else -20}
+            for i, name in enumerate(names)
+        ]
+    }
+
+
+def write_rounds(directory, ids, **kwargs):
+    log = RoundLog(directory, **kwargs)
+    log.start()
+    for round_id in ids:
+        log.append(make_round(round_id))
+    log.close()
+
+
+def test_round_trip_after_reopen(tmp_path):
+    write_rounds(str(tmp_path), range(1, 21))
+
+    log = RoundLog(str(tmp_path))
+    try:
+        assert (log.first_round_id, log.last_round_id) == (1, 20)
+        result = log.get(7)
+        expected = make_round(7)
+        assert result['id'] == 7
+        assert result['multiplier'] == expected['multiplier']
+        assert [p['username'] for p in result['players']] == ['Вася', 'Петя']
+        assert [p['profit'] for p in result['players']] == [2, -20]
+        assert [r['id'] for r in log.recent(3)] == [20, 19, 18]
+        assert log.get(21) is None
+    finally:
+        log.close()
+
+
+def test_append_continues_after_reopen(tmp_path):
+    write_rounds(str(tmp_path), range(1, 6))
+    write_rounds(str(tmp_path), range(6, 11))
+
+    log = RoundLog(str(tmp_path))
+    try:
+        assert log.last_round_id == 10
+        assert all(log.get(i)['id'] == i for i in range(1, 11))
+    finally:
+        log.close()
+
+
+def test_recovery_drops_torn_tail(tmp_path):
+    write_rounds(str(tmp_path), range(1, 11))
+    segment = tmp_path / round_log.segment_name(1)
+    # Обрыв посреди последней записи
+    os.truncate(segment, segment.stat().st_size - 5)
+
+    log = RoundLog(str(tmp_path))
+    try:
+        assert log.last_round_id == 9
+        assert log.get(9)['id'] == 9
+        assert log.get(10) is None
+        log.start()
+        log.append(make_round(10))
+        log.flush()
+        assert log.get(10)['id'] == 10
+    finally:
+        log.close()
+
+
+def test_rotation_and_retention(tmp_path):
+    record = len(round_log.encode_round(make_round(1)))
+    write_rounds(str(tmp_path), range(1, 31), segment_bytes=record * 5, retain_rounds=10)
+
+    log = RoundLog(str(tmp_path))
+    try:
+        assert log.last_round_id == 30
+        assert log.first_round_id > 1
+        assert log.get(1) is None
+        assert all(log.get(i)['id'] == i for i in range(log.first_round_id, 31))
+    finally:
+        log.close()
+
+
+def test_encode_username_cuts_on_character_boundary():
+    assert round_log.encode_username('Вася') == 'Вася'.encode('utf-8')
+    # 33 байта: последний двухбайтовый символ не помещается целиком
+    encoded = round_log.encode_username('a' + 'я' * 16)
+    assert len(encoded) == 31
+    assert encoded.decode('utf-8') == 'a' + 'я' * 15
+
+
+def test_short_write_is_rolled_back_before_retry(tmp_path, monkeypatch):
+    failures = []
+
+    def short_write(fd, data):
+        # Первая запись попадает в сегмент наполовину, как при ENOSPC
+        if not failures:
+            failures.append(len(data))
+            os.write(fd, data[:len(data) // 2])
+            raise OSError(errno.ENOSPC, 'No space left on device')
+        storage.write_all(fd, data)
+
+    monkeypatch.setattr(round_log, 'write_all', short_write)
+    log = RoundLog(str(tmp_path))
+    log.append(make_round(1))
+    log.append(make_round(2))
+    log.flush()
+    assert failures
+    assert log.items_failed == 0
+    assert [log.get(i)['id'] for i in (1, 2)] == [1, 2]
+    log.close()
+
+    log = RoundLog(str(tmp_path))
+    try:
+        assert log.last_round_id == 2
+        assert log.get(1)['id'] == 1
+    finally:
+        log.close()
+
+
+def test_longest_allowed_name_round_trips(tmp_path):
+    name = 'я' * (round_log.USERNAME_BYTES // 2)
+    assert players.username_error(name) is None
+
+    log = RoundLog(str(tmp_path))
+    log.append(make_round(1, names=(name,)))
+    log.close()
+
+    log = RoundLog(str(tmp_path))
+    try:
+        assert log.get(1)['players'][0]['username'] == name
+    finally:
+        log.close()
@@ -0,0 +1,152 @@
+import json
+import time
+
+import wire
+from engine import GameEngine, RUNNING, new_game_state
+from history import GameHistory
+
+
+def decode_players(payload, handles):
+    """Разбор события p, как в nolove.html: имя приходит только со ставкой"""
+    bets, cash_outs = payload[0], payload[1]
+    decoded_bets = []
+    for i in range(0, len(bets), 3):
+        handles[bets[i]] = (bets[i + 1], bets[i + 2])
+        decoded_bets.append({'username': bets[i + 1], 'bet': bets[i + 2]})
+    decoded_cash_outs = []
+    for i in range(0, len(cash_outs), 3):
+        username, bet = handles[cash_outs[i]]
+        decoded_cash_outs.append({'username': username, 'bet': bet,
+                                  'multiplier': cash_outs[i + 1] / 100, 'winnings': cash_outs[i + 2]})
+    return decoded_bets, decoded_cash_outs
+
+
+def test_compact_batch_round_trip():
+    batch = wire.CompactBatch()
+    batch.player_bet(3, 'Вася', 10)
+    batch.player_bet(7, 'Петя', 25)
+    batch.player_cashed_out(3, 2.345, 23)
+
+    handles = {}
+    bets, cash_outs = decode_players(batch.take(), handles)
+    assert bets == [{'username': 'Вася', 'bet': 10}, {'username': 'Петя', 'bet': 25}]
+    assert cash_outs == [{'username': 'Вася', 'bet': 10, 'multiplier': 2.35, 'winnings': 23}]
+    assert not batch
+    assert batch.take() == [[], []]
+
+
+def test_multiplier_encoding():
+    assert wire.multiplier(1.0) == 100
+    assert wire.multiplier(3.4199999) == 342
+    assert wire.multiplier(12.35, 1700000000000) == [1235, 1700000000000]
+
+
+def test_rooms_for_encodings():
+    assert wire.rooms_for('main', True) == ('main', 'main/c')
+    assert wire.room_for_event('main', 'players_batch') == 'main/j'
+    assert wire.room_for_event('main', wire.PLAYERS) == 'main/c'
+    assert wire.room_for_event('main', 'game_crash') == 'main'
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event, data=None, to=None, **kwargs):
+        if to is None:
+            self.events.append((event, data))
+
+    def take(self, *names):
+        events = [(event, data) for event, data in self.events if event in names]
+        self.events = []
+        return events
+
+
+def play_round(engine, cash_out_sid, now):
+    finished = engine.last_finished_round
+    while engine.last_finished_round == finished:
+        engine.tick(now)
+        now += 0.05
+        if engine.phase == RUNNING and engine.multiplier >= 1.2:
+            engine.cash_out(cash_out_sid)
+    return now
+
+
+def compare_round(events, handles):
+    """Компактные события раунда против подробных: те же данные"""
+    compact_bets, compact_cash_outs, verbose_bets, verbose_cash_outs = [], [], [], []
+    multipliers, compact_multipliers = [], []
+    for event, data in events:
+        if event == wire.PLAYERS:
+            bets, cash_outs = decode_players(data, handles)
+            compact_bets += bets
+            compact_cash_outs += cash_outs
+        elif event == 'players_batch':
+            verbose_bets += [{'username': p['username'], 'bet': p['bet']} for p in data['bets']]
+            verbose_cash_outs += [
+                {'username': p['username'], 'bet': p['bet'],
+                 'multiplier': round(p['multiplier'], 2), 'winnings': p['winnings']}
+                for p in data['cashOuts']
+            ]
+        elif event == 'multiplier_update':
+            multipliers.append(round(data['multiplier'], 2))
+        elif event == wire.MULTIPLIER:
+            compact_multipliers.append(data / 100)
+        elif event == 'game_crash':
+            # Номера действуют до конца раунда (клиент очищает их на краше)
+            handles.clear()
+    assert compact_bets == verbose_bets
+    assert compact_cash_outs == verbose_cash_outs
+    assert multipliers
+    assert compact_multipliers == multipliers
+    return compact_bets, compact_cash_outs
+
+
+def test_engine_compact_events_match_verbose_ones():
+    recorder = Recorder()
+    engine = GameEngine(new_game_state(GameHistory()), recorder, cooldown_seconds=0)
+    engine.register('a', 'Вася')
+    engine.register('b', 'Петя')
+    handles = {}
+    now = time.monotonic()
+
+    rounds = []
+    for _ in range(2):
+        engine.place_bet('a', 10)
+        engine.place_bet('b', 20)
+        now = play_round(engine, 'a', now)
+        events = recorder.take('players_batch', wire.PLAYERS, 'multiplier_update', wire.MULTIPLIER, 'game_crash')
+        rounds.append((compare_round(events, handles), events))
+
+    for (bets, cash_outs), events in rounds:
+        # Имя - в каждом раунде заново, со ставкой
+        assert bets == [{'username': 'Вася', 'bet': 10}, {'username': 'Петя', 'bet': 20}]
+        assert [c['username'] for c in cash_outs] == ['Вася']
+    # Номер игрока за столом не меняется между раундами
+    handles_by_round = [
+        [data[0][0::3] for event, data in events if event == wire.PLAYERS and data[0]]
+        for _, events in rounds
+    ]
+    assert handles_by_round[0] == handles_by_round[1]
+    assert handles_by_round[0][0] == [engine.players.get('a').handle, engine.players.get('b').handle]
+
+
+def test_init_state_carries_handles_of_the_running_round():
+    recorder = Recorder()
+    engine = GameEngine(new_game_state(GameHistory()), recorder, cooldown_seconds=0)
+    engine.register('a', 'Вася')
+    engine.place_bet('a', 10)
+    now = time.monotonic()
+    while engine.phase != RUNNING:
+        engine.tick(now)
+        now += 0.05
+    recorder.take()
+
+    # Клиент подключился посреди раунда: имена ставок он уже не увидит в p
+    state = json.loads(engine.init_state())
+    handles = {p['handle']: (p['username'], p['bet']) for p in state['players']}
+    engine.cash_out('a')
+    engine.tick(now)
+    [(_, payload)] = recorder.take(wire.PLAYERS)
+    _, cash_outs = decode_players(payload, handles)
+    assert [(c['username'], c['bet']) for c in cash_outs] == [('Вася', 10)]
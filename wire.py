@@ -0,0 +1,89 @@
+"""
+NoLove Game - Компактная кодировка частых событий
+
+Кодировку клиент выбирает при подключении: ?wire=compact. Каждый клиент
+стола сидит в комнате стола и в комнате своей кодировки: <стол>/j или
+<стол>/c. События фаз, чат и прочее уходят в комнату стола одним emit,
+а частые события - в комнату кодировки:
+
+  подробные (/j)       компактные (/c)
+  multiplier_update    m - множитель в сотых: 342 или [342, serverTime]
+  players_batch        p - [ставки, выводы] плоскими массивами:
+  (player_bet,             ставка - handle, имя, сумма;
+   player_cashed_out)      вывод  - handle, множитель в сотых, выигрыш
+
+handle - номер игрока за столом (players.Player.handle). Имя приходит
+один раз за раунд, со ставкой (для идущего раунда - в init_state), дальше
+игрок упоминается только номером.
+
+Бинарные кадры Socket.IO здесь невыгодны: вложение идет отдельным кадром
+после текстового заголовка, и для события в несколько байт заголовок
+длиннее данных. Короткий JSON-массив помещается в один текстовый кадр.
+
+Сжатие websocket (permessage-deflate) согласуют eventlet, simple-websocket
+и uvicorn, если его предлагает браузер (браузеры предлагают всегда).
+"""
+COMPACT = 'compact'
+
+MULTIPLIER = 'm'
+PLAYERS = 'p'
+
+# Подробные события, у которых есть компактная замена, и сами замены
+VERBOSE_EVENTS = {'multiplier_update', 'players_batch', 'player_bet', 'player_cashed_out'}
+COMPACT_EVENTS = {MULTIPLIER, PLAYERS}
+
+
+def wants_compact(value):
+    return value == COMPACT
+
+
+def channel(room_id, compact):
+    """Комната кодировки стола"""
+    return f'{room_id}/c' if compact else f'{room_id}/j'
+
+
+def rooms_for(room_id, compact):
+    """Комнаты Socket.IO клиента за столом room_id"""
+    return (room_id, channel(room_id, compact))
+
+
+def room_for_event(room_id, event):
+    """Куда уходит широковещательное событие стола"""
+    if event in VERBOSE_EVENTS:
+        return channel(room_id, False)
+    if event in COMPACT_EVENTS:
+        return channel(room_id, True)
+    return room_id
+
+
+def hundredths(multiplier):
+    return int(round(multiplier * 100))
+
+
+def multiplier(value, server_time=None):
+    if server_time is None:
+        return hundredths(value)
+    return [hundredths(value), server_time]
+
+
+class CompactBatch:
+    """Пачка игроков за тик в компактном виде (см. broadcast.BroadcastBatcher)"""
+
+    def __init__(self):
+        self.bets = []
+        self.cash_outs = []
+
+    def __len__(self):
+        return len(self.bets) + len(self.cash_outs)
+
+    def player_bet(self, handle, username, bet):
+        self.bets.extend((handle, username, bet))
+
+    def player_cashed_out(self, handle, multiplier, winnings):
+        self.cash_outs.extend((handle, hundredths(multiplier), winnings))
+
+    def take(self):
+        """Данные события p; пачка после этого пуста"""
+        payload = [self.bets, self.cash_outs]
+        self.bets, self.cash_outs = [], []
+        return payload